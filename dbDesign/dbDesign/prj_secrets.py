@@ -3,3 +3,6 @@ from decouple import config, Csv
 SECRET_KEY = config('SECRET_KEY')
 DEBUG = config('DEBUG')
 ALLOWED_HOSTS = config('ALLOWED_HOSTS', cast=Csv())
+PROFILER_DIR = config('PROFILER_DIR', default='')
+PROFILER_SAMPLE_RATE = config('PROFILER_SAMPLE_RATE', default=0.0, cast=float)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
@@ -45,6 +45,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "dbexample.middleware.profiler_middleware",
     "dbexample.middleware.customer_middleware",
 ]
 
@@ -55,6 +56,30 @@ AUTH_USER_MODEL = "dbexample.User"
 
 CART_SESSION_ID = "cart"
 
+# Checkouts and cancels of not sharded stocks only reserve units
+# on the `Stock` row and append pending stock movements, amounts,
+# items sold and best sellers are updated by `compact_stock_ledger`.
+# Sharded stocks reserve units in their shards in both modes.
+STOCK_LEDGER_DEFERRED = False
+
+# Threads hashing passwords of async registrations and number of
+# registrations allowed to wait for them before 503 is returned.
+REGISTRATION_HASHING_WORKERS = 2
+REGISTRATION_HASHING_QUEUE = 8
+
+# Seconds resolved user roles are kept in sessions and in the cache.
+# With a per-process cache other processes see role changes after this.
+ROLES_CACHE_TTL = 60
+
+# Directory for cProfile dumps of requests, profiling is off if not set.
+# Staff profile a request with the `X-Profile` header or `?profile=1`,
+# a share of all requests is profiled with the sample rate (0 to 1).
+PROFILER_DIR = prj_secrets.PROFILER_DIR
+PROFILER_SAMPLE_RATE = prj_secrets.PROFILER_SAMPLE_RATE
+
+# Bearer token of Prometheus scrapers, without it only staff see metrics.
+METRICS_TOKEN = prj_secrets.METRICS_TOKEN
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
@@ -1,8 +1,162 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.core.exceptions import ValidationError
+
+from .models import (
+    CartItem,
+    Customer,
+    Order,
+    OrderItem,
+    Product,
+    ProductCategory,
+    ProductDiscount,
+    ProductVersion,
+    Stock,
+)
+from .paginators import EstimatedCountPaginator
 
-from .models import ProductCategory
 
 @admin.register(ProductCategory)
 class AdminProductCategory(admin.ModelAdmin):
-    pass
+    search_fields = ("name",)
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist without exact counts for tables with millions of rows."""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+@admin.register(Product)
+class AdminProduct(LargeTableAdmin):
+    list_display = ("name", "web_id", "brand", "p_type", "is_active")
+    list_select_related = ("brand", "p_type")
+    search_fields = ("name", "=web_id")
+    autocomplete_fields = ("categories",)
+    raw_id_fields = ("brand", "p_type")
+
+
+@admin.register(ProductDiscount)
+class AdminProductDiscount(admin.ModelAdmin):
+    list_display = ("label", "rate", "starts_at", "ends_at", "is_active")
+    search_fields = ("label",)
+
+
+@admin.register(Customer)
+class AdminCustomer(LargeTableAdmin):
+    list_display = ("username", "email", "status")
+    list_select_related = ("user",)
+    search_fields = ("user__username", "=user__email")
+    raw_id_fields = ("user",)
+
+
+@admin.register(ProductVersion)
+class AdminProductVersion(LargeTableAdmin):
+    list_display = (
+        "name",
+        "product",
+        "sku",
+        "regular_price",
+        "discount",
+        "is_active",
+        "favorites_count",
+    )
+    list_select_related = ("product", "discount")
+    list_filter = ("is_active",)
+    search_fields = ("name", "=sku")
+    autocomplete_fields = ("product", "discount")
+    raw_id_fields = ("favorited_by",)
+    readonly_fields = ("favorites_count",)
+    actions = ("activate", "deactivate")
+
+    @admin.action(description="Activate selected product versions")
+    def activate(self, request, queryset):
+        changed = queryset.set_active(True)
+        self.message_user(request, f"Activated {changed} product versions")
+
+    @admin.action(description="Deactivate selected product versions")
+    def deactivate(self, request, queryset):
+        changed = queryset.set_active(False)
+        self.message_user(request, f"Deactivated {changed} product versions")
+
+
+class RestockActionForm(ActionForm):
+    amount = forms.IntegerField(min_value=1, required=False)
+
+
+@admin.register(Stock)
+class AdminStock(LargeTableAdmin):
+    list_display = ("p_version", "amount", "items_sold", "shard_count")
+    list_select_related = ("p_version",)
+    search_fields = ("=p_version__sku",)
+    autocomplete_fields = ("p_version",)
+    action_form = RestockActionForm
+    actions = ("restock",)
+
+    @admin.action(description="Restock selected products by amount")
+    def restock(self, request, queryset):
+        try:
+            amount = forms.IntegerField(min_value=1).clean(
+                request.POST.get("amount")
+            )
+        except ValidationError:
+            self.message_user(
+                request, "Enter amount to restock", messages.ERROR
+            )
+            return
+        updated, failures = Stock.objects.bulk_adjust(
+            {
+                p_version_id: amount
+                for p_version_id in queryset.values_list(
+                    "p_version_id", flat=True
+                )
+            },
+            mode="add",
+        )
+        self.message_user(request, f"Restocked {updated} products")
+        for p_version_id, error in failures.items():
+            self.message_user(
+                request, f"Product {p_version_id}: {error}", messages.ERROR
+            )
+
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+    autocomplete_fields = ("p_version",)
+
+
+@admin.register(Order)
+class AdminOrder(LargeTableAdmin):
+    list_display = (
+        "id",
+        "customer",
+        "_status",
+        "discounted_sum",
+        "created_at",
+    )
+    list_select_related = ("customer__user",)
+    list_filter = ("_status",)
+    search_fields = ("=id",)
+    autocomplete_fields = ("customer",)
+    inlines = (OrderItemInline,)
+
+
+@admin.register(OrderItem)
+class AdminOrderItem(LargeTableAdmin):
+    list_display = ("name", "order", "p_version", "quantity", "is_canceled")
+    list_select_related = ("order", "p_version")
+    list_filter = ("is_canceled",)
+    search_fields = ("=sku",)
+    autocomplete_fields = ("order", "p_version")
+
 
+@admin.register(CartItem)
+class AdminCartItem(LargeTableAdmin):
+    list_display = ("p_version", "cart", "quantity")
+    list_select_related = ("cart", "p_version")
+    autocomplete_fields = ("p_version",)
+    raw_id_fields = ("cart",)
@@ -0,0 +1,99 @@
+import csv
+import json
+from itertools import groupby
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.query import QuerySet
+
+from .models import Order
+
+EXPORT_CHUNK_SIZE = 2000
+
+ORDER_FIELDS = (
+    "id",
+    "customer_id",
+    "created_at",
+    "_status",
+    "initial_sum",
+    "total_discount",
+    "discounted_sum",
+)
+ITEM_FIELDS = (
+    "id",
+    "p_version_id",
+    "name",
+    "sku",
+    "quantity",
+    "regular_price",
+    "discount",
+    "discounted_price",
+    "initial_sum",
+    "total_discount",
+    "discounted_sum",
+    "is_canceled",
+)
+CSV_HEADER = ORDER_FIELDS + tuple(f"item_{field}" for field in ITEM_FIELDS)
+
+
+class _Echo:
+    """File-like object returning the written line to the csv writer."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def order_rows(
+    orders: Optional[QuerySet] = None, chunk_size: int = EXPORT_CHUNK_SIZE
+) -> Iterator[Tuple]:
+    """Stream flat (order, item) tuples ordered by order and item id.
+    Orders without items are yielded once with empty item columns."""
+    if orders is None:
+        orders = Order.objects.all()
+    return (
+        orders.order_by("id", "items__id")
+        .values_list(
+            *ORDER_FIELDS, *(f"items__{field}" for field in ITEM_FIELDS)
+        )
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def csv_lines(rows: Iterator[Tuple]) -> Iterator[str]:
+    """CSV lines of flat order rows, header first.
+    Decimals are written with `str()` and keep every digit."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def jsonl_lines(rows: Iterator[Tuple]) -> Iterator[str]:
+    """JSON line per order with its items nested.
+    Decimals are written as strings to keep them exact."""
+    width = len(ORDER_FIELDS)
+    for order_values, group in groupby(rows, key=lambda row: row[:width]):
+        order = dict(zip(ORDER_FIELDS, order_values))
+        order["status"] = order.pop("_status")
+        order["items"] = [
+            dict(zip(ITEM_FIELDS, row[width:]))
+            for row in group
+            if row[width] is not None
+        ]
+        yield json.dumps(order, cls=DjangoJSONEncoder) + "\n"
+
+
+EXPORT_FORMATS: Dict[str, Tuple[Callable, str]] = {
+    "csv": (csv_lines, "text/csv"),
+    "jsonl": (jsonl_lines, "application/x-ndjson"),
+}
+
+
+def export_orders(
+    fmt: str,
+    orders: Optional[QuerySet] = None,
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+) -> Iterator[str]:
+    """Stream orders with their items in `fmt` (csv or jsonl)."""
+    lines, _ = EXPORT_FORMATS[fmt]
+    return lines(order_rows(orders, chunk_size))
@@ -0,0 +1,312 @@
+import csv
+import json
+import logging
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+from typing import IO, Any, Dict, Iterable, Iterator, List, Set, Tuple
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .models import (
+    Brand,
+    Product,
+    ProductCategoryCounter,
+    ProductType,
+    ProductVersion,
+    Stock,
+    Vendor,
+)
+from .utils import chunked
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 2000
+
+FEED_FIELDS = (
+    "vendor",
+    "brand",
+    "p_type",
+    "web_id",
+    "product",
+    "version",
+    "regular_price",
+)
+TRUE_VALUES = ("1", "true", "yes")
+
+
+def read_feed(feed: IO[str], fmt: str) -> Iterator[Dict[str, Any]]:
+    """Stream feed rows as dicts from a CSV or JSON Lines file."""
+    if fmt == "csv":
+        yield from csv.DictReader(feed)
+    elif fmt == "jsonl":
+        for line in feed:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        raise ValueError(f"Unknown feed format: {fmt}")
+
+
+def clean_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Return a normalized feed row.
+    Raise ValueError if required values are missing or malformed."""
+    values = {
+        field: str(row.get(field) or "").strip() for field in FEED_FIELDS
+    }
+    if missing := [field for field, value in values.items() if not value]:
+        raise ValueError(f"missing values: {', '.join(missing)}")
+    try:
+        values["regular_price"] = Decimal(values["regular_price"])
+        amount = int(row.get("amount") or 0)
+    except (InvalidOperation, TypeError, ValueError) as e:
+        raise ValueError(f"malformed number: {e}")
+    if values["regular_price"] <= 0 or amount < 0:
+        raise ValueError("price must be positive and amount not negative")
+    attrs = row.get("attrs") or {}
+    if isinstance(attrs, str):
+        attrs = json.loads(attrs)
+    is_active = row.get("is_active", False)
+    if isinstance(is_active, str):
+        is_active = is_active.strip().lower() in TRUE_VALUES
+    values.update(
+        description=row.get("description") or "",
+        attrs=attrs,
+        made_in=row.get("made_in") or "",
+        is_active=bool(is_active),
+        amount=amount,
+        unit=row.get("unit") or "pcs",
+    )
+    return values
+
+
+class CatalogImporter:
+    """Upsert a supplier feed into
+    Vendor -> Brand -> ProductType -> Product -> ProductVersion -> Stock.
+
+    Rows are matched by natural keys: vendor, brand and product type names,
+    product `web_id` and version name within the product. Every batch is
+    written with one `bulk_create(update_conflicts=True)` per model,
+    stock amounts are set with `Stock.objects.bulk_adjust`.
+    Ids of vendors, brands and product types are cached for the whole
+    import, ids of products and versions only for the current batch.
+    A product is active if any of its versions in the whole feed is."""
+
+    def __init__(self, batch_size: int = IMPORT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.stats = Counter(
+            inserted=0, updated=0, skipped=0, stock_rejected=0
+        )
+        self._ids: Dict[type, Dict[str, int]] = {
+            Vendor: {},
+            Brand: {},
+            ProductType: {},
+        }
+        self._active_products: Set[str] = set()
+
+    def run(self, rows: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+        """Import all rows, then recount category counters.
+        Return numbers of inserted, updated and skipped versions
+        and of versions whose stock amount was rejected."""
+        for batch in chunked(rows, self.batch_size):
+            self.import_batch(batch)
+        ProductCategoryCounter.objects.refresh()
+        return dict(self.stats)
+
+    def import_batch(self, batch: List[Dict[str, Any]]) -> None:
+        rows = {}
+        for row in batch:
+            try:
+                row = clean_row(row)
+            except (ValueError, TypeError) as e:
+                logger.error(f"Skipped feed row {row}: {e}")
+                self.stats["skipped"] += 1
+                continue
+            key = (row["web_id"], row["version"])
+            if key in rows:
+                self.stats["skipped"] += 1
+            rows[key] = row
+        if not rows:
+            return
+        rows = list(rows.values())
+        with transaction.atomic():
+            self._upsert_names(Vendor, {row["vendor"] for row in rows})
+            self._upsert_names(
+                Brand,
+                {row["brand"] for row in rows},
+                vendors={row["brand"]: row["vendor"] for row in rows},
+            )
+            self._upsert_names(ProductType, {row["p_type"] for row in rows})
+            products = self._upsert_products(rows)
+            versions = self._upsert_versions(rows, products)
+            ProductVersion.objects.filter(
+                id__in=versions.values(), sku=""
+            ).assign_skus()
+            self._upsert_stock(rows, versions)
+
+    def _upsert_names(
+        self,
+        model: type,
+        names: Iterable[str],
+        vendors: Dict[str, str] = None,
+    ) -> None:
+        """Create missing objects identified by unique name
+        and cache their ids. Brands also get their vendor updated."""
+        ids = self._ids[model]
+        names = set(names) if vendors else set(names) - ids.keys()
+        if not names:
+            return
+        objs = []
+        for name in names:
+            obj = model(name=name, slug=slugify(name))
+            if model is not Vendor:
+                obj.logo = ""
+            if vendors:
+                obj.vendor_id = self._ids[Vendor][vendors[name]]
+            objs.append(obj)
+        if vendors:
+            model.objects.bulk_create(
+                objs,
+                update_conflicts=True,
+                unique_fields=["name"],
+                update_fields=["vendor"],
+            )
+        else:
+            model.objects.bulk_create(objs, ignore_conflicts=True)
+        ids.update(
+            model.objects.filter(name__in=names).values_list("name", "id")
+        )
+
+    def _upsert_products(
+        self, rows: List[Dict[str, Any]]
+    ) -> Dict[str, Tuple[int, str]]:
+        """Upsert products by `web_id`.
+        Return id and name of products by `web_id`."""
+        now = timezone.now()
+        self._active_products.update(
+            row["web_id"] for row in rows if row["is_active"]
+        )
+        products = {}
+        for row in rows:
+            products[row["web_id"]] = Product(
+                web_id=row["web_id"],
+                name=row["product"],
+                slug=slugify(row["product"]),
+                description=row["description"],
+                brand_id=self._ids[Brand][row["brand"]],
+                p_type_id=self._ids[ProductType][row["p_type"]],
+                is_active=row["web_id"] in self._active_products,
+                created_at=now,
+                updated_at=now,
+            )
+        Product.objects.bulk_create(
+            products.values(),
+            update_conflicts=True,
+            unique_fields=["web_id"],
+            update_fields=[
+                "name",
+                "slug",
+                "description",
+                "brand",
+                "p_type",
+                "is_active",
+                "updated_at",
+            ],
+        )
+        return {
+            web_id: (pk, name)
+            for web_id, pk, name in Product.objects.filter(
+                web_id__in=products.keys()
+            ).values_list("web_id", "id", "name")
+        }
+
+    def _upsert_versions(
+        self,
+        rows: List[Dict[str, Any]],
+        products: Dict[str, Tuple[int, str]],
+    ) -> Dict[Tuple[int, str], int]:
+        """Upsert versions by product and full version name,
+        counting inserted and updated ones.
+        Return version ids by (product id, name)."""
+        now = timezone.now()
+        versions = {}
+        for row in rows:
+            product_id, product_name = products[row["web_id"]]
+            name = product_name + " " + row["version"]
+            row["p_version_key"] = (product_id, name)
+            versions[(product_id, name)] = ProductVersion(
+                product_id=product_id,
+                name=name,
+                attrs=row["attrs"],
+                regular_price=row["regular_price"],
+                made_in=row["made_in"],
+                is_active=row["is_active"],
+                created_at=now,
+                updated_at=now,
+            )
+        existing = self._version_ids(versions.keys())
+        self.stats["updated"] += len(existing)
+        self.stats["inserted"] += len(versions) - len(existing)
+        ProductVersion.objects.bulk_create(
+            versions.values(),
+            update_conflicts=True,
+            unique_fields=["product", "name"],
+            update_fields=[
+                "attrs",
+                "regular_price",
+                "made_in",
+                "is_active",
+                "updated_at",
+            ],
+        )
+        return self._version_ids(versions.keys())
+
+    def _version_ids(
+        self, keys: Iterable[Tuple[int, str]]
+    ) -> Dict[Tuple[int, str], int]:
+        keys = set(keys)
+        return {
+            (product_id, name): pk
+            for pk, product_id, name in ProductVersion.objects.filter(
+                product_id__in={product_id for product_id, _ in keys},
+                name__in={name for _, name in keys},
+            ).values_list("id", "product_id", "name")
+            if (product_id, name) in keys
+        }
+
+    def _upsert_stock(
+        self,
+        rows: List[Dict[str, Any]],
+        versions: Dict[Tuple[int, str], int],
+    ) -> None:
+        """Create missing stocks, update units
+        and set amounts from the feed as stock adjustments."""
+        now = timezone.now()
+        units = {versions[row["p_version_key"]]: row["unit"] for row in rows}
+        Stock.objects.bulk_create(
+            [
+                Stock(
+                    p_version_id=p_version_id,
+                    unit=unit,
+                    created_at=now,
+                    updated_at=now,
+                )
+                for p_version_id, unit in units.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["p_version"],
+            update_fields=["unit", "updated_at"],
+        )
+        # failed amounts are logged by bulk_adjust and counted here
+        _, rejected = Stock.objects.bulk_adjust(
+            {versions[row["p_version_key"]]: row["amount"] for row in rows},
+            mode="set",
+        )
+        self.stats["stock_rejected"] += len(rejected)
+
+
+def import_catalog(
+    rows: Iterable[Dict[str, Any]], batch_size: int = IMPORT_BATCH_SIZE
+) -> Dict[str, int]:
+    """Import feed rows, see `CatalogImporter`."""
+    return CatalogImporter(batch_size).run(rows)
@@ -0,0 +1,41 @@
+import time
+from typing import Any, Optional
+
+from dbexample.paginators import analyze
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Refresh table statistics used for estimated row counts, "
+        "once or repeatedly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "models",
+            nargs="*",
+            help="Models to analyze as app_label.ModelName, all by default.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Repeat every this many seconds until interrupted.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        tables = [
+            apps.get_model(label)._meta.db_table for label in options["models"]
+        ]
+        while True:
+            started = time.monotonic()
+            analyze(tables)
+            self.stdout.write(
+                f"Analyzed {', '.join(tables) or 'all tables'} "
+                f"in {time.monotonic() - started:.2f}s"
+            )
+            if options["interval"] <= 0:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,36 @@
+import datetime as dt
+from typing import Any, Optional
+
+from dbexample.models import ARCHIVE_CHUNK_SIZE, ArchivedOrder, DailySales
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        "Move finished and canceled orders older than a cutoff "
+        "with their items to archive tables."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=180,
+            help="Archive orders created more than this many days ago.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=ARCHIVE_CHUNK_SIZE,
+            help="Number of orders moved by one transaction.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        # archived orders must already be reflected in sales rollups
+        DailySales.objects.roll_up()
+        cutoff = timezone.now() - dt.timedelta(days=options["days"])
+        orders, items = ArchivedOrder.objects.archive(
+            cutoff, chunk_size=options["chunk_size"]
+        )
+        self.stdout.write(f"Archived {orders} orders and {items} order items")
@@ -0,0 +1,27 @@
+from typing import Any, Optional
+
+from dbexample.models import SKU_CHUNK_SIZE, ProductVersion
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Generate sku for every product version with an empty sku."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=SKU_CHUNK_SIZE,
+            help="Number of product versions updated by one statement.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        assigned, collisions = ProductVersion.objects.assign_skus(
+            chunk_size=options["chunk_size"]
+        )
+        self.stdout.write(f"Assigned sku to {assigned} product versions")
+        if collisions:
+            self.stderr.write(
+                f"Skipped {len(collisions)} product versions "
+                f"with colliding sku: {collisions}"
+            )
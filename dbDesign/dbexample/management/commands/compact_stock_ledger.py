@@ -0,0 +1,22 @@
+from typing import Any, Optional
+
+from dbexample.models import STOCK_CHUNK_SIZE, StockMovement
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Fold stock movements not compacted yet into Stock snapshots."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=STOCK_CHUNK_SIZE,
+            help="Number of stock rows updated by one statement.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        folded = StockMovement.objects.compact(
+            chunk_size=options["chunk_size"]
+        )
+        self.stdout.write(f"Compacted {folded} stock movements")
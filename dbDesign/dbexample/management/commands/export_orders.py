@@ -0,0 +1,48 @@
+import time
+from typing import Any, Optional
+
+from dbexample.exports import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, export_orders
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Stream orders with their items to a CSV or JSON Lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format",
+            choices=sorted(EXPORT_FORMATS),
+            default="csv",
+        )
+        parser.add_argument(
+            "--output",
+            help="File to write, standard output by default.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=EXPORT_CHUNK_SIZE,
+            help="Number of rows fetched from the database at once.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        lines = export_orders(
+            options["format"], chunk_size=options["chunk_size"]
+        )
+        started = time.perf_counter()
+        written = 0
+        if options["output"]:
+            with open(options["output"], "w", newline="") as output:
+                for line in lines:
+                    output.write(line)
+                    written += 1
+        else:
+            for line in lines:
+                self.stdout.write(line, ending="")
+                written += 1
+        elapsed = time.perf_counter() - started
+        rate = written / elapsed if elapsed else 0
+        self.stderr.write(
+            f"Exported {written} lines in {elapsed:.2f}s "
+            f"({rate:.0f} lines/s)"
+        )
@@ -0,0 +1,41 @@
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+from dbexample.imports import IMPORT_BATCH_SIZE, import_catalog, read_feed
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Upsert a supplier catalog feed (CSV or JSON Lines)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=Path)
+        parser.add_argument(
+            "--format",
+            choices=("csv", "jsonl"),
+            help="Feed format, guessed from the file suffix by default.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=IMPORT_BATCH_SIZE,
+            help="Number of feed rows written by one set of statements.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        path = options["path"]
+        fmt = options["format"] or path.suffix.lstrip(".").lower()
+        if fmt not in ("csv", "jsonl"):
+            raise CommandError(f"Unknown feed format: {fmt}")
+        started = time.perf_counter()
+        with path.open(newline="") as feed:
+            stats = import_catalog(
+                read_feed(feed, fmt), batch_size=options["batch_size"]
+            )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Inserted {stats['inserted']}, updated {stats['updated']}, "
+            f"skipped {stats['skipped']} rows in {elapsed:.2f}s, "
+            f"rejected {stats['stock_rejected']} stock amounts"
+        )
@@ -0,0 +1,33 @@
+from typing import Any, Optional
+
+from dbexample.models import Stock, StockShard
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Collapse counter shards of hot stocks into their stock rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "p_version_ids",
+            nargs="*",
+            type=int,
+            help="Product versions to merge, all sharded stocks by default.",
+        )
+        parser.add_argument(
+            "--disable",
+            action="store_true",
+            help="Turn sharding off for merged stocks.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        stocks = Stock.objects.filter(shard_count__gt=0)
+        if options["p_version_ids"]:
+            stocks = stocks.filter(p_version_id__in=options["p_version_ids"])
+        if options["disable"]:
+            for stock in stocks:
+                stock.set_shard_count(0)
+            self.stdout.write("Merged and disabled counter shards")
+            return
+        merged = StockShard.objects.merge(stocks.values_list("id", flat=True))
+        self.stdout.write(f"Merged counter shards of {merged} stocks")
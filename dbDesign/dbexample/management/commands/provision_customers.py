@@ -0,0 +1,59 @@
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+from dbexample.imports import read_feed
+from dbexample.provisioning import PROVISION_CHUNK_SIZE, provision_customers
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Create users with customers and carts from a CSV or JSON Lines "
+        "account list (username, email, password, first_name, last_name, "
+        "phone_number)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=Path)
+        parser.add_argument(
+            "--format",
+            choices=("csv", "jsonl"),
+            help="List format, guessed from the file suffix by default.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="Password hashing processes, all cores by default.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=PROVISION_CHUNK_SIZE,
+            help="Number of accounts inserted by one transaction.",
+        )
+        parser.add_argument(
+            "--activate",
+            action="store_true",
+            help="Create active users with activated customers.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        path = options["path"]
+        fmt = options["format"] or path.suffix.lstrip(".").lower()
+        if fmt not in ("csv", "jsonl"):
+            raise CommandError(f"Unknown account list format: {fmt}")
+        started = time.perf_counter()
+        with path.open(newline="") as accounts:
+            stats = provision_customers(
+                read_feed(accounts, fmt),
+                workers=options["workers"],
+                chunk_size=options["chunk_size"],
+                activate=options["activate"],
+            )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Created {stats['created']} accounts, "
+            f"{stats['conflicts']} conflicts, {stats['skipped']} skipped "
+            f"in {elapsed:.2f}s"
+        )
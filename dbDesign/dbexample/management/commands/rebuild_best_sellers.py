@@ -0,0 +1,21 @@
+from typing import Any, Optional
+
+from dbexample.models import BestSeller
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+
+class Command(BaseCommand):
+    help = "Recompute best seller boards from Stock.items_sold."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scope",
+            choices=BestSeller.Scope.values,
+            help="Rebuild boards of this scope only.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        with transaction.atomic():
+            created = BestSeller.objects.rebuild(options["scope"])
+        self.stdout.write(f"Created {created} best seller entries")
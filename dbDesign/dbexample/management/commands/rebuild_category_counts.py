@@ -0,0 +1,14 @@
+from typing import Any, Optional
+
+from dbexample.models import ProductCategoryCounter
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+
+class Command(BaseCommand):
+    help = "Recount active products and versions for every product category."
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        with transaction.atomic():
+            refreshed = ProductCategoryCounter.objects.refresh()
+        self.stdout.write(f"Refreshed {refreshed} category counters")
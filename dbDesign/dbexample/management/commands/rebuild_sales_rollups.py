@@ -0,0 +1,73 @@
+import datetime as dt
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from dbexample.models import DailyCategorySales, DailySales
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+Rows = Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]
+
+
+def compute_span(span: Tuple[dt.date, dt.date]) -> Rows:
+    """Aggregate rolled up items of live and archived orders
+    of dates within `span`."""
+    return DailySales.objects.compute_rolled_up(*span)
+
+
+def split_range(
+    start: dt.date, end: dt.date, parts: int
+) -> List[Tuple[dt.date, dt.date]]:
+    """Split dates from `start` to `end` into `parts` contiguous spans."""
+    days = (end - start).days + 1
+    step = -(-days // parts)
+    return [
+        (
+            start + dt.timedelta(days=offset),
+            min(start + dt.timedelta(days=offset + step - 1), end),
+        )
+        for offset in range(0, days, step)
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute sales rollups of a date range. "
+        "Worker processes aggregate, the command writes the results."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("start", type=dt.date.fromisoformat)
+        parser.add_argument("end", type=dt.date.fromisoformat)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of worker processes.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        start, end = options["start"], options["end"]
+        if start > end:
+            raise CommandError("start date must not be after end date")
+        spans = split_range(start, end, max(options["workers"], 1))
+        if len(spans) == 1:
+            results = [compute_span(spans[0])]
+        else:
+            # forked workers must not share the parent's connections
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=len(spans),
+                mp_context=multiprocessing.get_context("fork"),
+            ) as executor:
+                results = list(executor.map(compute_span, spans))
+        versions = [row for rows, _ in results for row in rows]
+        categories = [row for _, rows in results for row in rows]
+        with transaction.atomic():
+            DailySales.objects.replace(start, end, versions)
+            DailyCategorySales.objects.replace(start, end, categories)
+        self.stdout.write(
+            f"Rebuilt {len(versions)} daily sales "
+            f"and {len(categories)} daily category sales rows"
+        )
@@ -0,0 +1,27 @@
+from typing import Any, Optional
+
+from dbexample.models import DiscountCampaign
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply discount campaigns which have started and remove "
+        "those which have ended. Meant to be run periodically."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only count product versions that would be updated.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        assigned, released = DiscountCampaign.objects.run_due(
+            dry_run=options["dry_run"]
+        )
+        self.stdout.write(
+            f"Discount assigned to {assigned} product versions, "
+            f"removed from {released} product versions"
+        )
@@ -0,0 +1,35 @@
+import urllib.request
+from typing import Any, Optional
+
+from dbexample.metrics import REGISTRY
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Print metrics in Prometheus text format, "
+        "of this process or fetched from a running server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url",
+            help="Metrics endpoint of a running server, e.g. "
+            "http://localhost:8000/metrics/",
+        )
+        parser.add_argument(
+            "--token", default="", help="Bearer token of the endpoint."
+        )
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        if not options["url"]:
+            self.stdout.write(REGISTRY.render(), ending="")
+            return
+        request = urllib.request.Request(options["url"])
+        if options["token"]:
+            request.add_header("Authorization", f"Bearer {options['token']}")
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                self.stdout.write(response.read().decode(), ending="")
+        except OSError as e:
+            raise CommandError(f"Cannot fetch metrics: {e}")
@@ -0,0 +1,30 @@
+import datetime as dt
+from typing import Any, Optional
+
+from dbexample.models import CART_SWEEP_BATCH_SIZE, Cart
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Clear items of carts abandoned for longer than a TTL."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=float,
+            default=30,
+            help="Carts not updated for this many days are cleared.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=CART_SWEEP_BATCH_SIZE,
+            help="Number of carts cleared by one transaction.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        carts, items = Cart.sweep_abandoned(
+            dt.timedelta(days=options["days"]),
+            batch_size=options["batch_size"],
+        )
+        self.stdout.write(f"Cleared {carts} carts and {items} cart items")
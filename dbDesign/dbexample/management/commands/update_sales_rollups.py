@@ -0,0 +1,14 @@
+from typing import Any, Optional
+
+from dbexample.models import DailySales
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Add orders placed and items canceled since last run to rollups."
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        orders, canceled = DailySales.objects.roll_up()
+        self.stdout.write(
+            f"Rolled up {orders} orders and {canceled} canceled items"
+        )
@@ -0,0 +1,275 @@
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Upper bounds of histogram buckets, the last bucket is +Inf.
+DURATION_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    )
+
+
+def _format_labels(pairs: Sequence[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    return "{%s}" % ",".join(f'{k}="{_escape(str(v))}"' for k, v in pairs)
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class CounterChild:
+    """Single series of a counter."""
+
+    __slots__ = ("_lock", "value")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class HistogramChild:
+    """Single series of a histogram with bucket counts
+    allocated once, so observing a value allocates nothing."""
+
+    __slots__ = ("_lock", "_buckets", "counts", "sum")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self._lock = threading.Lock()
+        self._buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self._buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+class Metric:
+    """Named metric with series identified by label values.
+    Resolve series with `labels` once and keep them for hot paths."""
+
+    kind = ""
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        if len(values) != len(self.labelnames):
+            raise ValueError(
+                f"{self.name} expects labels {self.labelnames}, got {values}"
+            )
+        try:
+            return self._children[values]
+        except KeyError:
+            with self._lock:
+                return self._children.setdefault(values, self._new_child())
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _series(self) -> List[Tuple[Tuple[Tuple[str, str], ...], object]]:
+        with self._lock:
+            children = list(self._children.items())
+        return [
+            (tuple(zip(self.labelnames, values)), child)
+            for values, child in sorted(children)
+        ]
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(
+            f"{name}{labels} {_format_value(value)}"
+            for name, labels, value in self.samples()
+        )
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_child(self) -> CounterChild:
+        return CounterChild()
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        for pairs, child in self._series():
+            yield self.name, _format_labels(pairs), child.value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DURATION_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> HistogramChild:
+        return HistogramChild(self.buckets)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+        for pairs, child in self._series():
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                yield (
+                    f"{self.name}_bucket",
+                    _format_labels(pairs + (("le", bound),)),
+                    cumulative,
+                )
+            yield f"{self.name}_sum", _format_labels(pairs), total
+            yield f"{self.name}_count", _format_labels(pairs), cumulative
+
+
+class Registry:
+    """Metrics of the current process.
+    Every worker process of a server keeps its own registry."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self) -> str:
+        """Return all metrics in Prometheus text format."""
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        return "".join(metric.render() + "\n" for _, metric in metrics)
+
+
+REGISTRY = Registry()
+
+OPERATION_CALLS = REGISTRY.counter(
+    "dbexample_operation_calls_total",
+    "Calls of domain operations by outcome: success or error type.",
+    ("operation", "outcome"),
+)
+OPERATION_DURATION = REGISTRY.histogram(
+    "dbexample_operation_duration_seconds",
+    "Duration of domain operations.",
+    ("operation",),
+    DURATION_BUCKETS,
+)
+OPERATION_QUERIES = REGISTRY.histogram(
+    "dbexample_operation_queries",
+    "Database queries run by domain operations.",
+    ("operation",),
+    QUERY_BUCKETS,
+)
+
+
+def _count_query(execute, sql, params, many, context):
+    context["connection"].queries_counted += 1
+    return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_counter(sender, connection, **kwargs):
+    """Count queries of every connection with one permanent wrapper
+    instead of a wrapper per instrumented call.
+    The wrapper goes to the bottom of the stack: a connection may be
+    opened inside `execute_wrapper()` blocks which pop their own
+    wrappers from the top."""
+    if _count_query not in connection.execute_wrappers:
+        connection.queries_counted = 0
+        connection.execute_wrappers.insert(0, _count_query)
+
+
+def instrument(operation: str) -> Callable:
+    """Record calls, duration and queries of the default database
+    of a function as `operation`. Series are resolved once here."""
+    success = OPERATION_CALLS.labels(operation, "success")
+    duration = OPERATION_DURATION.labels(operation)
+    queries = OPERATION_QUERIES.labels(operation)
+
+    def decorator(f: Callable) -> Callable:
+        @wraps(f)
+        def instrumented(*args, **kwargs):
+            connection = connections[DEFAULT_DB_ALIAS]
+            queries_before = getattr(connection, "queries_counted", 0)
+            started = time.perf_counter()
+            try:
+                result = f(*args, **kwargs)
+            except Exception as e:
+                OPERATION_CALLS.labels(operation, type(e).__name__).inc()
+                raise
+            finally:
+                duration.observe(time.perf_counter() - started)
+                queries.observe(
+                    getattr(connection, "queries_counted", 0)
+                    - queries_before
+                )
+            success.inc()
+            return result
+
+        return instrumented
+
+    return decorator
@@ -1,20 +1,174 @@
+import cProfile
+import random
+import re
+import time
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+from django.utils.decorators import sync_and_async_middleware
+from django.utils.functional import SimpleLazyObject
+
 from .models import Customer
+from .roles import get_roles
+
+
+def _attach_customer(request) -> None:
+    """Customer and roles are loaded on first access,
+    requests that do not use them run no queries for them."""
+    user = request.user
+
+    # if user.is_anonymous:
+    #    customer = None
+    # else:
+    #    customer, _ = Customer.objects.get_or_create(user=user)
+    request.customer = None
+    request.roles = None
+    if user.is_authenticated:
+        request.customer = SimpleLazyObject(
+            lambda: Customer.objects.filter(user_id=user.id).first()
+        )
+        request.roles = SimpleLazyObject(
+            lambda: get_roles(user.id, request.session)
+        )
 
 
+@sync_and_async_middleware
 def customer_middleware(get_response):
-    def middleware(request):
-        customer = None
-        user = request.user
-
-        # if user.is_anonymous:
-        #    customer = None
-        # else:
-        #    customer, _ = Customer.objects.get_or_create(user=user)
-        if qs := Customer.objects.filter(user_id=user.id):
-            customer = qs[0]
-        request.customer = customer
-        response = get_response(request)
-
-        return response
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            await sync_to_async(_attach_customer)(request)
+            return await get_response(request)
+
+    else:
+
+        def middleware(request):
+            _attach_customer(request)
+            response = get_response(request)
+
+            return response
+
+    return middleware
+
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_PARAM = "profile"
+
+
+def _profile_requested(request, sample_rate: float) -> bool:
+    """Staff ask for a profile with a header or a query parameter,
+    other requests are sampled."""
+    if request.user.is_staff and (
+        request.headers.get(PROFILE_HEADER) or PROFILE_PARAM in request.GET
+    ):
+        return True
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+def _profile_name(request, queries: int, duration: float) -> str:
+    path = re.sub(r"[^\w.-]+", "_", request.path.strip("/")) or "root"
+    return (
+        f"{timezone.now():%Y%m%dT%H%M%S.%f}_{request.method}_{path}"
+        f"_{queries}q_{duration * 1000:.0f}ms.prof"
+    )
+
+
+@contextmanager
+def _profiled(request, directory: Path):
+    """Profile the block and dump stats into `directory`."""
+    queries = 0
+
+    def count_query(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    profiler = cProfile.Profile()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(count_query))
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            duration = time.perf_counter() - started
+            profiler.dump_stats(
+                directory / _profile_name(request, queries, duration)
+            )
+
+
+class _ProfiledStream:
+    """Streaming content that stops profiling when it is closed."""
+
+    def __init__(self, content, stack: ExitStack):
+        self._content = content
+        self._stack = stack
+
+    def __iter__(self):
+        yield from self._content
+
+    def close(self):
+        self._stack.close()
+
+
+class _ProfiledAsyncStream(_ProfiledStream):
+    async def __aiter__(self):
+        async for chunk in self._content:
+            yield chunk
+
+
+def _profile_until_sent(response, stack: ExitStack):
+    """Keep profiling a streaming response until its content is closed,
+    after it was sent to the client."""
+    if response.streaming:
+        stream = _ProfiledAsyncStream if response.is_async else _ProfiledStream
+        response.streaming_content = stream(
+            response.streaming_content, stack.pop_all()
+        )
+    return response
+
+
+@sync_and_async_middleware
+def profiler_middleware(get_response):
+    """Profile requests with cProfile and dump stats into `PROFILER_DIR`
+    named by the request path, query count and duration.
+    Streaming responses are profiled until their content is sent.
+    Async requests are profiled on the event loop thread only,
+    code run by `sync_to_async` counts in duration and queries.
+    Removed from the middleware chain if `PROFILER_DIR` is not set."""
+    if not settings.PROFILER_DIR:
+        raise MiddlewareNotUsed
+    directory = Path(settings.PROFILER_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    sample_rate = settings.PROFILER_SAMPLE_RATE
+
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            if not await sync_to_async(_profile_requested)(
+                request, sample_rate
+            ):
+                return await get_response(request)
+            with ExitStack() as stack:
+                stack.enter_context(_profiled(request, directory))
+                response = await get_response(request)
+                return _profile_until_sent(response, stack)
+
+    else:
+
+        def middleware(request):
+            if not _profile_requested(request, sample_rate):
+                return get_response(request)
+            with ExitStack() as stack:
+                stack.enter_context(_profiled(request, directory))
+                response = get_response(request)
+                return _profile_until_sent(response, stack)
 
     return middleware
@@ -1,15 +1,44 @@
 import datetime as dt
 import logging
+import random
+from contextlib import contextmanager
 from decimal import Decimal
-from typing import Any, Dict, Literal, Mapping, Tuple
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    Mapping,
+    Optional,
+    Tuple,
+    Type,
+)
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import IntegrityError, models
-from django.db.models import F, Sum
+from django.db import IntegrityError, models, transaction
+from django.db.models import (
+    Case,
+    Count,
+    Exists,
+    F,
+    Max,
+    OuterRef,
+    Prefetch,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    When,
+    Window,
+)
+from django.db.models.functions import Coalesce, Mod, RowNumber, TruncDate
 from django.db.models.query import QuerySet
 from django.http.request import HttpRequest
 from django.shortcuts import reverse
@@ -18,9 +47,20 @@ from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _
 
 from .exceptions import EmptyQuerySet, NotEnoughProductLeft, TooBigToAdd
-from .utils import decimalize
+from .metrics import instrument
+from .paginators import estimated_count
+from .utils import chunked, decimalize
 
 MAX_AMOUNT_ADDED = 10000
+SKU_CHUNK_SIZE = 2000
+VERSION_CHUNK_SIZE = 1000
+STOCK_CHUNK_SIZE = 500
+BEST_SELLERS_TOP_N = 10
+ORDER_HISTORY_PAGE_SIZE = 20
+ROLLUP_CHUNK_SIZE = 500
+ARCHIVE_CHUNK_SIZE = 500
+CART_SWEEP_BATCH_SIZE = 500
+SALES_TOTALS = ("quantity", "initial_sum", "total_discount", "discounted_sum")
 
 decimal_price_settings = {
     "max_digits": 9,
@@ -92,12 +132,42 @@ class UserRoleManager(models.Manager):
         """Fetch user data when querying for Role object."""
         return super().get_queryset().select_related("user")
 
+    def bulk_update_profiles(
+        self, changes: Mapping[int, Mapping[str, Any]]
+    ) -> int:
+        """Apply profile changes to users of many roles.
+        `changes` maps role ids to dicts of changed profile fields.
+        Roles changing the same set of fields are updated by one statement.
+        Return number of updated users."""
+        ProxyUserRole.check_profile_fields(
+            field for fields in changes.values() for field in fields
+        )
+        user_ids = dict(
+            self.filter(pk__in=changes.keys()).values_list("pk", "user_id")
+        )
+        groups: Dict[Tuple[str, ...], list] = {}
+        for pk, fields in changes.items():
+            if pk in user_ids and fields:
+                groups.setdefault(tuple(sorted(fields)), []).append(
+                    get_user_model()(id=user_ids[pk], **fields)
+                )
+        updated = 0
+        with transaction.atomic():
+            for fields, users in groups.items():
+                updated += get_user_model().objects.bulk_update(
+                    users, fields
+                )
+        return updated
+
 
 class ProxyUserRole(models.Model):
     """Abstract class for implementing user roles,
     e.g. customer, moderator, admin, etc."""
 
+    PROFILE_FIELDS = ("email", "first_name", "last_name")
+
     user = None
+    _pending_user_fields = None
 
     objects = UserRoleManager()
 
@@ -107,6 +177,43 @@ class ProxyUserRole(models.Model):
     def __str__(self) -> str:
         return self.username
 
+    @classmethod
+    def check_profile_fields(cls, fields: Iterable[str]) -> None:
+        if unknown := set(fields) - set(cls.PROFILE_FIELDS):
+            msg = f"Unknown profile fields: {', '.join(sorted(unknown))}"
+            logger.error(msg)
+            raise ValueError(msg)
+
+    @contextmanager
+    def batch_profile_updates(self) -> Iterator["ProxyUserRole"]:
+        """Collect writes of profile setters
+        and save them with one update when the block exits.
+        Nothing is saved if the block raises."""
+        if self._pending_user_fields is not None:
+            yield self
+            return
+        self._pending_user_fields = set()
+        try:
+            yield self
+            if self._pending_user_fields:
+                self.user.save(update_fields=self._pending_user_fields)
+        finally:
+            self._pending_user_fields = None
+
+    def update_profile(self, **fields: Any) -> None:
+        """Set many profile fields with one update."""
+        self.check_profile_fields(fields)
+        with self.batch_profile_updates():
+            for field, value in fields.items():
+                setattr(self, field, value)
+
+    def _save_user_field(self, field: str) -> None:
+        """Save a user field now or on exit of a batch of updates."""
+        if self._pending_user_fields is None:
+            self.user.save(update_fields=(field,))
+        else:
+            self._pending_user_fields.add(field)
+
     @property
     def username(self) -> str:
         return self.user.get_username()
@@ -118,7 +225,7 @@ class ProxyUserRole(models.Model):
     @email.setter
     def email(self, new_email: str) -> None:
         self.user.email = new_email
-        self.user.save(update_fields=("email",))
+        self._save_user_field("email")
 
     @property
     def first_name(self) -> str:
@@ -127,7 +234,7 @@ class ProxyUserRole(models.Model):
     @first_name.setter
     def first_name(self, new_first_name: str) -> None:
         self.user.first_name = new_first_name
-        self.user.save(update_fields=("first_name",))
+        self._save_user_field("first_name")
 
     @property
     def last_name(self) -> str:
@@ -136,7 +243,7 @@ class ProxyUserRole(models.Model):
     @last_name.setter
     def last_name(self, new_last_name: str) -> None:
         self.user.last_name = new_last_name
-        self.user.save(update_fields=("last_name",))
+        self._save_user_field("last_name")
 
     @property
     def full_name(self) -> str:
@@ -206,6 +313,34 @@ class Customer(ProxyUserRole):
         null=True,
     )
 
+    def add_favorites(self, version_ids: Iterable[int]) -> int:
+        """Add many product versions to favorites with one insert.
+        Return number of product versions passed."""
+        version_ids = set(version_ids)
+        Favorite = ProductVersion.favorited_by.through
+        with transaction.atomic():
+            Favorite.objects.bulk_create(
+                [
+                    Favorite(customer_id=self.pk, productversion_id=version_id)
+                    for version_id in version_ids
+                ],
+                ignore_conflicts=True,
+            )
+            ProductVersion.objects.refresh_favorites_count(version_ids)
+        return len(version_ids)
+
+    def remove_favorites(self, version_ids: Iterable[int]) -> int:
+        """Remove many product versions from favorites with one delete.
+        Return number of removed favorites."""
+        version_ids = set(version_ids)
+        Favorite = ProductVersion.favorited_by.through
+        with transaction.atomic():
+            removed, _ = Favorite.objects.filter(
+                customer_id=self.pk, productversion_id__in=version_ids
+            ).delete()
+            ProductVersion.objects.refresh_favorites_count(version_ids)
+        return removed
+
 
 class Moderator(ProxyUserRole):
     user = models.OneToOneField(
@@ -501,7 +636,103 @@ class Product(AutoGeneratedSlugModel, TimeStampModel):
         return 0
 
 
-class ProductVersionManager(models.Manager):
+class EstimatedCountQuerySet(models.QuerySet):
+    def estimated_count(self) -> int:
+        """Row count from table statistics for large sets,
+        see `paginators.estimated_count`."""
+        return estimated_count(self)
+
+
+EstimatedCountManager = models.Manager.from_queryset(EstimatedCountQuerySet)
+
+
+class ProductVersionQuerySet(EstimatedCountQuerySet):
+    def for_campaign(
+        self,
+        brand_ids: Iterable[int] = None,
+        category_ids: Iterable[int] = None,
+        p_type_ids: Iterable[int] = None,
+        min_price: Decimal = None,
+        max_price: Decimal = None,
+    ) -> "QuerySet[ProductVersion]":
+        """Filter product versions by brands, categories and product types
+        of their products and by regular price.
+        Product filters are applied through a subquery, so the result
+        can be updated with a single UPDATE ... WHERE statement."""
+        products = Product.objects.all()
+        if brand_ids is not None:
+            products = products.filter(brand_id__in=brand_ids)
+        if category_ids is not None:
+            products = products.filter(categories__in=category_ids)
+        if p_type_ids is not None:
+            products = products.filter(p_type_id__in=p_type_ids)
+        versions = self.filter(product_id__in=products.values("id"))
+        if min_price is not None:
+            versions = versions.filter(regular_price__gte=min_price)
+        if max_price is not None:
+            versions = versions.filter(regular_price__lte=max_price)
+        return versions
+
+    def set_active(self, is_active: bool) -> int:
+        """Activate or deactivate all versions with one update
+        and recount counters of their product categories.
+        Return number of changed versions."""
+        versions = self.exclude(is_active=is_active)
+        category_ids = set(
+            Product.categories.through.objects.filter(
+                product_id__in=versions.values("product_id")
+            ).values_list("productcategory_id", flat=True)
+        )
+        with transaction.atomic():
+            changed = versions.update(is_active=is_active, **updated_at())
+            if changed:
+                ProductCategoryCounter.objects.refresh(category_ids)
+        return changed
+
+    def assign_skus(
+        self, chunk_size: int = SKU_CHUNK_SIZE
+    ) -> Tuple[int, List[int]]:
+        """Generate sku for every version with an empty sku.
+        Product type ids are read with a join, skus are written
+        with one bulk update per chunk.
+        Versions whose generated sku is already taken or does not fit
+        the field are skipped.
+        Return number of updated versions and ids of skipped ones."""
+        month = dt.datetime.now()
+        max_length = self.model._meta.get_field("sku").max_length
+        assigned, collisions, last_id = 0, [], 0
+        pending = self.filter(sku="").order_by("id")
+        while chunk := list(
+            pending.filter(id__gt=last_id).values_list(
+                "id", "product__p_type_id"
+            )[:chunk_size]
+        ):
+            last_id = chunk[-1][0]
+            skus = {
+                pk: self.model.build_sku(p_type_id, pk, month)
+                for pk, p_type_id in chunk
+            }
+            taken = set(
+                self.model.objects.filter(sku__in=skus.values()).values_list(
+                    "sku", flat=True
+                )
+            )
+            versions = []
+            for pk, sku in skus.items():
+                if len(sku) > max_length or sku in taken:
+                    collisions.append(pk)
+                else:
+                    versions.append(self.model(id=pk, sku=sku))
+            with transaction.atomic():
+                assigned += self.model.objects.bulk_update(versions, ["sku"])
+        if collisions:
+            logger.error(f"Sku collisions for product versions: {collisions}")
+        return assigned, collisions
+
+
+class ProductVersionManager(
+    models.Manager.from_queryset(ProductVersionQuerySet)
+):
     def create(self, **kwargs: Dict[str, Any]) -> "ProductVersion":
         """Concatenate product and version names.
         Create version instance using new name."""
@@ -511,6 +742,108 @@ class ProductVersionManager(models.Manager):
         kwargs.update({"name": version_name})
         return super().create(**kwargs)
 
+    def bulk_create_versions(
+        self,
+        rows: Iterable[Mapping[str, Any]],
+        chunk_size: int = VERSION_CHUNK_SIZE,
+    ) -> List["ProductVersion"]:
+        """Create many product versions along with their stock and skus.
+        Every row holds product version fields with `product` or
+        `product_id` and optional stock `amount` and `unit`.
+        Version names are concatenated with product names as in `create`.
+        All rows are created in one transaction, so a failed chunk
+        leaves none of the rows. Each chunk takes a constant number
+        of queries: products lookup, versions insert, stock insert,
+        sku update and category counters refresh.
+        Return created product versions."""
+        created = []
+        month = dt.datetime.now()
+        with transaction.atomic():
+            for chunk in chunked(rows, chunk_size):
+                created.extend(self._create_versions_chunk(chunk, month))
+        return created
+
+    def _create_versions_chunk(
+        self, chunk: List[Mapping[str, Any]], month: dt.datetime
+    ) -> List["ProductVersion"]:
+        product_ids = {
+            row["product"].pk if "product" in row else row["product_id"]
+            for row in chunk
+        }
+        products = {
+            pk: (name, p_type_id, is_active)
+            for pk, name, p_type_id, is_active in Product.objects.filter(
+                id__in=product_ids
+            ).values_list("id", "name", "p_type_id", "is_active")
+        }
+        if missing := product_ids - products.keys():
+            msg = f"Products do not exist: {sorted(missing)}"
+            logger.error(msg)
+            raise Product.DoesNotExist(msg)
+
+        versions, stockpile = [], []
+        for row in chunk:
+            fields = dict(row)
+            product = fields.pop("product", None)
+            product_id = product.pk if product else fields.pop("product_id")
+            stockpile.append(
+                {
+                    "amount": fields.pop("amount", 0),
+                    "unit": fields.pop("unit", "pcs"),
+                }
+            )
+            fields["name"] = products[product_id][0] + " " + fields["name"]
+            versions.append(self.model(product_id=product_id, **fields))
+
+        versions = self.bulk_create(versions)
+        Stock.objects.bulk_create(
+            Stock(p_version_id=version.pk, **stock)
+            for version, stock in zip(versions, stockpile)
+        )
+        for version in versions:
+            version.sku = self.model.build_sku(
+                products[version.product_id][1], version.pk, month
+            )
+        self.bulk_update(versions, ["sku"])
+        if active := {
+            version.product_id
+            for version in versions
+            if version.is_active and products[version.product_id][2]
+        }:
+            ProductCategoryCounter.objects.refresh(
+                Product.categories.through.objects.filter(
+                    product_id__in=active
+                ).values_list("productcategory_id", flat=True)
+            )
+        return versions
+
+    def most_favorited(
+        self, category_id: int, limit: int = 10
+    ) -> "QuerySet[ProductVersion]":
+        """Active product versions of a category
+        liked by the largest number of customers."""
+        return self.filter(
+            is_active=True,
+            product__categories=category_id,
+            favorites_count__gt=0,
+        ).order_by("-favorites_count", "id")[:limit]
+
+    def refresh_favorites_count(self, version_ids: Iterable[int]) -> int:
+        """Recount customers who favorited given product versions
+        in a single UPDATE. Return number of updated versions."""
+        favorites = (
+            self.model.favorited_by.through.objects.filter(
+                productversion_id=OuterRef("pk")
+            )
+            .order_by()
+            .values("productversion_id")
+            .annotate(total=Count("customer_id"))
+            .values("total")
+        )
+        return self.filter(id__in=set(version_ids)).update(
+            favorites_count=Coalesce(Subquery(favorites), 0)
+        )
+
 
 class ProductVersion(TimeStampModel, models.Model):
     """Specific version of a product
@@ -568,12 +901,40 @@ class ProductVersion(TimeStampModel, models.Model):
         default=0,
     )
     made_in = models.CharField(_("change this to country FK"), max_length=150)
+    favorites_count = models.PositiveIntegerField(
+        _("number of customers liked this product version"),
+        help_text=_("required, starts with 0, maintained by m2m_changed"),
+        default=0,
+    )
 
     objects = ProductVersionManager()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "name"], name="unique_product_version_name"
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["-favorites_count"], name="p_version_favorites_idx"
+            )
+        ]
+
     def __str__(self) -> str:
         return self.name
 
+    def save(self, *args, **kwargs) -> None:
+        """Never overwrite `favorites_count` of an existing version
+        with a possibly stale in-memory value."""
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != "favorites_count"
+            ]
+        super().save(*args, **kwargs)
+
     @property
     def views(self) -> int:
         """Get number of customer views for this product version."""
@@ -628,7 +989,16 @@ class ProductVersion(TimeStampModel, models.Model):
 
     def _generate_sku(self) -> str:
         """Generate sku from product type, product version id and current date."""
-        return f"{self.product.p_type_id:>03}{self.pk:>02}{dt.datetime.now():%Y%m}"
+        return self.build_sku(
+            self.product.p_type_id, self.pk, dt.datetime.now()
+        )
+
+    @staticmethod
+    def build_sku(p_type_id: int, pk: int, date: dt.date) -> str:
+        """Sku of fixed width: 4 digits of product type, 10 digits of
+        product version id and 6 digits of year and month.
+        Fixed width keeps skus unique while ids fit their places."""
+        return f"{p_type_id:04}{pk:010}{date:%Y%m}"
 
     def to_dict(self) -> Dict[str, Any]:
         """Return a dict of product version attributes."""
@@ -642,6 +1012,238 @@ class ProductVersion(TimeStampModel, models.Model):
         }
 
 
+class DiscountCampaignManager(models.Manager):
+    def run_due(self, dry_run: bool = False) -> Tuple[int, int]:
+        """Apply campaigns whose discounts have started
+        and remove campaigns whose discounts have ended.
+        Return numbers of assigned and released product versions."""
+        now = timezone.now()
+        assigned = released = 0
+        for campaign in self.select_related("discount").filter(
+            status=self.model.CampaignStatus.SCHEDULED,
+            discount__is_active=True,
+            discount__starts_at__lte=now,
+            discount__ends_at__gt=now,
+        ):
+            assigned += campaign.apply(dry_run=dry_run)
+        for campaign in self.select_related("discount").filter(
+            status__in=(
+                self.model.CampaignStatus.SCHEDULED,
+                self.model.CampaignStatus.APPLIED,
+            ),
+            discount__ends_at__lte=now,
+        ):
+            released += campaign.remove(dry_run=dry_run)
+        return assigned, released
+
+
+class DiscountCampaign(TimeStampModel, models.Model):
+    """Assignment of a discount to every product version
+    matching brand, category, product type and price filters.
+    Empty filters match everything."""
+
+    class CampaignStatus(models.TextChoices):
+        SCHEDULED = "scheduled"
+        APPLIED = "applied"
+        FINISHED = "finished"
+
+    label = models.CharField(
+        _("Campaign name"),
+        help_text=_("required, unique, max_len: 100"),
+        max_length=100,
+        unique=True,
+    )
+    discount = models.ForeignKey(
+        ProductDiscount,
+        on_delete=models.CASCADE,
+        related_name="campaigns",
+    )
+    brands = models.ManyToManyField(
+        Brand,
+        related_name="campaigns",
+        blank=True,
+    )
+    categories = models.ManyToManyField(
+        ProductCategory,
+        related_name="campaigns",
+        blank=True,
+    )
+    p_types = models.ManyToManyField(
+        ProductType,
+        related_name="campaigns",
+        blank=True,
+    )
+    min_price = models.DecimalField(
+        _("Lowest regular price of product version"),
+        help_text=_("optional, max_price: 9_999_999.99"),
+        blank=True,
+        null=True,
+        **decimal_price_settings,
+    )
+    max_price = models.DecimalField(
+        _("Highest regular price of product version"),
+        help_text=_("optional, max_price: 9_999_999.99"),
+        blank=True,
+        null=True,
+        **decimal_price_settings,
+    )
+    status = models.CharField(
+        _("Campaign status"),
+        help_text=_("required, default: scheduled"),
+        max_length=20,
+        choices=CampaignStatus.choices,
+        default=CampaignStatus.SCHEDULED,
+    )
+
+    objects = DiscountCampaignManager()
+
+    def __str__(self) -> str:
+        return f"{self.label}: {self.status}"
+
+    def versions(self) -> "QuerySet[ProductVersion]":
+        """Product versions matching campaign filters.
+        Filters are passed as subqueries, nothing is fetched here."""
+        filters = {}
+        if self.brands.exists():
+            filters["brand_ids"] = self.brands.values("id")
+        if self.categories.exists():
+            filters["category_ids"] = self.categories.values("id")
+        if self.p_types.exists():
+            filters["p_type_ids"] = self.p_types.values("id")
+        return ProductVersion.objects.for_campaign(
+            min_price=self.min_price, max_price=self.max_price, **filters
+        )
+
+    def apply(self, dry_run: bool = False) -> int:
+        """Assign campaign discount to all matching product versions.
+        With `dry_run` only count them.
+        Return number of (to be) updated product versions."""
+        versions = self.versions()
+        if dry_run:
+            return versions.count()
+        now = timezone.now()
+        discount = self.discount
+        if not (
+            discount.is_active and discount.starts_at <= now < discount.ends_at
+        ):
+            msg = _("Campaign discount is not active at the moment")
+            logger.error(msg)
+            raise ValidationError(msg)
+        with transaction.atomic():
+            updated = versions.update(discount_id=self.discount_id)
+            self.status = self.CampaignStatus.APPLIED
+            self.save(update_fields=("status", "updated_at"))
+        return updated
+
+    def remove(self, dry_run: bool = False) -> int:
+        """Remove campaign discount from matching product versions
+        which still have it. With `dry_run` only count them.
+        Return number of (to be) updated product versions."""
+        versions = self.versions().filter(discount_id=self.discount_id)
+        if dry_run:
+            return versions.count()
+        with transaction.atomic():
+            updated = versions.update(discount=None)
+            self.status = self.CampaignStatus.FINISHED
+            self.save(update_fields=("status", "updated_at"))
+        return updated
+
+
+class ProductCategoryCounterManager(models.Manager):
+    def menu(self) -> "QuerySet[ProductCategoryCounter]":
+        """Counters of active categories for rendering category menus.
+        Category data is fetched along with the counters."""
+        return (
+            self.select_related("category")
+            .filter(category__is_active=True)
+            .order_by("category__name")
+        )
+
+    def apply_delta(
+        self, category_ids: Iterable[int], products: int = 0, versions: int = 0
+    ) -> int:
+        """Shift counters of given categories by `products` and `versions`.
+        Categories without a counter row are recounted from scratch.
+        Return number of updated counters."""
+        category_ids = set(category_ids)
+        if not category_ids or not (products or versions):
+            return 0
+        updated = self.filter(category_id__in=category_ids).update(
+            active_products=F("active_products") + products,
+            active_versions=F("active_versions") + versions,
+        )
+        if updated < len(category_ids):
+            updated = self.refresh(category_ids)
+        return updated
+
+    def refresh(self, category_ids: Iterable[int] = None) -> int:
+        """Recount active products and versions for given categories
+        (all categories if `category_ids` is None) in a single UPDATE.
+        Return number of refreshed counters."""
+        categories = ProductCategory.objects.all()
+        if category_ids is not None:
+            category_ids = set(category_ids)
+            categories = categories.filter(id__in=category_ids)
+        self.bulk_create(
+            [
+                self.model(category_id=category_id)
+                for category_id in categories.values_list("id", flat=True)
+            ],
+            ignore_conflicts=True,
+        )
+        links = Product.categories.through.objects.filter(
+            productcategory_id=OuterRef("category_id"),
+            product__is_active=True,
+        ).order_by()
+        products = links.values("productcategory_id").annotate(
+            total=Count("product_id")
+        )
+        versions = (
+            links.filter(product__versions__is_active=True)
+            .values("productcategory_id")
+            .annotate(total=Count("product__versions"))
+        )
+        counters = self.all()
+        if category_ids is not None:
+            counters = counters.filter(category_id__in=category_ids)
+        return counters.update(
+            active_products=Coalesce(Subquery(products.values("total")), 0),
+            active_versions=Coalesce(Subquery(versions.values("total")), 0),
+        )
+
+
+class ProductCategoryCounter(models.Model):
+    """Materialized number of active products and active versions
+    of active products in a category.
+    Maintained incrementally by signal handlers in `dbexample.signals`.
+    """
+
+    category = models.OneToOneField(
+        ProductCategory,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="counter",
+    )
+    active_products = models.IntegerField(
+        _("number of active products"),
+        help_text=_("required, default: 0"),
+        default=0,
+    )
+    active_versions = models.IntegerField(
+        _("number of active product versions"),
+        help_text=_("required, default: 0"),
+        default=0,
+    )
+
+    objects = ProductCategoryCounterManager()
+
+    def __str__(self) -> str:
+        return (
+            f"Category({self.category_id}): {self.active_products} products, "
+            f"{self.active_versions} versions"
+        )
+
+
 """
 class Media(models.Model):
     p_version = models.ForeignKey(
@@ -671,6 +1273,264 @@ class Media(models.Model):
 """
 
 
+def stock_ledger_deferred() -> bool:
+    """Whether checkouts and cancels of not sharded stocks only reserve
+    units on the `Stock` row and append pending stock movements,
+    leaving amounts, items sold and best sellers to the compaction job.
+    It shortens the checkout transaction, not the contention on the row:
+    hot products are spread over counter shards in both modes."""
+    return getattr(settings, "STOCK_LEDGER_DEFERRED", False)
+
+
+def shard_reserved() -> Coalesce:
+    """Units reserved in counter shards of the outer stock row."""
+    return Coalesce(
+        Subquery(
+            StockShard.objects.filter(stock_id=OuterRef("id"))
+            .order_by()
+            .values("stock_id")
+            .annotate(total=Sum("reserved"))
+            .values("total")
+        ),
+        0,
+    )
+
+
+class StockManager(models.Manager):
+    def with_pending(self) -> "QuerySet[Stock]":
+        """Annotate stock snapshots with movements not compacted yet:
+        `amount_with_pending` and `items_sold_with_pending`.
+        Units taken by pending movements are kept in `reserved`."""
+        pending = (
+            StockMovement.objects.filter(
+                p_version_id=OuterRef("p_version_id"), compacted=False
+            )
+            .order_by()
+            .values("p_version_id")
+        )
+        shards = (
+            StockShard.objects.filter(stock_id=OuterRef("id"))
+            .order_by()
+            .values("stock_id")
+        )
+        return self.annotate(
+            amount_with_pending=F("amount") - F("reserved") - shard_reserved(),
+            items_sold_with_pending=F("items_sold")
+            + Coalesce(
+                Subquery(
+                    pending.annotate(total=Sum("sold_delta")).values("total")
+                ),
+                0,
+            )
+            + Coalesce(
+                Subquery(
+                    shards.annotate(total=Sum("items_sold")).values("total")
+                ),
+                0,
+            ),
+        )
+
+    def record_sale(self, p_version_id: int, quantity: int) -> bool:
+        """Take sold product units out of stock and log the movement.
+        Return True if the product version has stock."""
+        return self._record(
+            p_version_id, quantity, StockMovement.Reason.SALE
+        )
+
+    def record_return(self, p_version_id: int, quantity: int) -> bool:
+        """Put units of a canceled sale back to stock and log the movement.
+        Return True if the product version has stock."""
+        return self._record(
+            p_version_id, -quantity, StockMovement.Reason.CANCEL
+        )
+
+    def _record(self, p_version_id: int, sold: int, reason: str) -> bool:
+        """Apply sold units to the stock row right away or, in deferred
+        mode, only reserve them on it and append a pending movement
+        to the ledger. Sharded stocks take the units in a shard
+        in both modes, so checkouts of hot products do not update
+        the stock row."""
+        deferred = stock_ledger_deferred()
+        with transaction.atomic():
+            stockpile = self.filter(p_version_id=p_version_id, shard_count=0)
+            if deferred:
+                # the check and the reservation are one UPDATE,
+                # so concurrent checkouts cannot take more units than left
+                if sold > 0:
+                    stockpile = stockpile.filter(
+                        amount__gte=F("reserved") + sold
+                    )
+                recorded = stockpile.update(reserved=F("reserved") + sold)
+            else:
+                recorded = stockpile.update(
+                    amount=F("amount") - sold,
+                    items_sold=F("items_sold") + sold,
+                )
+            pending = deferred and recorded
+            sharded = False
+            if not recorded:
+                stock = (
+                    self.filter(p_version_id=p_version_id)
+                    .values_list("id", "shard_count")
+                    .first()
+                )
+                if stock is None:
+                    return False
+                if not stock[1]:
+                    msg = (
+                        "Not enough stock left for product version "
+                        f"{p_version_id}"
+                    )
+                    logger.error(msg)
+                    raise NotEnoughProductLeft(msg)
+                sharded = self._record_in_shard(*stock, sold)
+            StockMovement.objects.create(
+                p_version_id=p_version_id,
+                reason=reason,
+                amount_delta=-sold,
+                sold_delta=sold,
+                compacted=not pending,
+            )
+            if not (sharded or pending):
+                BestSeller.objects.record(p_version_id)
+        return True
+
+    def _record_in_shard(
+        self, stock_id: int, shard_count: int, sold: int
+    ) -> bool:
+        """Reserve sold units in a shard with enough allotted units left,
+        trying shards from a random one. The check and the reservation
+        are one UPDATE, so concurrent checkouts cannot oversell a shard.
+        If no shard can take the units alone, the shards are merged
+        and the units are taken from the locked stock row.
+        Return True if the units were recorded in a shard."""
+        start = random.randrange(shard_count)
+        for offset in range(shard_count):
+            shard = StockShard.objects.filter(
+                stock_id=stock_id, index=(start + offset) % shard_count
+            )
+            if sold > 0:
+                shard = shard.filter(reserved__lte=F("allotment") - sold)
+            if shard.update(
+                items_sold=F("items_sold") + sold,
+                reserved=F("reserved") + sold,
+            ):
+                return True
+        self.select_for_update().filter(id=stock_id).exists()
+        StockShard.objects.merge((stock_id,))
+        stock = self.filter(id=stock_id)
+        if sold > 0:
+            stock = stock.filter(amount__gte=F("reserved") + sold)
+        if not stock.update(
+            amount=F("amount") - sold,
+            items_sold=F("items_sold") + sold,
+            **updated_at(),
+        ):
+            msg = f"Not enough stock left in stock {stock_id}"
+            logger.error(msg)
+            raise NotEnoughProductLeft(msg)
+        StockShard.objects.allot((stock_id,))
+        return False
+
+    def bulk_adjust(
+        self,
+        mapping: Mapping[int, int],
+        mode: Literal["add", "deduct", "set"] = "add",
+        chunk_size: int = STOCK_CHUNK_SIZE,
+    ) -> Tuple[int, Dict[int, Exception]]:
+        """Add, deduct or set stock amounts of many product versions.
+        `mapping` holds values by product version id.
+        Each chunk is applied by a single CASE-based UPDATE, values that
+        would take reserved units are filtered out in its WHERE clause.
+        Rows of the chunk are locked and their pending movements
+        and counter shards are folded into them first.
+        Failed rows are collected instead of raising on the first one.
+        Return number of updated stock rows and exceptions by product
+        version id, the same the `set`, `add` and `deduct` methods raise."""
+        if mode not in ("add", "deduct", "set"):
+            raise ValueError(f"{mode} is not a valid stock adjustment mode")
+        updated, failures = 0, {}
+        for chunk in chunked(mapping.items(), chunk_size):
+            values = {}
+            for p_version_id, value in chunk:
+                if value < 0:
+                    failures[p_version_id] = ValidationError(
+                        "Value must be greater or equal to 0"
+                    )
+                elif mode == "add" and value > MAX_AMOUNT_ADDED:
+                    failures[p_version_id] = TooBigToAdd(value)
+                elif mode == "set" and value > MAX_AMOUNT_ADDED:
+                    failures[p_version_id] = ValidationError(
+                        f"Value must be between 0 and {MAX_AMOUNT_ADDED}"
+                    )
+                else:
+                    values[p_version_id] = value
+            if not values:
+                continue
+
+            value = Case(
+                *(
+                    When(p_version_id=pk, then=Value(v))
+                    for pk, v in values.items()
+                ),
+                output_field=models.IntegerField(),
+            )
+            stockpile = self.filter(p_version_id__in=values)
+            if mode == "add":
+                amount = F("amount") + value
+            elif mode == "deduct":
+                # the bound is in the WHERE clause of the UPDATE
+                stockpile = stockpile.filter(
+                    amount__gte=F("reserved") + value
+                )
+                amount = F("amount") - value
+            else:
+                amount = value
+            with transaction.atomic():
+                # rows stay locked until the movements are logged, so
+                # the snapshot below tells which rows the UPDATE skips
+                sharded = [
+                    stock_id
+                    for stock_id, shard_count in self.select_for_update()
+                    .filter(p_version_id__in=values)
+                    .values_list("id", "shard_count")
+                    if shard_count
+                ]
+                # pending movements must not be applied after a new amount
+                StockMovement.objects.compact(p_version_ids=values)
+                StockShard.objects.merge(sharded)
+                before = {
+                    p_version_id: (amount_before, reserved)
+                    for p_version_id, amount_before, reserved in self.filter(
+                        p_version_id__in=values
+                    ).values_list("p_version_id", "amount", "reserved")
+                }
+                movements = []
+                for p_version_id, value in values.items():
+                    if p_version_id not in before:
+                        failures[p_version_id] = self.model.DoesNotExist(
+                            f"No stock for product version {p_version_id}"
+                        )
+                        continue
+                    amount_before, reserved = before[p_version_id]
+                    if mode == "deduct" and amount_before - reserved < value:
+                        failures[p_version_id] = NotEnoughProductLeft(
+                            p_version_id
+                        )
+                        continue
+                    movements.append(
+                        StockMovement.adjustment(
+                            p_version_id, mode, value, amount_before
+                        )
+                    )
+                updated += stockpile.update(amount=amount, **updated_at())
+                StockMovement.objects.bulk_create(movements)
+                StockShard.objects.allot(sharded)
+        if failures:
+            logger.error(f"Stock adjustment failed for: {list(failures)}")
+        return updated, failures
+
+
 class Stock(TimeStampModel, models.Model):
     p_version = models.OneToOneField(
         ProductVersion,
@@ -693,6 +1553,21 @@ class Stock(TimeStampModel, models.Model):
         help_text=_("required, default: 0"),
         default=0,
     )
+    reserved = models.IntegerField(
+        _("amount of product taken by movements not compacted yet"),
+        help_text=_("required, default: 0; maintained in deferred mode"),
+        default=0,
+    )
+    shard_count = models.PositiveSmallIntegerField(
+        _("number of counter shards"),
+        help_text=_(
+            "required, default: 0; items sold and reserved units "
+            "of hot products are spread over shard rows"
+        ),
+        default=0,
+    )
+
+    objects = StockManager()
 
     def __str__(self) -> str:
         return f"Product({self.p_version_id}): {self.amount}"
@@ -702,30 +1577,557 @@ class Stock(TimeStampModel, models.Model):
             raise ValidationError(
                 f"Value must be between 0 and {MAX_AMOUNT_ADDED}"
             )
-        self.amount = value
-        if commit:
-            self.save(update_fields=("amount",))
+        self._adjust(
+            lambda amount: value, StockMovement.Reason.ADJUSTMENT, commit
+        )
 
     def add(self, value: int, commit: bool = True) -> None:
         if value < 0:
             raise ValidationError("Value must be greater or equal to 0")
         if value > MAX_AMOUNT_ADDED:
             raise TooBigToAdd(value)
-        self.amount += value
-        if commit:
-            self.save(update_fields=("amount",))
+        self._adjust(
+            lambda amount: amount + value, StockMovement.Reason.RESTOCK, commit
+        )
 
+    @instrument("stock.deduct")
     def deduct(self, value: int, commit: bool = True) -> None:
         if value < 0:
             raise ValidationError("Value must be greater or equal to 0")
-        if value > self.amount:
-            raise NotEnoughProductLeft(self)
-        self.amount -= value
-        if commit:
+
+        def deducted(amount: int) -> int:
+            if value > amount:
+                raise NotEnoughProductLeft(self)
+            return amount - value
+
+        self._adjust(deducted, StockMovement.Reason.ADJUSTMENT, commit)
+
+    def _adjust(
+        self, new_amount: Callable[[int], int], reason: str, commit: bool
+    ) -> None:
+        """Set amount to `new_amount(amount)`. When committing, the stock
+        row is locked and its pending movements and shards are folded
+        into it first, so the new amount is computed from all units
+        actually left. Shards get their allotments of the new amount."""
+        if not commit:
+            self.amount = new_amount(self.amount)
+            return
+        with transaction.atomic():
+            self._fold()
+            amount = new_amount(self.amount)
+            delta, self.amount = amount - self.amount, amount
             self.save(update_fields=("amount",))
+            StockMovement.objects.create(
+                p_version_id=self.p_version_id,
+                reason=reason,
+                amount_delta=delta,
+                compacted=True,
+            )
+            if self.shard_count:
+                StockShard.objects.allot((self.id,))
+
+    def _fold(self) -> None:
+        """Lock the stock row and fold its pending movements
+        and counter shards into it."""
+        Stock.objects.select_for_update().filter(id=self.id).exists()
+        StockMovement.objects.compact(p_version_ids=(self.p_version_id,))
+        StockShard.objects.merge((self.id,))
+        self.refresh_from_db(
+            fields=("amount", "items_sold", "reserved", "shard_count")
+        )
 
     def available(self, amount: int) -> bool:
-        return self.amount >= amount
+        return self.current_amount >= amount
+
+    @property
+    def current_amount(self) -> int:
+        """Snapshot amount without units reserved by movements
+        not compacted yet and in counter shards."""
+        amount = self.amount - self.reserved
+        if self.shard_count:
+            amount -= StockShard.objects.totals(self.id)[1]
+        return amount
+
+    @property
+    def current_items_sold(self) -> int:
+        """Snapshot of items sold with movements not compacted yet
+        and items sold counted in counter shards."""
+        items_sold = self.items_sold
+        if self.shard_count:
+            items_sold += StockShard.objects.totals(self.id)[0]
+        if stock_ledger_deferred():
+            items_sold += StockMovement.objects.pending(self.p_version_id)[1]
+        return items_sold
+
+    def set_shard_count(self, shard_count: int) -> None:
+        """Spread items sold and reserved units over `shard_count` rows
+        (0 turns sharding off). Shards are merged into the stock row
+        before their number changes."""
+        with transaction.atomic():
+            StockShard.objects.merge((self.id,))
+            self.shards.filter(index__gte=shard_count).delete()
+            StockShard.objects.bulk_create(
+                [
+                    StockShard(stock_id=self.id, index=index)
+                    for index in range(shard_count)
+                ],
+                ignore_conflicts=True,
+            )
+            self.shard_count = shard_count
+            self.save(update_fields=("shard_count", "updated_at"))
+            StockShard.objects.allot((self.id,))
+            self.refresh_from_db(fields=("amount", "items_sold"))
+
+
+class StockShardManager(models.Manager):
+    def totals(self, stock_id: int) -> Tuple[int, int]:
+        """Sum of items sold and reserved units in shards of a stock."""
+        totals = self.filter(stock_id=stock_id).aggregate(
+            sold=Sum("items_sold"), reserved=Sum("reserved")
+        )
+        return totals["sold"] or 0, totals["reserved"] or 0
+
+    def merge(self, stock_ids: Iterable[int] = None) -> int:
+        """Collapse shard counters into their stock rows, reset them
+        and allot the stock amounts to the shards again.
+        Merge shards of all stocks if `stock_ids` is None.
+        Shards are locked while merged, so no reservation is lost.
+        Return number of merged stock rows."""
+        shards = self.all()
+        if stock_ids is not None:
+            shards = shards.filter(stock_id__in=list(stock_ids))
+        with transaction.atomic():
+            rows = (
+                shards.select_for_update(of=("self",))
+                .order_by("id")
+                .values_list(
+                    "stock_id", "stock__p_version_id", "items_sold", "reserved"
+                )
+            )
+            totals = {}
+            for stock_id, p_version_id, sold, reserved in rows:
+                total = totals.setdefault(stock_id, [p_version_id, 0, 0])
+                total[1] += sold
+                total[2] += reserved
+            merged = {
+                stock_id: total
+                for stock_id, total in totals.items()
+                if total[1] or total[2]
+            }
+            for chunk in chunked(merged.items(), STOCK_CHUNK_SIZE):
+                sold = Case(
+                    *(When(id=pk, then=t[1]) for pk, t in chunk),
+                    default=Value(0),
+                    output_field=models.IntegerField(),
+                )
+                reserved = Case(
+                    *(When(id=pk, then=t[2]) for pk, t in chunk),
+                    default=Value(0),
+                    output_field=models.IntegerField(),
+                )
+                ids = [pk for pk, _ in chunk]
+                Stock.objects.filter(id__in=ids).update(
+                    amount=F("amount") - reserved,
+                    items_sold=F("items_sold") + sold,
+                    **updated_at(),
+                )
+                self.filter(stock_id__in=ids).update(items_sold=0, reserved=0)
+            for chunk in chunked(totals, STOCK_CHUNK_SIZE):
+                self.allot(chunk)
+            for p_version_id, sold, _ in merged.values():
+                if sold:
+                    BestSeller.objects.record(p_version_id)
+        return len(merged)
+
+    def allot(self, stock_ids: Iterable[int]) -> int:
+        """Split units left in stocks over their shards, so every shard
+        reserves only units no other shard can take.
+        Shards must be merged before. Return number of updated shards."""
+        stock = Stock.objects.filter(id=OuterRef("stock_id"))
+        left = Subquery(
+            stock.annotate(left=F("amount") - F("reserved")).values("left")
+        )
+        count = Subquery(stock.values("shard_count"))
+        return self.filter(stock_id__in=list(stock_ids)).update(
+            allotment=left / count
+            + Case(
+                When(index__lt=Mod(left, count), then=Value(1)),
+                default=Value(0),
+            )
+        )
+
+
+class StockShard(models.Model):
+    """Shard of items sold and reserved units counters of a hot stock.
+    Writers pick a random shard instead of queueing on the stock row
+    and reserve units only from the shard's allotment."""
+
+    stock = models.ForeignKey(
+        Stock,
+        on_delete=models.CASCADE,
+        related_name="shards",
+    )
+    index = models.PositiveSmallIntegerField(
+        _("shard number"),
+        help_text=_("required, from 0 to Stock.shard_count - 1"),
+    )
+    items_sold = models.IntegerField(
+        _("amount of product sold not merged yet"),
+        help_text=_("required, default: 0"),
+        default=0,
+    )
+    reserved = models.IntegerField(
+        _("amount of product taken from stock not merged yet"),
+        help_text=_("required, default: 0"),
+        default=0,
+    )
+    allotment = models.IntegerField(
+        _("amount of product this shard may reserve"),
+        help_text=_("required, default: 0; set when shards are merged"),
+        default=0,
+    )
+
+    objects = StockShardManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["stock", "index"], name="unique_stock_shard_index"
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"Stock({self.stock_id}) shard {self.index}"
+
+
+class StockMovementManager(models.Manager):
+    def pending(self, p_version_id: int) -> Tuple[int, int]:
+        """Sum of amount and items sold deltas not compacted yet."""
+        totals = self.filter(
+            p_version_id=p_version_id, compacted=False
+        ).aggregate(amount=Sum("amount_delta"), sold=Sum("sold_delta"))
+        return totals["amount"] or 0, totals["sold"] or 0
+
+    def compact(
+        self,
+        chunk_size: int = STOCK_CHUNK_SIZE,
+        p_version_ids: Iterable[int] = None,
+    ) -> int:
+        """Fold movements not compacted yet into `Stock` snapshots
+        (of given product versions only if `p_version_ids` is set)
+        and release units they reserved.
+        Movements are kept as an audit trail and marked compacted.
+        Return number of folded movements."""
+        pending = self.filter(compacted=False)
+        if p_version_ids is not None:
+            pending = pending.filter(p_version_id__in=p_version_ids)
+        with transaction.atomic():
+            last_id = pending.aggregate(last=Max("id"))["last"]
+            if last_id is None:
+                return 0
+            tail = pending.filter(id__lte=last_id)
+            deltas = list(
+                tail.order_by()
+                .values("p_version_id")
+                .annotate(amount=Sum("amount_delta"), sold=Sum("sold_delta"))
+            )
+            for chunk in chunked(deltas, chunk_size):
+                amount = Case(
+                    *(
+                        When(p_version_id=d["p_version_id"], then=d["amount"])
+                        for d in chunk
+                    ),
+                    default=Value(0),
+                    output_field=models.IntegerField(),
+                )
+                sold = Case(
+                    *(
+                        When(p_version_id=d["p_version_id"], then=d["sold"])
+                        for d in chunk
+                    ),
+                    default=Value(0),
+                    output_field=models.IntegerField(),
+                )
+                Stock.objects.filter(
+                    p_version_id__in=[d["p_version_id"] for d in chunk]
+                ).update(
+                    amount=F("amount") + amount,
+                    reserved=F("reserved") + amount,
+                    items_sold=F("items_sold") + sold,
+                    **updated_at(),
+                )
+            folded = tail.update(compacted=True)
+            for delta in deltas:
+                if delta["sold"]:
+                    BestSeller.objects.record(delta["p_version_id"])
+        return folded
+
+
+class StockMovement(models.Model):
+    """Append-only log of stock changes.
+    Movements already reflected in the `Stock` snapshot are compacted."""
+
+    class Reason(models.TextChoices):
+        SALE = "sale"
+        CANCEL = "cancel"
+        RESTOCK = "restock"
+        ADJUSTMENT = "adjustment"
+
+    p_version = models.ForeignKey(
+        ProductVersion,
+        on_delete=models.PROTECT,
+        related_name="stock_movements",
+    )
+    reason = models.CharField(
+        _("Reason of stock change"),
+        help_text=_("required, one of: sale, cancel, restock, adjustment"),
+        max_length=20,
+        choices=Reason.choices,
+    )
+    amount_delta = models.IntegerField(
+        _("Change of stock amount"),
+        help_text=_("required, negative for taken units"),
+    )
+    sold_delta = models.IntegerField(
+        _("Change of items sold"),
+        help_text=_("required, default: 0"),
+        default=0,
+    )
+    compacted = models.BooleanField(
+        _("Movement is reflected in stock snapshot"),
+        help_text=_("required, default: False"),
+        default=False,
+    )
+    created_at = models.DateTimeField(
+        _("object creation time"),
+        help_text=_("format: Y-m-d H:M:S"),
+        auto_now_add=True,
+    )
+
+    objects = StockMovementManager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["p_version"],
+                condition=Q(compacted=False),
+                name="stock_movement_pending_idx",
+            )
+        ]
+
+    def __str__(self) -> str:
+        return (
+            f"{self.reason} of product {self.p_version_id}: "
+            f"{self.amount_delta}"
+        )
+
+    @classmethod
+    def adjustment(
+        cls, p_version_id: int, mode: str, value: int, before: int = 0
+    ) -> "StockMovement":
+        """Unsaved compacted movement of a bulk stock adjustment."""
+        delta = {"add": value, "deduct": -value, "set": value - before}[mode]
+        reason = cls.Reason.RESTOCK if mode == "add" else cls.Reason.ADJUSTMENT
+        return cls(
+            p_version_id=p_version_id,
+            reason=reason,
+            amount_delta=delta,
+            compacted=True,
+        )
+
+
+class BestSellerManager(models.Manager):
+    def top(
+        self, scope: str = "overall", scope_id: int = 0, limit: int = None
+    ) -> "QuerySet[BestSeller]":
+        """Ranked best sellers of a scope.
+        Product versions and their discounts are fetched along with
+        the entries, so prices are available without additional queries."""
+        ranked = (
+            self.filter(scope=scope, scope_id=scope_id)
+            .select_related("p_version__discount")
+            .annotate(
+                rank=Window(
+                    RowNumber(),
+                    order_by=[F("items_sold").desc(), F("p_version_id").asc()],
+                )
+            )
+            .order_by("rank")
+        )
+        return ranked[:limit] if limit else ranked
+
+    def record(self, p_version_id: int) -> None:
+        """Place a product version on the overall, brand and category
+        boards according to its current `Stock.items_sold`.
+        Call inside the transaction that changed `items_sold`."""
+        stock = (
+            Stock.objects.filter(p_version_id=p_version_id)
+            .values("items_sold", "p_version__product__brand_id")
+            .first()
+        )
+        if stock is None:
+            return
+        items_sold = stock["items_sold"]
+        scopes = {
+            (self.model.Scope.OVERALL, 0),
+            (self.model.Scope.BRAND, stock["p_version__product__brand_id"]),
+        }
+        scopes.update(
+            (self.model.Scope.CATEGORY, category_id)
+            for category_id in Product.categories.through.objects.filter(
+                product__versions=p_version_id
+            ).values_list("productcategory_id", flat=True)
+        )
+        boards = {scope: [] for scope in scopes}
+        in_scopes = Q()
+        for scope, scope_id in scopes:
+            in_scopes |= Q(scope=scope, scope_id=scope_id)
+        for entry in self.filter(in_scopes).values(
+            "id", "scope", "scope_id", "p_version_id", "items_sold"
+        ):
+            boards[(entry["scope"], entry["scope_id"])].append(entry)
+
+        to_create, to_trim, to_rebuild = [], [], []
+        for (scope, scope_id), board in boards.items():
+            own = [e for e in board if e["p_version_id"] == p_version_id]
+            lowest = min(
+                board,
+                key=lambda e: (e["items_sold"], -e["p_version_id"]),
+                default=None,
+            )
+            is_full = len(board) >= BEST_SELLERS_TOP_N
+            if own:
+                # a version leaving the board can be outranked
+                # by one which is not on the board
+                if is_full and items_sold < own[0]["items_sold"]:
+                    to_rebuild.append((scope, scope_id))
+            elif items_sold and (
+                not is_full
+                or (items_sold, -p_version_id)
+                > (lowest["items_sold"], -lowest["p_version_id"])
+            ):
+                to_create.append(
+                    self.model(
+                        scope=scope,
+                        scope_id=scope_id,
+                        p_version_id=p_version_id,
+                        items_sold=items_sold,
+                    )
+                )
+                if is_full:
+                    to_trim.append(lowest["id"])
+
+        own_entries = self.filter(in_scopes, p_version_id=p_version_id)
+        if items_sold:
+            own_entries.update(items_sold=items_sold)
+        else:
+            own_entries.delete()
+        if to_trim:
+            self.filter(id__in=to_trim).delete()
+        if to_create:
+            self.bulk_create(to_create)
+        for scope, scope_id in to_rebuild:
+            self.rebuild(scope, scope_id)
+
+    def rebuild(self, scope: str = None, scope_id: int = None) -> int:
+        """Recompute boards from `Stock.items_sold`.
+        Rebuild all boards if no `scope` given, all boards of the scope
+        if no `scope_id` given. Return number of board entries."""
+        partitions = {
+            self.model.Scope.OVERALL: None,
+            self.model.Scope.BRAND: "p_version__product__brand_id",
+            self.model.Scope.CATEGORY: "p_version__product__categories",
+        }
+        scopes = [scope] if scope else list(partitions)
+        entries = self.filter(scope__in=scopes)
+        if scope_id is not None:
+            entries = entries.filter(scope_id=scope_id)
+        entries.delete()
+
+        created = 0
+        for scope in scopes:
+            partition = partitions[scope]
+            stockpile = Stock.objects.filter(items_sold__gt=0)
+            if partition is None:
+                stockpile = stockpile.annotate(board_id=models.Value(0))
+            else:
+                stockpile = stockpile.annotate(board_id=F(partition)).filter(
+                    board_id__isnull=False
+                )
+                if scope_id is not None:
+                    stockpile = stockpile.filter(board_id=scope_id)
+            stockpile = stockpile.annotate(
+                rank=Window(
+                    RowNumber(),
+                    partition_by=F(partition) if partition else None,
+                    order_by=[F("items_sold").desc(), F("p_version_id").asc()],
+                )
+            ).filter(rank__lte=BEST_SELLERS_TOP_N)
+            created += len(
+                self.bulk_create(
+                    self.model(
+                        scope=scope,
+                        scope_id=row["board_id"],
+                        p_version_id=row["p_version_id"],
+                        items_sold=row["items_sold"],
+                    )
+                    for row in stockpile.values(
+                        "board_id", "p_version_id", "items_sold"
+                    )
+                )
+            )
+        return created
+
+
+class BestSeller(models.Model):
+    """Top selling product versions overall, per brand and per category.
+    Only `BEST_SELLERS_TOP_N` entries are kept for every board."""
+
+    class Scope(models.TextChoices):
+        OVERALL = "overall"
+        BRAND = "brand"
+        CATEGORY = "category"
+
+    scope = models.CharField(
+        _("Leaderboard scope"),
+        help_text=_("required, one of: overall, brand, category"),
+        max_length=10,
+        choices=Scope.choices,
+    )
+    scope_id = models.PositiveBigIntegerField(
+        _("Brand or category id"),
+        help_text=_("required, 0 for overall scope"),
+        default=0,
+    )
+    p_version = models.ForeignKey(
+        ProductVersion,
+        on_delete=models.CASCADE,
+        related_name="best_seller_entries",
+    )
+    items_sold = models.PositiveIntegerField(
+        _("amount of product sold"),
+        help_text=_("required, copy of Stock.items_sold"),
+        default=0,
+    )
+
+    objects = BestSellerManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["scope", "scope_id", "p_version"],
+                name="unique_best_seller_board_entry",
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["scope", "scope_id", "-items_sold"],
+                name="best_seller_board_idx",
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.scope}({self.scope_id}): {self.p_version_id}"
 
 
 class CartManager(models.Manager):
@@ -758,6 +2160,11 @@ class Cart(TimeStampModel, models.Model):
         default=CartStatus.EMPTY,
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["updated_at"], name="cart_updated_idx")
+        ]
+
     def __str__(self) -> str:
         return f"{self.id} for Customer({self.customer_id})"
 
@@ -779,6 +2186,38 @@ class Cart(TimeStampModel, models.Model):
         self.status = self.CartStatus.EMPTY
         self.save(update_fields=("status", "updated_at"))
 
+    @classmethod
+    def sweep_abandoned(
+        cls, ttl: dt.timedelta, batch_size: int = CART_SWEEP_BATCH_SIZE
+    ) -> Tuple[int, int]:
+        """Clear carts with items not updated for longer than `ttl`,
+        whatever their status.
+        Every batch of carts is cleared by a short transaction
+        with one delete of their items and one status update.
+        Return number of cleared carts and deleted cart items."""
+        cutoff = timezone.now() - ttl
+        stale = cls.objects.filter(
+            Exists(CartItem.objects.filter(cart_id=OuterRef("id"))),
+            updated_at__lt=cutoff,
+        ).order_by("id")
+        carts_count = items_count = last_id = 0
+        while cart_ids := list(
+            stale.filter(id__gt=last_id).values_list("id", flat=True)[
+                :batch_size
+            ]
+        ):
+            last_id = cart_ids[-1]
+            with transaction.atomic():
+                # carts updated since they were selected are left alone
+                items_count += CartItem.objects.filter(
+                    cart_id__in=stale.filter(id__in=cart_ids).values("id")
+                ).delete()[0]
+                carts_count += cls.objects.filter(
+                    id__in=cart_ids, updated_at__lt=cutoff
+                ).update(status=cls.CartStatus.EMPTY, **updated_at())
+        return carts_count, items_count
+
+    @instrument("cart.refresh")
     def refresh(self) -> None:
         """Update all cart items from product version info."""
         # think about save() method runs at every item refresh
@@ -832,7 +2271,8 @@ class Cart(TimeStampModel, models.Model):
         }
 
 
-class CartItemManager(models.Manager):
+class CartItemManager(EstimatedCountManager):
+    @instrument("cart_item.create_from_product_version")
     def create_from_product_version(
         self, customer_id: int, product_version_id: int, **kwargs: dict
     ) -> "CartItem":
@@ -945,7 +2385,7 @@ class CartItem(TimeStampModel, models.Model):
     objects = CartItemManager()
 
     def __str__(self):
-        return self.product_name
+        return self.name
 
     def save(self, *args, **kwargs) -> None:
         """Update cart info each time a cart item updated."""
@@ -1035,6 +2475,7 @@ class CartItem(TimeStampModel, models.Model):
 
 
 class OrderManager(models.Manager):
+    @instrument("order.create_from_cart")
     def create_from_cart(self, customer_id: int, **kwargs: dict) -> "Order":
         """Create order from cart.
         Before order creation assert that cart exists
@@ -1065,6 +2506,84 @@ class OrderManager(models.Manager):
         # order.save(update_fields=("final_sum",))
         return order
 
+    def history(
+        self,
+        customer_id: int,
+        after: Optional[Tuple[dt.datetime, int]] = None,
+        limit: int = ORDER_HISTORY_PAGE_SIZE,
+        summary: bool = False,
+        include_archived: bool = False,
+    ) -> Tuple[
+        List["Order | ArchivedOrder"], Optional[Tuple[dt.datetime, int]]
+    ]:
+        """Return a page of customer orders, newest first,
+        and a `(created_at, id)` cursor of the next page or None.
+        Page after the cursor of the previous page with `after`.
+        Order items of the whole page are fetched by one extra query,
+        unless only `summary` columns are requested.
+        Archived orders are listed only with `include_archived`,
+        which takes the same queries once more for the archive."""
+        page = self._history_page(
+            self.filter(customer_id=customer_id),
+            OrderItem,
+            after,
+            limit,
+            summary,
+        )
+        if include_archived:
+            page = sorted(
+                page
+                + self._history_page(
+                    ArchivedOrder.objects.filter(customer_id=customer_id),
+                    ArchivedOrderItem,
+                    after,
+                    limit,
+                    summary,
+                ),
+                key=lambda order: (order.created_at, order.id),
+                reverse=True,
+            )
+        if len(page) <= limit:
+            return page, None
+        page = page[:limit]
+        return page, (page[-1].created_at, page[-1].id)
+
+    @staticmethod
+    def _history_page(
+        orders: QuerySet,
+        item_model: Type[models.Model],
+        after: Optional[Tuple[dt.datetime, int]],
+        limit: int,
+        summary: bool,
+    ) -> List["Order | ArchivedOrder"]:
+        """Fetch up to `limit + 1` orders of `history` from one table."""
+        orders = orders.order_by("-created_at", "-id")
+        if after is not None:
+            created_at, order_id = after
+            orders = orders.filter(
+                Q(created_at__lt=created_at)
+                | Q(created_at=created_at, id__lt=order_id)
+            )
+        if summary:
+            orders = orders.only(
+                "id", "customer_id", "created_at", "_status", "discounted_sum"
+            )
+        else:
+            orders = orders.prefetch_related(
+                Prefetch("items", queryset=item_model.objects.order_by("id"))
+            )
+        return list(orders[: limit + 1])
+
+    def lookup(self, order_id: int) -> "Order | ArchivedOrder":
+        """Get an order by id, falling back to archived orders."""
+        try:
+            return self.get(id=order_id)
+        except Order.DoesNotExist as e:
+            if archived := ArchivedOrder.objects.filter(id=order_id).first():
+                return archived
+            logger.error(f"Order {order_id} does not exist")
+            raise e
+
 
 def set_deleted_customer():
     pass
@@ -1117,6 +2636,24 @@ class Order(TimeStampModel, models.Model):
 
     objects = OrderManager()
 
+    TERMINAL_STATUSES = (
+        OrderStatus.FINISHED,
+        OrderStatus.CANCELED_BY_CUSTOMER,
+        OrderStatus.CANCELED_BY_SELLER,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["customer", "-created_at", "-id"],
+                name="order_customer_history_idx",
+            ),
+            models.Index(
+                fields=["_status", "created_at"],
+                name="order_status_created_idx",
+            ),
+        ]
+
     def __str__(self) -> str:
         return f"Order {self.id} for customer {self.customer_id}"
 
@@ -1135,6 +2672,7 @@ class Order(TimeStampModel, models.Model):
             logger.error(msg)
             raise ValueError(msg)
 
+    @instrument("order.cancel")
     def cancel(self, canceled_by: Literal["customer", "seller"]) -> int:
         """Cancel the order.
         Revert all order items and set specific order status.
@@ -1148,18 +2686,16 @@ class Order(TimeStampModel, models.Model):
         return number_canceled
 
 
-class OrderItemManager(models.Manager):
+class OrderItemManager(EstimatedCountManager):
     def create_from_cart_item(
         self, order_id: int, cart_item: CartItem, **kwargs: dict
     ) -> "OrderItem":
         """Create an order item from a cart item."""
         data = cart_item.to_dict()
-        stock = Stock.objects.filter(p_version_id=data.get("p_version_id"))
         quantity = data.get("quantity")
         try:
-            success = stock.update(
-                amount=F("amount") - quantity,
-                items_sold=F("items_sold") + quantity,
+            success = Stock.objects.record_sale(
+                data.get("p_version_id"), quantity
             )
         except IntegrityError as e:
             logger.error(_("invalid quantity"))
@@ -1255,23 +2791,34 @@ class OrderItem(models.Model):
         help_text=_("required, default: False"),
         default=False,
     )
+    cancel_rolled_up = models.BooleanField(
+        _("Was cancellation subtracted from sales rollups"),
+        help_text=_("required, default: False"),
+        default=False,
+    )
 
     objects = OrderItemManager()
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["order"],
+                condition=Q(is_canceled=True, cancel_rolled_up=False),
+                name="order_item_cancel_pending_idx",
+            )
+        ]
+
     def __str__(self) -> str:
-        return self.product_name
+        return self.name
 
     def revert(self) -> bool:
         """Restore the quantity of stock units when the order is canceled.
         Set quantity item quantity to 0.
         Return: bool, status of revert operation."""
-        stock = Stock.objects.filter(p_version_id=self.p_version_id)
         try:
-            canceled = stock.update(
-                amount=F("amount") + self.quantity,
-                items_sold=F("items_sold") - self.quantity,
+            canceled = Stock.objects.record_return(
+                self.p_version_id, self.quantity
             )
-            canceled = bool(canceled)
         except IntegrityError as e:
             logger.error("invalid values; unable to perform update")
             raise e
@@ -1293,5 +2840,421 @@ class OrderItem(models.Model):
         return canceled
 
 
+class SalesRollupManager(models.Manager):
+    def merge(self, rows: Iterable[Dict[str, Any]], sign: int = 1) -> None:
+        """Add (or subtract with `sign=-1`) aggregated order item sums
+        to rollup rows matching by `rollup_key`."""
+        key_fields = self.model.rollup_key
+        for chunk in chunked(rows, ROLLUP_CHUNK_SIZE):
+            lookup = {
+                f"{field}__in": {row[field] for row in chunk}
+                for field in key_fields
+            }
+            existing = {
+                tuple(getattr(obj, field) for field in key_fields): obj
+                for obj in self.filter(**lookup)
+            }
+            created, updated = [], []
+            for row in chunk:
+                key = tuple(row[field] for field in key_fields)
+                if obj := existing.get(key):
+                    updated.append(obj)
+                else:
+                    obj = self.model(**{field: row[field] for field in row})
+                    for field in SALES_TOTALS:
+                        setattr(obj, field, 0)
+                    created.append(obj)
+                for field in SALES_TOTALS:
+                    value = getattr(obj, field) + sign * row[field]
+                    setattr(obj, field, value)
+            self.bulk_create(created)
+            self.bulk_update(updated, SALES_TOTALS)
+
+    def replace(
+        self, start: dt.date, end: dt.date, rows: Iterable[Dict[str, Any]]
+    ) -> None:
+        """Replace rollup rows of dates from `start` to `end`."""
+        self.filter(date__range=(start, end)).delete()
+        self.bulk_create(
+            (self.model(**row) for row in rows), batch_size=ROLLUP_CHUNK_SIZE
+        )
+
+
+class SalesRollup(models.Model):
+    """Daily sums of ordered items.
+    Rows are keyed by `rollup_key` fields."""
+
+    rollup_key = ("date",)
+
+    date = models.DateField(_("order date"))
+    quantity = models.IntegerField(
+        _("Quantity of ordered products"),
+        help_text=_("required, default: 0"),
+        default=0,
+    )
+    initial_sum = models.DecimalField(
+        _("sum of orders without discounts"),
+        help_text=_("required, max_sum: 9 999 999 999.99"),
+        default=0,
+        **decimal_sum_settings,
+    )
+    total_discount = models.DecimalField(
+        _("sum of discounts"),
+        help_text=_("required, max_sum: 9 999 999 999.99"),
+        default=0,
+        **decimal_sum_settings,
+    )
+    discounted_sum = models.DecimalField(
+        _("sum of orders with discounts"),
+        help_text=_("required, max_sum: 9 999 999 999.99"),
+        default=0,
+        **decimal_sum_settings,
+    )
+
+    objects = SalesRollupManager()
+
+    class Meta:
+        abstract = True
+
+
+def _sum_rows(
+    rows: List[Dict[str, Any]], key: Tuple[str, ...]
+) -> List[Dict[str, Any]]:
+    """Merge rollup rows with equal `key` fields summing their totals."""
+    merged: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+    for row in rows:
+        row_key = tuple(row[field] for field in key)
+        if row_key not in merged:
+            merged[row_key] = dict(row)
+            continue
+        for field in SALES_TOTALS:
+            merged[row_key][field] += row[field]
+    return list(merged.values())
+
+
+class DailySalesManager(SalesRollupManager):
+    watermark_name = "daily_sales"
+
+    def compute(
+        self,
+        items: QuerySet,
+        start: Optional[dt.date] = None,
+        end: Optional[dt.date] = None,
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Aggregate order items by day and product version
+        and by day and product category.
+        Return rows of `DailySales` and `DailyCategorySales`."""
+        if start is not None:
+            items = items.filter(order__created_at__date__range=(start, end))
+        totals = {field: Sum(field) for field in SALES_TOTALS}
+        items = items.order_by().annotate(date=TruncDate("order__created_at"))
+        versions = items.values(
+            "date",
+            "p_version_id",
+            brand_id=F("p_version__product__brand_id"),
+            p_type_id=F("p_version__product__p_type_id"),
+        ).annotate(**totals)
+        categories = (
+            items.filter(p_version__product__categories__isnull=False)
+            .values("date", category_id=F("p_version__product__categories"))
+            .annotate(**totals)
+        )
+        return list(versions), list(categories)
+
+    def roll_up(self) -> Tuple[int, int]:
+        """Add items of orders placed after the watermark to rollups
+        and subtract items canceled since the last run.
+        Return number of rolled up orders and canceled items."""
+        with transaction.atomic():
+            watermark, _ = SalesWatermark.objects.get_or_create(
+                name=self.watermark_name
+            )
+            last_id = (
+                Order.objects.filter(id__gt=watermark.last_id).aggregate(
+                    last_id=Max("id")
+                )["last_id"]
+                or watermark.last_id
+            )
+            new_items = OrderItem.objects.filter(
+                order_id__gt=watermark.last_id, order_id__lte=last_id
+            )
+            canceled = OrderItem.objects.filter(
+                order_id__lte=last_id, is_canceled=True, cancel_rolled_up=False
+            )
+            for items, sign in ((new_items, 1), (canceled, -1)):
+                versions, categories = self.compute(items)
+                self.merge(versions, sign)
+                DailyCategorySales.objects.merge(categories, sign)
+            canceled_count = canceled.update(cancel_rolled_up=True)
+            orders_count = Order.objects.filter(
+                id__gt=watermark.last_id, id__lte=last_id
+            ).count()
+            watermark.last_id = last_id
+            watermark.save(update_fields=("last_id",))
+        return orders_count, canceled_count
+
+    def rolled_up_items(self) -> QuerySet:
+        """Order items reflected in rollups up to the watermark."""
+        watermark = (
+            SalesWatermark.objects.filter(name=self.watermark_name)
+            .values_list("last_id", flat=True)
+            .first()
+        ) or 0
+        return OrderItem.objects.filter(order_id__lte=watermark).exclude(
+            is_canceled=True, cancel_rolled_up=True
+        )
+
+    def archived_items(self) -> QuerySet:
+        """Items of archived orders reflected in rollups.
+        Orders are archived only after their canceled items
+        were subtracted, so only not canceled items count."""
+        return ArchivedOrderItem.objects.filter(is_canceled=False)
+
+    def compute_rolled_up(
+        self, start: dt.date, end: dt.date
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Aggregate rolled up items of live and archived orders
+        placed from `start` to `end`, same as `compute`."""
+        versions, categories = self.compute(
+            self.rolled_up_items(), start, end
+        )
+        archived_versions, archived_categories = self.compute(
+            self.archived_items(), start, end
+        )
+        return (
+            _sum_rows(versions + archived_versions, ("date", "p_version_id")),
+            _sum_rows(
+                categories + archived_categories, ("date", "category_id")
+            ),
+        )
+
+
+class DailySales(SalesRollup):
+    """Sales of a product version per day
+    with its brand and product type copied for grouping."""
+
+    rollup_key = ("date", "p_version_id")
+
+    p_version = models.ForeignKey(
+        ProductVersion,
+        on_delete=models.PROTECT,
+        related_name="daily_sales",
+    )
+    brand = models.ForeignKey(
+        Brand,
+        on_delete=models.SET_NULL,
+        related_name="daily_sales",
+        null=True,
+    )
+    p_type = models.ForeignKey(
+        ProductType,
+        on_delete=models.SET_NULL,
+        related_name="daily_sales",
+        null=True,
+    )
+
+    objects = DailySalesManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "p_version"], name="unique_daily_sales"
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["brand", "date"], name="daily_sales_brand_idx"
+            ),
+            models.Index(
+                fields=["p_type", "date"], name="daily_sales_p_type_idx"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.date}: {self.p_version_id}"
+
+
+class DailyCategorySales(SalesRollup):
+    """Sales of products in a category per day."""
+
+    rollup_key = ("date", "category_id")
+
+    category = models.ForeignKey(
+        ProductCategory,
+        on_delete=models.CASCADE,
+        related_name="daily_sales",
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "category"], name="unique_daily_category_sales"
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.date}: {self.category_id}"
+
+
+class SalesWatermark(models.Model):
+    """Id of the last order reflected in sales rollups."""
+
+    name = models.CharField(max_length=50, primary_key=True)
+    last_id = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f"{self.name}: {self.last_id}"
+
+
+class ArchivedOrderManager(models.Manager):
+    def archive(
+        self, cutoff: dt.datetime, chunk_size: int = ARCHIVE_CHUNK_SIZE
+    ) -> Tuple[int, int]:
+        """Move orders in terminal statuses created before `cutoff`
+        with their items to archive tables, one transaction per chunk.
+        Only orders already reflected in sales rollups are moved.
+        Return number of archived orders and order items."""
+        watermark = (
+            SalesWatermark.objects.filter(
+                name=DailySalesManager.watermark_name
+            )
+            .values_list("last_id", flat=True)
+            .first()
+        ) or 0
+        candidates = (
+            Order.objects.filter(
+                _status__in=Order.TERMINAL_STATUSES,
+                created_at__lt=cutoff,
+                id__lte=watermark,
+            )
+            .exclude(
+                Exists(
+                    OrderItem.objects.filter(
+                        order_id=OuterRef("id"),
+                        is_canceled=True,
+                        cancel_rolled_up=False,
+                    )
+                )
+            )
+            .order_by("id")
+        )
+        order_fields = [f.attname for f in self.model._meta.concrete_fields]
+        order_fields.remove("archived_at")
+        item_fields = [
+            f.attname for f in ArchivedOrderItem._meta.concrete_fields
+        ]
+        orders_count = items_count = last_id = 0
+        while order_ids := list(
+            candidates.filter(id__gt=last_id).values_list("id", flat=True)[
+                :chunk_size
+            ]
+        ):
+            last_id = order_ids[-1]
+            orders = Order.objects.filter(id__in=order_ids)
+            items = OrderItem.objects.filter(order_id__in=order_ids)
+            with transaction.atomic():
+                self.bulk_create(
+                    self.model(**row) for row in orders.values(*order_fields)
+                )
+                ArchivedOrderItem.objects.bulk_create(
+                    ArchivedOrderItem(**row)
+                    for row in items.values(*item_fields)
+                )
+                items_count += items.delete()[0]
+                orders.delete()
+            orders_count += len(order_ids)
+        return orders_count, items_count
+
+
+class ArchivedOrder(models.Model):
+    """Order in a terminal status moved out of the hot `Order` table.
+    Keeps the id of the original order."""
+
+    id = models.BigIntegerField(primary_key=True)
+    customer = models.ForeignKey(
+        Customer,
+        on_delete=models.SET_NULL,
+        related_name="archived_orders",
+        null=True,
+    )
+    _status = models.CharField(
+        _("Order status"),
+        max_length=50,
+        choices=Order.OrderStatus.choices,
+    )
+    initial_sum = models.DecimalField(
+        _("order sum without discounts"), **decimal_sum_settings
+    )
+    total_discount = models.DecimalField(
+        _("sum of discounts"), **decimal_sum_settings
+    )
+    discounted_sum = models.DecimalField(
+        _("order sum with discounts"), **decimal_sum_settings
+    )
+    created_at = models.DateTimeField(_("object creation time"))
+    updated_at = models.DateTimeField(_("object last update time"))
+    archived_at = models.DateTimeField(
+        _("object archivation time"), auto_now_add=True
+    )
+
+    objects = ArchivedOrderManager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["customer", "-created_at", "-id"],
+                name="archived_order_customer_idx",
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"Archived order {self.id} for customer {self.customer_id}"
+
+    @property
+    def status(self) -> str:
+        return self._status
+
+
+class ArchivedOrderItem(models.Model):
+    """Item of an archived order. Keeps the id of the original item."""
+
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(
+        ArchivedOrder,
+        on_delete=models.CASCADE,
+        related_name="items",
+    )
+    p_version = models.ForeignKey(
+        ProductVersion,
+        on_delete=models.PROTECT,
+        related_name="archived_order_items",
+    )
+    name = models.CharField(_("Ordered product version name"), max_length=150)
+    sku = models.CharField(_("stock keeping unit"), max_length=20)
+    quantity = models.PositiveIntegerField(_("Quantity of ordered product"))
+    regular_price = models.DecimalField(
+        _("Final price of ordered product"), **decimal_price_settings
+    )
+    discount = models.PositiveSmallIntegerField(_("Discount rate (integer)"))
+    discounted_price = models.DecimalField(
+        _("Discounted oreder item price"), **decimal_price_settings
+    )
+    initial_sum = models.DecimalField(
+        _("Sum of ordered product without discounts"), **decimal_sum_settings
+    )
+    total_discount = models.DecimalField(
+        _("Sum of total discounts applied to ordered product"),
+        **decimal_sum_settings,
+    )
+    discounted_sum = models.DecimalField(
+        _("Final sum of ordered product with discounts"),
+        **decimal_sum_settings,
+    )
+    is_canceled = models.BooleanField(_("Was order item canceled"))
+
+    def __str__(self) -> str:
+        return self.name
+
+
 class Comment(models.Model):
     pass
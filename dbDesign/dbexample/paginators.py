@@ -0,0 +1,118 @@
+from typing import Iterable, Optional
+
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Max, Min, Q
+from django.db.models.query import QuerySet
+from django.utils.functional import cached_property
+
+# Filtered sets up to this size are counted exactly.
+EXACT_COUNT_THRESHOLD = 1000
+# Rows scanned to estimate selectivity of filters on large sets.
+ESTIMATE_SAMPLE_SIZE = 5000
+# Primary key windows spread over the table the sample is taken from.
+ESTIMATE_WINDOWS = 10
+
+
+def table_rows_estimate(model, using: str = "default") -> Optional[int]:
+    """Number of rows of a model table recorded by the last `ANALYZE`.
+    Return None if the table was never analyzed."""
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT stat FROM sqlite_stat1 WHERE tbl = %s",
+                [model._meta.db_table],
+            )
+            stats = [row[0] for row in cursor.fetchall()]
+    except DatabaseError:
+        return None
+    if not stats:
+        return None
+    return max(int(stat.split()[0]) for stat in stats)
+
+
+def analyze(tables: Iterable[str] = (), using: str = "default") -> None:
+    """Refresh table statistics used for estimates."""
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if not tables:
+            cursor.execute("ANALYZE")
+        for table in tables:
+            cursor.execute(f"ANALYZE {connection.ops.quote_name(table)}")
+
+
+def sample_windows(
+    queryset: QuerySet, table_rows: int, sample_size: int, windows: int
+) -> Optional[Q]:
+    """Filter of `windows` primary key ranges spread evenly between
+    the lowest and the highest key, together covering about
+    `sample_size` rows of a table with `table_rows` rows.
+    Return None if keys are not integers."""
+    bounds = (
+        queryset.model._default_manager.using(queryset.db)
+        .order_by()
+        .aggregate(low=Min("pk"), high=Max("pk"))
+    )
+    low, high = bounds["low"], bounds["high"]
+    if not isinstance(low, int) or not isinstance(high, int):
+        return None
+    span = high - low + 1
+    width = max(span * sample_size // (max(table_rows, 1) * windows), 1)
+    sample = Q()
+    for window in range(windows):
+        start = low + window * span // windows
+        sample |= Q(pk__gte=start, pk__lt=start + width)
+    return sample
+
+
+def estimated_count(
+    queryset: QuerySet,
+    exact_threshold: int = EXACT_COUNT_THRESHOLD,
+    sample_size: int = ESTIMATE_SAMPLE_SIZE,
+) -> int:
+    """Count rows of a queryset without scanning the whole table.
+    Unfiltered querysets take the row count from table statistics.
+    Filtered sets are counted exactly up to `exact_threshold` rows,
+    larger ones scale the table estimate by the share of matching rows
+    among about `sample_size` rows taken from primary key windows
+    spread over the whole table, so filters correlated with insertion
+    order are not measured on the oldest rows only.
+    Without statistics or a sample the exact count is returned."""
+    model = queryset.model
+    table_rows = table_rows_estimate(model, queryset.db)
+    if table_rows is None:
+        return queryset.count()
+    if not queryset.query.where:
+        return table_rows
+    bounded = queryset.order_by()[: exact_threshold + 1].count()
+    if bounded <= exact_threshold:
+        return bounded
+    sample = sample_windows(
+        queryset, table_rows, sample_size, ESTIMATE_WINDOWS
+    )
+    if sample is None:
+        return queryset.count()
+    scanned = (
+        model._default_manager.using(queryset.db)
+        .filter(sample)
+        .order_by()
+        .count()
+    )
+    if not scanned:
+        return queryset.count()
+    matched = queryset.filter(sample).order_by().count()
+    return max(bounded, round(table_rows * matched / scanned))
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator taking the row count of querysets from table statistics
+    instead of `COUNT(*)`, see `estimated_count`."""
+
+    @cached_property
+    def count(self) -> int:
+        if hasattr(self.object_list, "query"):
+            return estimated_count(self.object_list)
+        return super().count
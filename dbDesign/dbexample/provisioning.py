@@ -0,0 +1,198 @@
+import logging
+import multiprocessing
+import os
+from collections import Counter
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connections, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from .models import Cart, Customer
+from .utils import chunked
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+PROVISION_CHUNK_SIZE = 1000
+
+
+def clean_account(row: Dict[str, Any]) -> Dict[str, str]:
+    """Return a normalized account row.
+    Raise ValueError if username, email or password is missing."""
+    account = {
+        field: str(row.get(field) or "").strip()
+        for field in (
+            "username",
+            "email",
+            "password",
+            "first_name",
+            "last_name",
+            "phone_number",
+        )
+    }
+    if missing := [
+        field
+        for field in ("username", "email", "password")
+        if not account[field]
+    ]:
+        raise ValueError(f"missing values: {', '.join(missing)}")
+    return account
+
+
+class CustomerProvisioner:
+    """Create users with their customers and carts from an account list.
+
+    Passwords are hashed in a pool of worker processes before a chunk is
+    written, so every chunk is one short transaction of three bulk
+    inserts. Accounts whose username or email is taken, by the database
+    or by an earlier row, are skipped as conflicts."""
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        chunk_size: int = PROVISION_CHUNK_SIZE,
+        activate: bool = False,
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.activate = activate
+        self.stats = Counter(created=0, conflicts=0, skipped=0)
+        self._seen = set()
+
+    def run(self, rows: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+        """Provision all rows.
+        With several workers, database connections are closed
+        before the workers are forked, so do not call it
+        inside a transaction.
+        Return numbers of created, conflicting and skipped accounts."""
+        if self.workers == 1:
+            self._provision(rows, None)
+        else:
+            # forked workers must not share the parent's connections
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("fork"),
+            ) as executor:
+                # workers are forked on the first task, fork them
+                # before the first chunk opens a connection again
+                executor.submit(int).result()
+                self._provision(rows, executor)
+        return dict(self.stats)
+
+    def _provision(
+        self, rows: Iterable[Dict[str, Any]], executor: Optional[Executor]
+    ) -> None:
+        for chunk in chunked(rows, self.chunk_size):
+            accounts = self._drop_conflicts(self._clean(chunk))
+            if not accounts:
+                continue
+            passwords = [account.pop("password") for account in accounts]
+            if executor is None:
+                hashes = list(map(make_password, passwords))
+            else:
+                hashes = list(
+                    executor.map(
+                        make_password,
+                        passwords,
+                        chunksize=max(len(passwords) // self.workers, 1),
+                    )
+                )
+            self._write(accounts, hashes)
+
+    def _clean(self, chunk: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        accounts = []
+        for row in chunk:
+            try:
+                accounts.append(clean_account(row))
+            except ValueError as e:
+                logger.error(f"Skipped account {row.get('username')}: {e}")
+                self.stats["skipped"] += 1
+        return accounts
+
+    def _drop_conflicts(
+        self, accounts: List[Dict[str, str]]
+    ) -> List[Dict[str, str]]:
+        """Drop accounts with a username or email already taken
+        checking the whole chunk with one query."""
+        taken = set()
+        for username, email in (
+            User.objects.annotate(email_lower=Lower("email"))
+            .filter(
+                Q(username__in=[account["username"] for account in accounts])
+                | Q(
+                    email_lower__in=[
+                        account["email"].lower() for account in accounts
+                    ]
+                )
+            )
+            .values_list("username", "email_lower")
+        ):
+            taken.update((("username", username), ("email", email)))
+        unique = []
+        for account in accounts:
+            keys = {
+                ("username", account["username"]),
+                ("email", account["email"].lower()),
+            }
+            if keys & (taken | self._seen):
+                self.stats["conflicts"] += 1
+                continue
+            self._seen.update(keys)
+            unique.append(account)
+        return unique
+
+    def _write(
+        self, accounts: List[Dict[str, str]], hashes: List[str]
+    ) -> None:
+        """Insert users, customers and carts of a chunk.
+        Users inserted concurrently by someone else are recognized
+        by their password hash and counted as conflicts."""
+        status = (
+            Customer.CustomerStatus.ACTIVATED
+            if self.activate
+            else Customer.CustomerStatus.CREATED
+        )
+        phones = {}
+        users = []
+        for account, password in zip(accounts, hashes):
+            phones[account["username"]] = account.pop("phone_number") or None
+            users.append(
+                User(password=password, is_active=self.activate, **account)
+            )
+        with transaction.atomic():
+            User.objects.bulk_create(users, ignore_conflicts=True)
+            hashes = set(hashes)
+            user_ids = {
+                username: pk
+                for username, pk, password in User.objects.filter(
+                    username__in=phones.keys()
+                ).values_list("username", "id", "password")
+                if password in hashes
+            }
+            Customer.objects.bulk_create(
+                Customer(
+                    user_id=pk, status=status, phone_number=phones[username]
+                )
+                for username, pk in user_ids.items()
+            )
+            Cart.objects.bulk_create(
+                Cart(customer_id=pk)
+                for pk in Customer.objects.filter(
+                    user_id__in=user_ids.values()
+                ).values_list("id", flat=True)
+            )
+        self.stats["created"] += len(user_ids)
+        self.stats["conflicts"] += len(accounts) - len(user_ids)
+
+
+def provision_customers(
+    rows: Iterable[Dict[str, Any]], **kwargs: Any
+) -> Dict[str, int]:
+    """Provision accounts from rows, see `CustomerProvisioner`."""
+    return CustomerProvisioner(**kwargs).run(rows)
@@ -0,0 +1,149 @@
+import time
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission
+from django.contrib.sessions.backends.base import SessionBase
+from django.core.cache import cache
+from django.db.models import Q
+
+from .models import User
+
+ROLES_SESSION_KEY = "_roles"
+
+
+class Roles:
+    """Roles, groups and permissions of a user resolved at once."""
+
+    def __init__(self, bundle: Dict[str, Any]):
+        self.bundle = bundle
+
+    def __repr__(self) -> str:
+        return f"Roles({self.bundle})"
+
+    @property
+    def customer_id(self) -> Optional[int]:
+        return self.bundle["customer_id"]
+
+    @property
+    def moderator_id(self) -> Optional[int]:
+        return self.bundle["moderator_id"]
+
+    @property
+    def is_customer(self) -> bool:
+        return self.customer_id is not None
+
+    @property
+    def is_moderator(self) -> bool:
+        return self.moderator_id is not None
+
+    @property
+    def groups(self) -> frozenset:
+        return frozenset(self.bundle["groups"])
+
+    @property
+    def permissions(self) -> frozenset:
+        return frozenset(self.bundle["permissions"])
+
+    def has_perm(self, perm: str) -> bool:
+        """Check a permission given as `app_label.codename`."""
+        if self.bundle["is_superuser"]:
+            return True
+        return perm in self.bundle["permissions"]
+
+
+def load_roles(user_id: int) -> Dict[str, Any]:
+    """Read all roles of a user with one query.
+    Groups and permissions are read only for existing users,
+    with two more queries."""
+    row = (
+        User.objects.filter(id=user_id)
+        .values(
+            "is_superuser", "customer__id", "customer__status", "moderator__id"
+        )
+        .first()
+    )
+    bundle = {
+        "customer_id": None,
+        "customer_status": None,
+        "moderator_id": None,
+        "is_superuser": False,
+        "groups": [],
+        "permissions": [],
+    }
+    if row is None:
+        return bundle
+    bundle.update(
+        customer_id=row["customer__id"],
+        customer_status=row["customer__status"],
+        moderator_id=row["moderator__id"],
+        is_superuser=row["is_superuser"],
+        groups=sorted(
+            Group.objects.filter(user__id=user_id).values_list(
+                "name", flat=True
+            )
+        ),
+        permissions=sorted(
+            {
+                f"{app_label}.{codename}"
+                for app_label, codename in Permission.objects.filter(
+                    Q(user__id=user_id) | Q(group__user__id=user_id)
+                ).values_list("content_type__app_label", "codename")
+            }
+        ),
+    )
+    return bundle
+
+
+def _bundle_key(user_id: int) -> str:
+    return f"roles:{user_id}"
+
+
+def _version_key(user_id: int) -> str:
+    return f"roles:version:{user_id}"
+
+
+def get_roles(user_id: int, session: Optional[SessionBase] = None) -> Roles:
+    """Resolve roles of a user through the session and process caches.
+    Both caches keep a bundle for `ROLES_CACHE_TTL` seconds
+    and drop it once the user's roles version changes."""
+    version = cache.get(_version_key(user_id), 0)
+    now = time.time()
+    if session is not None:
+        cached = session.get(ROLES_SESSION_KEY)
+        if (
+            cached
+            and cached["user_id"] == user_id
+            and cached["version"] == version
+            and cached["expires_at"] > now
+        ):
+            return Roles(cached["bundle"])
+    cached = cache.get(_bundle_key(user_id))
+    if cached and cached["version"] == version:
+        bundle = cached["bundle"]
+    else:
+        bundle = load_roles(user_id)
+        cache.set(
+            _bundle_key(user_id),
+            {"version": version, "bundle": bundle},
+            settings.ROLES_CACHE_TTL,
+        )
+    if session is not None:
+        session[ROLES_SESSION_KEY] = {
+            "user_id": user_id,
+            "version": version,
+            "expires_at": now + settings.ROLES_CACHE_TTL,
+            "bundle": bundle,
+        }
+    return Roles(bundle)
+
+
+def invalidate_roles(*user_ids: int) -> None:
+    """Drop cached roles of users.
+    Sessions notice the new version on their next lookup."""
+    for user_id in user_ids:
+        try:
+            cache.incr(_version_key(user_id))
+        except ValueError:
+            cache.set(_version_key(user_id), 1, None)
+        cache.delete(_bundle_key(user_id))
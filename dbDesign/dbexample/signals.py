@@ -0,0 +1,228 @@
+from typing import Iterable, Tuple
+
+from django.contrib.auth.models import Group
+from django.db.models import Count, Q
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from .models import (
+    Customer,
+    Moderator,
+    Product,
+    ProductCategory,
+    ProductCategoryCounter,
+    ProductVersion,
+    User,
+)
+from .roles import invalidate_roles
+
+ProductCategoryLink = Product.categories.through
+Favorite = ProductVersion.favorited_by.through
+
+
+def _active_totals(product_ids: Iterable[int]) -> Tuple[int, int]:
+    """Return number of active products among `product_ids`
+    and number of their active versions."""
+    totals = Product.objects.filter(
+        id__in=product_ids, is_active=True
+    ).aggregate(
+        products=Count("id", distinct=True),
+        versions=Count("versions", filter=Q(versions__is_active=True)),
+    )
+    return totals["products"], totals["versions"]
+
+
+def _active_product_categories(product_id: int) -> list:
+    """Return category ids of a product if the product is active."""
+    return list(
+        ProductCategoryLink.objects.filter(
+            product_id=product_id, product__is_active=True
+        ).values_list("productcategory_id", flat=True)
+    )
+
+
+def _stash_is_active(sender, instance, update_fields=None, **kwargs) -> None:
+    """Remember `is_active` value stored in db before the instance is saved."""
+    instance._is_active_was = None
+    if instance.pk is None or instance._state.adding:
+        return
+    if update_fields is not None and "is_active" not in update_fields:
+        return
+    instance._is_active_was = (
+        sender.objects.filter(pk=instance.pk)
+        .values_list("is_active", flat=True)
+        .first()
+    )
+
+
+@receiver(post_save, sender=ProductCategory)
+def create_category_counter(sender, instance, created, **kwargs):
+    if created:
+        ProductCategoryCounter.objects.get_or_create(category=instance)
+
+
+@receiver(m2m_changed, sender=ProductCategoryLink)
+def product_categories_changed(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    """Shift category counters when products and categories get linked.
+    Removals are counted before the links are gone, additions after
+    the links are created (`pk_set` then holds only new links)."""
+    if action not in ("post_add", "pre_remove", "pre_clear"):
+        return
+    links = sender.objects.all()
+    if reverse:
+        links = links.filter(productcategory_id=instance.pk)
+        if pk_set is not None:
+            links = links.filter(product_id__in=pk_set)
+    else:
+        links = links.filter(product_id=instance.pk)
+        if pk_set is not None:
+            links = links.filter(productcategory_id__in=pk_set)
+    sign = 1 if action == "post_add" else -1
+    if reverse:
+        product_ids = list(links.values_list("product_id", flat=True))
+        products, versions = _active_totals(product_ids)
+        ProductCategoryCounter.objects.apply_delta(
+            (instance.pk,), sign * products, sign * versions
+        )
+    else:
+        category_ids = list(links.values_list("productcategory_id", flat=True))
+        products, versions = _active_totals((instance.pk,))
+        ProductCategoryCounter.objects.apply_delta(
+            category_ids, sign * products, sign * versions
+        )
+
+
+pre_save.connect(_stash_is_active, sender=Product)
+pre_save.connect(_stash_is_active, sender=ProductVersion)
+
+
+@receiver(post_save, sender=Product)
+def product_active_status_changed(sender, instance, created, **kwargs):
+    was_active = getattr(instance, "_is_active_was", None)
+    if created or was_active is None or was_active == instance.is_active:
+        return
+    sign = 1 if instance.is_active else -1
+    versions = instance.versions.filter(is_active=True).count()
+    category_ids = ProductCategoryLink.objects.filter(
+        product_id=instance.pk
+    ).values_list("productcategory_id", flat=True)
+    ProductCategoryCounter.objects.apply_delta(
+        category_ids, sign, sign * versions
+    )
+
+
+@receiver(post_save, sender=ProductVersion)
+def product_version_active_status_changed(
+    sender, instance, created, **kwargs
+):
+    if created:
+        if not instance.is_active:
+            return
+        sign = 1
+    else:
+        was_active = getattr(instance, "_is_active_was", None)
+        if was_active is None or was_active == instance.is_active:
+            return
+        sign = 1 if instance.is_active else -1
+    ProductCategoryCounter.objects.apply_delta(
+        _active_product_categories(instance.product_id), versions=sign
+    )
+
+
+@receiver(pre_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    """Versions of the product are subtracted by their own handler."""
+    ProductCategoryCounter.objects.apply_delta(
+        _active_product_categories(instance.pk), products=-1
+    )
+
+
+@receiver(pre_delete, sender=ProductVersion)
+def product_version_deleted(sender, instance, **kwargs):
+    if instance.is_active:
+        ProductCategoryCounter.objects.apply_delta(
+            _active_product_categories(instance.product_id), versions=-1
+        )
+
+
+@receiver(m2m_changed, sender=Favorite)
+def favorites_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep `ProductVersion.favorites_count` in sync with favorites."""
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            ProductVersion.objects.refresh_favorites_count((instance.pk,))
+    elif action == "pre_clear":
+        instance._cleared_favorites = list(
+            sender.objects.filter(customer_id=instance.pk).values_list(
+                "productversion_id", flat=True
+            )
+        )
+    elif action == "post_clear":
+        ProductVersion.objects.refresh_favorites_count(
+            getattr(instance, "_cleared_favorites", ())
+        )
+    elif action in ("post_add", "post_remove"):
+        ProductVersion.objects.refresh_favorites_count(pk_set)
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+@receiver(post_save, sender=Moderator)
+@receiver(post_delete, sender=Moderator)
+def role_changed(sender, instance, **kwargs):
+    invalidate_roles(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    """Only superuser status of the user itself is part of roles."""
+    if update_fields is None or "is_superuser" in update_fields:
+        invalidate_roles(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def user_access_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Invalidate roles of users whose groups or permissions changed.
+    On reverse side `instance` is a group or a permission."""
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            invalidate_roles(instance.pk)
+    elif action == "pre_clear":
+        target = "group" if sender is User.groups.through else "permission"
+        instance._cleared_users = list(
+            sender.objects.filter(**{f"{target}_id": instance.pk}).values_list(
+                "user_id", flat=True
+            )
+        )
+    elif action == "post_clear":
+        invalidate_roles(*getattr(instance, "_cleared_users", ()))
+    elif action in ("post_add", "post_remove"):
+        invalidate_roles(*pk_set)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    """Invalidate roles of all members of groups whose permissions changed.
+    On reverse side `instance` is a permission."""
+    if not reverse:
+        if action not in ("post_add", "post_remove", "post_clear"):
+            return
+        members = User.objects.filter(groups__id=instance.pk)
+    elif action == "pre_clear":
+        members = User.objects.filter(groups__permissions__id=instance.pk)
+    elif action in ("post_add", "post_remove"):
+        members = User.objects.filter(groups__id__in=pk_set)
+    else:
+        return
+    invalidate_roles(*members.values_list("id", flat=True).distinct())
@@ -1,9 +1,12 @@
 import random
+from collections import defaultdict
 
 import factory
 from dbexample import models
+from dbexample.utils import chunked
 from django.contrib.auth import get_user_model
 from django.utils import timezone
+from django.utils.text import slugify
 from faker import Faker
 
 fake = Faker()
@@ -15,6 +18,7 @@ ATTRIBUTE_NUM = 7
 USER_NUM = CATEGORY_NUM = VENDOR_NUM = PRODUCT_NUM = 10
 BRAND_NUM = 14
 PRODUCT_VERSION_NUM = 30
+BULK_BATCH_SIZE = 2000
 
 discount_starts_at = (
     "2022-07-02 20:35:19.799050+00:00",
@@ -239,8 +243,7 @@ class ProductVersionFactory(factory.django.DjangoModelFactory):
 
         if extracted:
             extracted = randomize(extracted, USER_NUM)
-            for user in extracted:
-                self.favorited_by.add(user)
+            self.favorited_by.add(*extracted)
 
 
 class StockFactory(factory.django.DjangoModelFactory):
@@ -257,3 +260,165 @@ class CartFactory(factory.django.DjangoModelFactory):
         model = models.Cart
 
     customer = factory.Iterator(models.Customer.objects.all())
+
+
+class IdPool:
+    """Objects of a model drawn at random from ids loaded with one query.
+    Drawn objects hold only a primary key and serve as FK values."""
+
+    pools = []
+
+    def __init__(self, model, optional=False):
+        self.model = model
+        self.optional = optional
+        self._ids = None
+        self.pools.append(self)
+
+    def __call__(self):
+        if self._ids is None:
+            self._ids = list(
+                self.model.objects.values_list("id", flat=True)
+            )
+            if self.optional:
+                self._ids.append(None)
+        pk = random.choice(self._ids)
+        return None if pk is None else self.model(pk=pk)
+
+    def reset(self):
+        """Forget loaded ids so the next draw sees current rows."""
+        self._ids = None
+
+    @classmethod
+    def reset_all(cls):
+        for pool in cls.pools:
+            pool.reset()
+
+
+class AttributeNamesPool:
+    """Attribute names of product types by product id
+    loaded with one query."""
+
+    def __init__(self):
+        self._names = None
+        IdPool.pools.append(self)
+
+    def __call__(self, product_id):
+        if self._names is None:
+            self._names = defaultdict(list)
+            for pk, name in models.Product.objects.filter(
+                p_type__attributes__isnull=False
+            ).values_list("id", "p_type__attributes__name"):
+                self._names[pk].append(name)
+        return {
+            name: random.choice(ATTR_VALUES)
+            for name in self._names[product_id]
+        }
+
+    def reset(self):
+        """Forget loaded names so the next draw sees current products."""
+        self._names = None
+
+
+product_type_pool = IdPool(models.ProductType)
+brand_pool = IdPool(models.Brand)
+product_pool = IdPool(models.Product)
+discount_pool = IdPool(models.ProductDiscount, optional=True)
+attribute_names_pool = AttributeNamesPool()
+
+
+class BulkFactoryMixin:
+    """Bulk strategy: `create_bulk` builds objects in memory
+    and inserts them with `bulk_create` in batches. FKs are drawn from
+    id pools, many-to-many links are inserted into through tables."""
+
+    @classmethod
+    def create_bulk(cls, size, batch_size=BULK_BATCH_SIZE, **kwargs):
+        IdPool.reset_all()
+        related = {
+            name: kwargs.pop(name)
+            for name in cls._bulk_related
+            if name in kwargs
+        }
+        created = []
+        for start in range(0, size, batch_size):
+            objs = cls._bulk_save(
+                cls.build_batch(min(batch_size, size - start), **kwargs)
+            )
+            cls._bulk_link(objs, **related)
+            created.extend(objs)
+        return created
+
+    @classmethod
+    def _bulk_save(cls, objs):
+        return cls._meta.model.objects.bulk_create(objs)
+
+    @classmethod
+    def _bulk_link(cls, objs, **related):
+        pass
+
+
+class BulkProductFactory(BulkFactoryMixin, ProductFactory):
+    _bulk_related = ("categories",)
+
+    p_type = factory.LazyFunction(product_type_pool)
+    brand = factory.LazyFunction(brand_pool)
+    slug = factory.LazyAttribute(lambda obj: slugify(obj.name))
+
+    @classmethod
+    def _bulk_link(cls, products, categories=None):
+        if not categories:
+            return
+        Link = models.Product.categories.through
+        Link.objects.bulk_create(
+            Link(product_id=product.pk, productcategory_id=category.pk)
+            for product in products
+            for category in randomize(categories, CATEGORY_NUM)
+        )
+        models.ProductCategoryCounter.objects.refresh(
+            category.pk for category in categories
+        )
+
+
+class BulkProductVersionFactory(BulkFactoryMixin, ProductVersionFactory):
+    """Versions are saved with `bulk_create_versions`
+    which also creates their stock and skus."""
+
+    _bulk_related = ("favorited_by",)
+
+    product = factory.LazyFunction(product_pool)
+    attrs = factory.LazyAttribute(
+        lambda obj: attribute_names_pool(obj.product.pk)
+    )
+    discount = factory.LazyFunction(discount_pool)
+
+    @classmethod
+    def _bulk_save(cls, versions):
+        return models.ProductVersion.objects.bulk_create_versions(
+            {
+                "product_id": version.product_id,
+                "name": version.name,
+                "attrs": version.attrs,
+                "regular_price": version.regular_price,
+                "discount_id": version.discount_id,
+                "is_active": version.is_active,
+                "_view_count": version._view_count,
+                "made_in": version.made_in,
+                "amount": fake.pyint(max_value=999),
+            }
+            for version in versions
+        )
+
+    @classmethod
+    def _bulk_link(cls, versions, favorited_by=None):
+        if not favorited_by:
+            return
+        Favorite = models.ProductVersion.favorited_by.through
+        Favorite.objects.bulk_create(
+            Favorite(productversion_id=version.pk, customer_id=customer.pk)
+            for version in versions
+            for customer in randomize(favorited_by, USER_NUM)
+        )
+        for chunk in chunked(versions, BULK_BATCH_SIZE):
+            models.ProductVersion.objects.refresh_favorites_count(
+                version.pk for version in chunk
+            )
@@ -0,0 +1,95 @@
+"""Snapshots of test databases made with SQLite online backup API.
+
+A dataset is built once per test process, copied into an in-memory
+snapshot and copied back into the test database before every test class
+that needs it. Every pytest-xdist worker runs its own process with its own
+test database, so it builds and keeps its own snapshots."""
+import os
+import sqlite3
+from typing import Callable, Dict, Tuple
+
+from django.db import connections
+
+BASELINE_SNAPSHOT = "baseline"
+
+_snapshots: Dict[Tuple[str, str, str], sqlite3.Connection] = {}
+
+
+def _key(name: str, using: str) -> Tuple[str, str, str]:
+    return (
+        os.environ.get("PYTEST_XDIST_WORKER", "main"),
+        connections[using].settings_dict["NAME"],
+        name,
+    )
+
+
+def _raw_connection(using: str) -> sqlite3.Connection:
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        raise NotImplementedError(
+            f"Snapshots need a sqlite database, not {connection.vendor}"
+        )
+    if connection.in_atomic_block:
+        raise RuntimeError("Snapshots cannot be copied inside a transaction")
+    connection.ensure_connection()
+    return connection.connection
+
+
+def take_snapshot(name: str, using: str = "default") -> None:
+    """Copy current database contents into snapshot `name`."""
+    snapshot = sqlite3.connect(":memory:", check_same_thread=False)
+    _raw_connection(using).backup(snapshot)
+    _snapshots[_key(name, using)] = snapshot
+
+
+def restore_snapshot(name: str, using: str = "default") -> bool:
+    """Replace database contents with snapshot `name`.
+    Return False if there is no such snapshot."""
+    snapshot = _snapshots.get(_key(name, using))
+    if snapshot is None:
+        return False
+    snapshot.backup(_raw_connection(using))
+    return True
+
+
+def load_snapshot(
+    name: str, build: Callable[[], None], using: str = "default"
+) -> None:
+    """Restore snapshot `name`, building it on first use.
+    Contents of the database before the first build are kept
+    as the baseline snapshot."""
+    if restore_snapshot(name, using):
+        return
+    if not restore_snapshot(BASELINE_SNAPSHOT, using):
+        take_snapshot(BASELINE_SNAPSHOT, using)
+    build()
+    take_snapshot(name, using)
+
+
+class SnapshotTestMixin:
+    """Restore a snapshot of the default database before class-wide
+    transaction of a `TestCase` is started and return to the baseline
+    after it is rolled back.
+    Subclasses define `snapshot_name`, `build_snapshot` which creates
+    the data and `load_snapshot` which reads it into class attributes."""
+
+    snapshot_name: str
+
+    @classmethod
+    def setUpClass(cls):
+        load_snapshot(cls.snapshot_name, cls.build_snapshot)
+        super().setUpClass()
+        cls.load_snapshot()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        restore_snapshot(BASELINE_SNAPSHOT)
+
+    @classmethod
+    def build_snapshot(cls) -> None:
+        raise NotImplementedError
+
+    @classmethod
+    def load_snapshot(cls) -> None:
+        pass
@@ -1,14 +1,31 @@
+import bisect
+import csv
+import datetime as dt
+import json
 import random
+import tempfile
 from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
+from django.contrib.auth.models import Group, Permission
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
 from django.db import IntegrityError, connection, reset_queries
-from django.test import TestCase
+from django.db.models import F
+from django.test import TestCase, override_settings
 from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
+from .. import exports, imports, metrics, paginators, provisioning
 from .. import models as models
 from ..exceptions import NotEnoughProductLeft, TooBigToAdd
+from ..roles import ROLES_SESSION_KEY, get_roles
 from .fixtures import factories
+from .fixtures.snapshots import SnapshotTestMixin
 
 PRODUCT_TYPE_NUM = DISCOUNT_NUM = 5
 ATTRIBUTE_NUM = 7
@@ -17,60 +34,90 @@ BRAND_NUM = 14
 PRODUCT_VERSION_NUM = 30
 
 
+def create_users():
+    users = factories.UserFactory.create_batch(USER_NUM)
+    customers = factories.CustomerFactory.create_batch(USER_NUM)
+    for user in users:
+        user.set_password(user.password)
+        user.save(update_fields=("password",))
+    return users, customers
+
+
+def create_vendors_brands():
+    vendors = factories.VendorFactory.create_batch(VENDOR_NUM)
+    brands = factories.BrandFactory.create_batch(BRAND_NUM)
+    return vendors, brands
+
+
+def create_attributes_types_categories():
+    attributes = factories.ProductAttributeFactory.create_batch(ATTRIBUTE_NUM)
+    p_types = factories.ProductTypeFactory.create_batch(
+        PRODUCT_TYPE_NUM, attributes=attributes
+    )
+    categories = factories.ProductCategoryFactory.create_batch(CATEGORY_NUM)
+    return attributes, p_types, categories
+
+
 class UserCustomerFactoryMixin:
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
-        cls.users = factories.UserFactory.create_batch(USER_NUM)
-        cls.customers = factories.CustomerFactory.create_batch(USER_NUM)
-        for user in cls.users:
-            user.set_password(user.password)
-            user.save(update_fields=("password",))
+        cls.users, cls.customers = create_users()
 
 
 class VendorsBrandsFactoryMixin:
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
-        cls.vendors = factories.VendorFactory.create_batch(VENDOR_NUM)
-        cls.brands = factories.BrandFactory.create_batch(BRAND_NUM)
+        cls.vendors, cls.brands = create_vendors_brands()
 
 
 class AttributeProdTypeCategoryMixin:
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
-        cls.attributes = factories.ProductAttributeFactory.create_batch(
-            ATTRIBUTE_NUM
-        )
-        cls.p_types = factories.ProductTypeFactory.create_batch(
-            PRODUCT_TYPE_NUM, attributes=cls.attributes
-        )
-        cls.categories = factories.ProductCategoryFactory.create_batch(
-            CATEGORY_NUM
-        )
+        (
+            cls.attributes,
+            cls.p_types,
+            cls.categories,
+        ) = create_attributes_types_categories()
 
 
-class DataFactoryMixin(
-    UserCustomerFactoryMixin,
-    VendorsBrandsFactoryMixin,
-    AttributeProdTypeCategoryMixin,
-):
+class DataFactoryMixin(SnapshotTestMixin):
+    """Whole catalog with customers built once per test process
+    and restored from a snapshot for every test class."""
+
+    snapshot_name = "catalog"
+
     @classmethod
-    def setUpClass(cls):
-        super().setUpClass()
-        cls.products = factories.ProductFactory.create_batch(
-            PRODUCT_NUM, categories=cls.categories
-        )
-        cls.discounts = factories.ProductDiscountFactory.create_batch(
-            DISCOUNT_NUM
+    def build_snapshot(cls):
+        _, customers = create_users()
+        create_vendors_brands()
+        _, _, categories = create_attributes_types_categories()
+        factories.ProductFactory.create_batch(
+            PRODUCT_NUM, categories=categories
         )
-        cls.product_verions = factories.ProductVersionFactory.create_batch(
-            PRODUCT_VERSION_NUM, favorited_by=cls.customers
+        factories.ProductDiscountFactory.create_batch(DISCOUNT_NUM)
+        factories.ProductVersionFactory.create_batch(
+            PRODUCT_VERSION_NUM, favorited_by=customers
         )
-        cls.stockpile = factories.StockFactory.create_batch(
-            PRODUCT_VERSION_NUM
+        factories.StockFactory.create_batch(PRODUCT_VERSION_NUM)
+
+    @classmethod
+    def load_snapshot(cls):
+        cls.users = list(models.User.objects.order_by("id"))
+        cls.customers = list(models.Customer.objects.order_by("id"))
+        cls.vendors = list(models.Vendor.objects.order_by("id"))
+        cls.brands = list(models.Brand.objects.order_by("id"))
+        cls.attributes = list(models.ProductAttribute.objects.order_by("id"))
+        cls.p_types = list(models.ProductType.objects.order_by("id"))
+        cls.categories = list(models.ProductCategory.objects.order_by("id"))
+        cls.products = list(models.Product.objects.order_by("id"))
+        cls.discounts = list(models.ProductDiscount.objects.order_by("id"))
+        cls.product_verions = list(
+            models.ProductVersion.objects.order_by("id")
         )
+        cls.stockpile = list(models.Stock.objects.order_by("id"))
 
 
 class UserModelTestCase(UserCustomerFactoryMixin, TestCase):
@@ -673,3 +720,1586 @@ class CartOrderModelsTestCase(DataFactoryMixin, TestCase):
 # c = Cart.objects.first()
 # c2 = Cart.objects.last()
 # from django.db import connection, reset_queries
+
+
+class ProductCategoryCounterTestCase(DataFactoryMixin, TestCase):
+    def setUp(self):
+        self.category = self.categories[0]
+
+    def expected_counts(self, category):
+        products = category.products.filter(is_active=True)
+        versions = models.ProductVersion.objects.filter(
+            product__in=products, is_active=True
+        )
+        return products.count(), versions.count()
+
+    def counts(self, category):
+        counter = models.ProductCategoryCounter.objects.get(category=category)
+        return counter.active_products, counter.active_versions
+
+    def test_counters_match_catalog_after_generation(self):
+        for category in self.categories:
+            self.assertEqual(
+                self.counts(category), self.expected_counts(category)
+            )
+
+    def test_menu_is_read_in_single_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            menu = [
+                (c.category.name, c.active_products)
+                for c in models.ProductCategoryCounter.objects.menu()
+            ]
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(len(menu), CATEGORY_NUM)
+
+    def test_product_version_active_flip_updates_counters(self):
+        product = factories.ProductFactory.create(is_active=True)
+        product.categories.add(self.category)
+        version = factories.ProductVersionFactory.create(
+            product=product, is_active=True
+        )
+        self.assertEqual(
+            self.counts(self.category), self.expected_counts(self.category)
+        )
+        version.is_active = False
+        version.save()
+        self.assertEqual(
+            self.counts(self.category), self.expected_counts(self.category)
+        )
+
+    def test_product_active_flip_updates_counters(self):
+        product = self.category.products.first()
+        product.is_active = not product.is_active
+        product.save()
+        self.assertEqual(
+            self.counts(self.category), self.expected_counts(self.category)
+        )
+
+    def test_category_link_changes_update_counters(self):
+        product = factories.ProductFactory.create(is_active=True)
+        factories.ProductVersionFactory.create(product=product, is_active=True)
+        product.categories.add(*self.categories[:3])
+        self.category.products.remove(product)
+        for category in self.categories[:3]:
+            self.assertEqual(
+                self.counts(category), self.expected_counts(category)
+            )
+        product.categories.clear()
+        for category in self.categories[:3]:
+            self.assertEqual(
+                self.counts(category), self.expected_counts(category)
+            )
+
+    def test_rebuild_command_fixes_drifted_counters(self):
+        models.ProductCategoryCounter.objects.update(
+            active_products=0, active_versions=-1
+        )
+        call_command("rebuild_category_counts", stdout=StringIO())
+        for category in self.categories:
+            self.assertEqual(
+                self.counts(category), self.expected_counts(category)
+            )
+
+
+class BestSellerTestCase(DataFactoryMixin, TestCase):
+    def setUp(self):
+        self.customer = self.customers[0]
+        self.cart = models.Cart.objects.create(customer=self.customer)
+        self.prod_version = models.ProductVersion.objects.filter(
+            is_active=True, stock__isnull=False
+        ).first()
+        self.prod_version.stock.set(100)
+
+    def expected_board(self, scope_filter=None):
+        stockpile = models.Stock.objects.filter(items_sold__gt=0)
+        if scope_filter:
+            stockpile = stockpile.filter(**scope_filter)
+        return list(
+            stockpile.order_by("-items_sold", "p_version_id").values_list(
+                "p_version_id", "items_sold"
+            )[: models.BEST_SELLERS_TOP_N]
+        )
+
+    def board(self, scope, scope_id=0):
+        return [
+            (entry.p_version_id, entry.items_sold)
+            for entry in models.BestSeller.objects.top(scope, scope_id)
+        ]
+
+    def order(self, quantity):
+        models.CartItem.objects.create_from_product_version(
+            self.customer.id, self.prod_version.id, quantity=quantity
+        )
+        return models.Order.objects.create_from_cart(self.customer.id)
+
+    def test_checkout_places_version_on_boards(self):
+        self.order(3)
+        brand_id = self.prod_version.product.brand_id
+        self.assertEqual(self.board("overall"), self.expected_board())
+        self.assertEqual(
+            self.board("brand", brand_id),
+            self.expected_board({"p_version__product__brand_id": brand_id}),
+        )
+        for category in self.prod_version.product.categories.all():
+            self.assertEqual(
+                self.board("category", category.id),
+                self.expected_board(
+                    {"p_version__product__categories": category.id}
+                ),
+            )
+
+    def test_order_cancel_updates_boards(self):
+        order = self.order(3)
+        order.cancel("customer")
+        self.assertEqual(self.board("overall"), self.expected_board())
+
+    def test_top_returns_ranked_versions_with_prices_in_one_query(self):
+        self.order(2)
+        with CaptureQueriesContext(connection) as ctx:
+            top = [
+                (entry.rank, entry.p_version.regular_price)
+                for entry in models.BestSeller.objects.top(limit=5)
+            ]
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(top[0][0], 1)
+
+    def test_rebuild_command_recomputes_boards(self):
+        models.Stock.objects.filter(
+            id__in=[s.id for s in self.stockpile[:12]]
+        ).update(items_sold=F("amount") + 1)
+        call_command("rebuild_best_sellers", stdout=StringIO())
+        self.assertEqual(self.board("overall"), self.expected_board())
+        self.assertEqual(
+            len(self.board("overall")), models.BEST_SELLERS_TOP_N
+        )
+
+
+class FavoritesTestCase(DataFactoryMixin, TestCase):
+    def setUp(self):
+        self.customer = self.customers[0]
+        self.versions = models.ProductVersion.objects.all()[:5]
+
+    def assertFavoritesCountsConsistent(self):
+        for version in models.ProductVersion.objects.all():
+            self.assertEqual(
+                version.favorites_count, version.favorited_by.count()
+            )
+
+    def test_favorites_count_synced_after_generation(self):
+        self.assertFavoritesCountsConsistent()
+
+    def test_favorites_count_synced_on_related_manager_changes(self):
+        version = self.versions[0]
+        version.favorited_by.clear()
+        self.assertFavoritesCountsConsistent()
+        self.customer.favorites.add(*self.versions)
+        self.assertFavoritesCountsConsistent()
+        self.customer.favorites.remove(self.versions[1])
+        self.assertFavoritesCountsConsistent()
+        self.customer.favorites.clear()
+        self.assertFavoritesCountsConsistent()
+
+    def test_bulk_add_and_remove_favorites(self):
+        version_ids = [v.id for v in self.versions]
+        with CaptureQueriesContext(connection) as ctx:
+            self.customer.add_favorites(version_ids)
+        self.assertLessEqual(len(ctx.captured_queries), 4)
+        self.assertEqual(
+            set(self.customer.favorites.values_list("id", flat=True))
+            & set(version_ids),
+            set(version_ids),
+        )
+        self.assertFavoritesCountsConsistent()
+        removed = self.customer.remove_favorites(version_ids)
+        self.assertEqual(removed, len(version_ids))
+        self.assertFalse(self.customer.favorites.filter(id__in=version_ids))
+        self.assertFavoritesCountsConsistent()
+
+    def test_most_favorited_per_category(self):
+        category = self.categories[0]
+        result = list(
+            models.ProductVersion.objects.most_favorited(category.id)
+        )
+        counts = [version.favorites_count for version in result]
+        self.assertEqual(counts, sorted(counts, reverse=True))
+        self.assertTrue(
+            all(
+                version.product.categories.filter(id=category.id).exists()
+                for version in result
+            )
+        )
+
+
+class DiscountCampaignTestCase(DataFactoryMixin, TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.discount = models.ProductDiscount.objects.create(
+            label="campaign",
+            rate=15,
+            starts_at=now - dt.timedelta(days=1),
+            ends_at=now + dt.timedelta(days=1),
+            is_active=True,
+        )
+        self.campaign = models.DiscountCampaign.objects.create(
+            label="sale", discount=self.discount, min_price=Decimal("10")
+        )
+        self.brands = self.brands[:4]
+        self.campaign.brands.add(*self.brands)
+        self.expected = models.ProductVersion.objects.filter(
+            product__brand__in=self.brands, regular_price__gte=10
+        )
+
+    def test_dry_run_only_counts_matching_versions(self):
+        matched = self.campaign.apply(dry_run=True)
+        self.assertEqual(matched, self.expected.count())
+        self.assertFalse(
+            models.ProductVersion.objects.filter(discount=self.discount)
+        )
+
+    def test_apply_assigns_discount_with_single_update(self):
+        others = dict(
+            models.ProductVersion.objects.exclude(
+                id__in=self.expected.values("id")
+            ).values_list("id", "discount_id")
+        )
+        self.assertTrue(others)
+        with CaptureQueriesContext(connection) as ctx:
+            updated = self.campaign.apply()
+        version_updates = [
+            query
+            for query in ctx.captured_queries
+            if query["sql"].startswith('UPDATE "dbexample_productversion"')
+        ]
+        self.assertEqual(len(version_updates), 1)
+        self.assertTrue(updated)
+        self.assertEqual(updated, self.expected.count())
+        self.assertEqual(
+            set(self.expected.values_list("id", flat=True)),
+            set(
+                models.ProductVersion.objects.filter(
+                    discount=self.discount
+                ).values_list("id", flat=True)
+            ),
+        )
+        self.assertEqual(
+            dict(
+                models.ProductVersion.objects.filter(
+                    id__in=others
+                ).values_list("id", "discount_id")
+            ),
+            others,
+        )
+        self.campaign.refresh_from_db()
+        self.assertEqual(
+            self.campaign.status,
+            models.DiscountCampaign.CampaignStatus.APPLIED,
+        )
+
+    def test_category_and_product_type_filters(self):
+        categories = self.categories[:2]
+        p_types = self.p_types[:2]
+        versions = models.ProductVersion.objects.for_campaign(
+            category_ids=[c.id for c in categories],
+            p_type_ids=[p.id for p in p_types],
+        )
+        expected = models.ProductVersion.objects.filter(
+            product__categories__in=categories, product__p_type__in=p_types
+        ).distinct()
+        self.assertEqual(set(versions), set(expected))
+
+    def test_run_due_applies_started_and_removes_ended_campaigns(self):
+        assigned, released = models.DiscountCampaign.objects.run_due()
+        self.assertEqual(assigned, self.expected.count())
+        self.assertEqual(released, 0)
+        self.campaign.refresh_from_db()
+        self.assertEqual(
+            self.campaign.status,
+            models.DiscountCampaign.CampaignStatus.APPLIED,
+        )
+        self.discount.ends_at = timezone.now()
+        self.discount.save()
+        call_command("run_discount_campaigns", stdout=StringIO())
+        self.campaign.refresh_from_db()
+        self.assertEqual(
+            self.campaign.status,
+            models.DiscountCampaign.CampaignStatus.FINISHED,
+        )
+        self.assertFalse(
+            models.ProductVersion.objects.filter(discount=self.discount)
+        )
+
+    def test_apply_inactive_discount_raises_error(self):
+        self.discount.is_active = False
+        self.discount.save()
+        with self.assertRaises(ValidationError):
+            self.campaign.apply()
+
+
+class BulkSkuAssignmentTestCase(DataFactoryMixin, TestCase):
+    def test_assign_skus_fills_empty_skus(self):
+        models.ProductVersion.objects.update(sku="")
+        assigned, collisions = models.ProductVersion.objects.assign_skus(
+            chunk_size=7
+        )
+        self.assertEqual(assigned, PRODUCT_VERSION_NUM)
+        self.assertEqual(collisions, [])
+        for version in models.ProductVersion.objects.all():
+            self.assertEqual(version.sku, version._generate_sku())
+
+    def test_assign_skus_uses_constant_queries_per_chunk(self):
+        models.ProductVersion.objects.update(sku="")
+        with CaptureQueriesContext(connection) as ctx:
+            models.ProductVersion.objects.assign_skus(
+                chunk_size=PRODUCT_VERSION_NUM
+            )
+        # select chunk, check taken skus, update, select empty next chunk
+        # plus savepoint queries
+        self.assertLessEqual(len(ctx.captured_queries), 6)
+
+    def test_skus_do_not_collide_past_two_digit_ids(self):
+        month = dt.date(2022, 10, 1)
+        build_sku = models.ProductVersion.build_sku
+        self.assertNotEqual(
+            build_sku(1234, 5, month), build_sku(123, 45, month)
+        )
+        self.assertNotEqual(
+            build_sku(1, 100, month), build_sku(11, 0, month)
+        )
+
+    def test_taken_skus_are_reported_as_collisions(self):
+        versions = list(models.ProductVersion.objects.order_by("id")[:2])
+        models.ProductVersion.objects.update(sku="")
+        models.ProductVersion.objects.filter(id=versions[0].id).update(
+            sku=versions[1]._generate_sku()
+        )
+        assigned, collisions = models.ProductVersion.objects.assign_skus()
+        self.assertEqual(collisions, [versions[1].id])
+        self.assertEqual(assigned, PRODUCT_VERSION_NUM - 2)
+
+    def test_assign_skus_command(self):
+        models.ProductVersion.objects.update(sku="")
+        out = StringIO()
+        call_command("assign_skus", stdout=out)
+        self.assertIn(str(PRODUCT_VERSION_NUM), out.getvalue())
+        self.assertFalse(models.ProductVersion.objects.filter(sku=""))
+
+
+class BulkCreateVersionsTestCase(DataFactoryMixin, TestCase):
+    def rows(self, number, start=0):
+        return [
+            {
+                "product": self.products[i % 2],
+                "name": f"bulk version {start + i}",
+                "attrs": {"color": "red"},
+                "regular_price": Decimal("100.50"),
+                "is_active": True,
+                "made_in": "Russia",
+                "amount": i,
+            }
+            for i in range(number)
+        ]
+
+    def test_versions_created_with_names_stock_and_skus(self):
+        versions = models.ProductVersion.objects.bulk_create_versions(
+            self.rows(5)
+        )
+        self.assertEqual(len(versions), 5)
+        for i, version in enumerate(versions):
+            version = models.ProductVersion.objects.select_related(
+                "stock", "product"
+            ).get(id=version.id)
+            self.assertEqual(
+                version.name, f"{version.product.name} bulk version {i}"
+            )
+            self.assertEqual(version.stock.amount, i)
+            self.assertEqual(version.stock.unit, "pcs")
+            self.assertEqual(version.sku, version._generate_sku())
+
+    def test_number_of_queries_does_not_depend_on_chunk_length(self):
+        with CaptureQueriesContext(connection) as ctx:
+            models.ProductVersion.objects.bulk_create_versions(self.rows(2))
+        few = len(ctx.captured_queries)
+        with CaptureQueriesContext(connection) as ctx:
+            models.ProductVersion.objects.bulk_create_versions(
+                self.rows(40, start=2)
+            )
+        self.assertEqual(len(ctx.captured_queries), few)
+
+    def test_category_counters_updated(self):
+        product = self.products[0]
+        product.is_active = True
+        product.save()
+        models.ProductVersion.objects.bulk_create_versions(self.rows(4))
+        for category in product.categories.all():
+            counter = models.ProductCategoryCounter.objects.get(
+                category=category
+            )
+            self.assertEqual(
+                counter.active_versions,
+                models.ProductVersion.objects.filter(
+                    product__categories=category,
+                    product__is_active=True,
+                    is_active=True,
+                ).count(),
+            )
+
+    def test_unknown_product_raises_error(self):
+        rows = self.rows(1)
+        del rows[0]["product"]
+        rows[0]["product_id"] = 10**6
+        with self.assertRaises(models.Product.DoesNotExist):
+            models.ProductVersion.objects.bulk_create_versions(rows)
+
+    def test_failed_chunk_rolls_back_earlier_chunks(self):
+        count = models.ProductVersion.objects.count()
+        rows = self.rows(3)
+        del rows[2]["product"]
+        rows[2]["product_id"] = 10**6
+        with self.assertRaises(models.Product.DoesNotExist):
+            models.ProductVersion.objects.bulk_create_versions(
+                rows, chunk_size=2
+            )
+        self.assertEqual(models.ProductVersion.objects.count(), count)
+        self.assertFalse(
+            models.ProductVersion.objects.filter(
+                name__contains="bulk version"
+            ).exists()
+        )
+
+
+class StockBulkAdjustTestCase(DataFactoryMixin, TestCase):
+    def setUp(self):
+        self.stockpile = list(models.Stock.objects.order_by("id")[:6])
+        models.Stock.objects.filter(
+            id__in=[s.id for s in self.stockpile]
+        ).update(amount=10)
+
+    def amounts(self):
+        return dict(
+            models.Stock.objects.filter(
+                id__in=[s.id for s in self.stockpile]
+            ).values_list("p_version_id", "amount")
+        )
+
+    def test_bulk_add_in_single_update_per_chunk(self):
+        mapping = {s.p_version_id: 5 for s in self.stockpile}
+        with CaptureQueriesContext(connection) as ctx:
+            updated, failures = models.Stock.objects.bulk_adjust(mapping)
+        update_queries = [
+            q for q in ctx.captured_queries if q["sql"].startswith("UPDATE")
+        ]
+        self.assertEqual(len(update_queries), 1)
+        self.assertEqual(updated, len(self.stockpile))
+        self.assertEqual(failures, {})
+        self.assertTrue(all(a == 15 for a in self.amounts().values()))
+
+    def test_bulk_deduct_reports_rows_without_enough_product(self):
+        first, second = self.stockpile[:2]
+        updated, failures = models.Stock.objects.bulk_adjust(
+            {first.p_version_id: 4, second.p_version_id: 11}, mode="deduct"
+        )
+        self.assertEqual(updated, 1)
+        self.assertIsInstance(
+            failures[second.p_version_id], NotEnoughProductLeft
+        )
+        amounts = self.amounts()
+        self.assertEqual(amounts[first.p_version_id], 6)
+        self.assertEqual(amounts[second.p_version_id], 10)
+
+    def test_bulk_adjust_reports_invalid_values_and_missing_rows(self):
+        first, second, third = self.stockpile[:3]
+        updated, failures = models.Stock.objects.bulk_adjust(
+            {
+                first.p_version_id: models.MAX_AMOUNT_ADDED + 1,
+                second.p_version_id: -1,
+                third.p_version_id: 1,
+                10**6: 1,
+            }
+        )
+        self.assertEqual(updated, 1)
+        self.assertIsInstance(failures[first.p_version_id], TooBigToAdd)
+        self.assertIsInstance(failures[second.p_version_id], ValidationError)
+        self.assertIsInstance(failures[10**6], models.Stock.DoesNotExist)
+
+    def test_bulk_deduct_keeps_reserved_units(self):
+        first, second = self.stockpile[:2]
+        models.Stock.objects.filter(id=second.id).update(reserved=5)
+        updated, failures = models.Stock.objects.bulk_adjust(
+            {first.p_version_id: 6, second.p_version_id: 6}, mode="deduct"
+        )
+        self.assertEqual(updated, 1)
+        self.assertIsInstance(
+            failures[second.p_version_id], NotEnoughProductLeft
+        )
+        self.assertEqual(self.amounts()[second.p_version_id], 10)
+
+    def test_bulk_deduct_outcome_not_taken_from_timestamps(self):
+        first, second = self.stockpile[:2]
+        stamp = models.updated_at()
+        models.Stock.objects.filter(id=second.id).update(**stamp)
+        with mock.patch.object(models, "updated_at", return_value=stamp):
+            updated, failures = models.Stock.objects.bulk_adjust(
+                {first.p_version_id: 4, second.p_version_id: 11},
+                mode="deduct",
+            )
+        self.assertEqual(updated, 1)
+        self.assertEqual(list(failures), [second.p_version_id])
+        self.assertFalse(
+            models.StockMovement.objects.filter(
+                p_version_id=second.p_version_id, amount_delta=-11
+            ).exists()
+        )
+
+    def test_bulk_set(self):
+        mapping = {s.p_version_id: i for i, s in enumerate(self.stockpile)}
+        updated, failures = models.Stock.objects.bulk_adjust(
+            mapping, mode="set", chunk_size=4
+        )
+        self.assertEqual(updated, len(self.stockpile))
+        self.assertEqual(self.amounts(), mapping)
+
+
+class StockMovementLedgerTestCase(DataFactoryMixin, TestCase):
+    def setUp(self):
+        self.customer = self.customers[0]
+        self.cart = models.Cart.objects.create(customer=self.customer)
+        self.prod_version = models.ProductVersion.objects.filter(
+            is_active=True, stock__isnull=False
+        ).first()
+        self.stock = self.prod_version.stock
+        self.stock.set(50)
+
+    def checkout(self, quantity):
+        models.CartItem.objects.create_from_product_version(
+            self.customer.id, self.prod_version.id, quantity=quantity
+        )
+        return models.Order.objects.create_from_cart(self.customer.id)
+
+    def test_stock_changes_are_logged(self):
+        self.stock.add(10)
+        order = self.checkout(4)
+        order.cancel("customer")
+        reasons = list(
+            self.prod_version.stock_movements.order_by("id").values_list(
+                "reason", "amount_delta", "sold_delta", "compacted"
+            )
+        )
+        self.assertEqual(
+            reasons[-3:],
+            [
+                ("restock", 10, 0, True),
+                ("sale", -4, 4, True),
+                ("cancel", 4, -4, True),
+            ],
+        )
+
+    @override_settings(STOCK_LEDGER_DEFERRED=True)
+    def test_deferred_checkout_reads_snapshot_with_tail(self):
+        self.checkout(4)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.amount, 50)
+        self.assertEqual(self.stock.current_amount, 46)
+        annotated = models.Stock.objects.with_pending().get(id=self.stock.id)
+        self.assertEqual(annotated.amount_with_pending, 46)
+        self.assertEqual(
+            annotated.items_sold_with_pending, self.stock.items_sold + 4
+        )
+
+    @override_settings(STOCK_LEDGER_DEFERRED=True)
+    def test_compaction_folds_tail_into_snapshot(self):
+        items_sold = self.stock.items_sold
+        self.checkout(4)
+        self.checkout(6).cancel("seller")
+        out = StringIO()
+        call_command("compact_stock_ledger", stdout=out)
+        self.assertIn("3", out.getvalue())
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.amount, 46)
+        self.assertEqual(self.stock.items_sold, items_sold + 4)
+        self.assertEqual(models.StockMovement.objects.compact(), 0)
+
+    @override_settings(STOCK_LEDGER_DEFERRED=True)
+    def test_deferred_checkout_beyond_stock_raises_error(self):
+        self.checkout(50)
+        models.CartItem.objects.create(
+            cart=self.cart,
+            p_version=self.prod_version,
+            quantity=1,
+            **self.prod_version.to_dict(),
+        )
+        with self.assertRaises(NotEnoughProductLeft):
+            models.Order.objects.create_from_cart(self.customer.id)
+
+    @override_settings(STOCK_LEDGER_DEFERRED=True)
+    def test_deferred_sale_reserved_by_guarded_update(self):
+        self.checkout(46)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.reserved, 46)
+        with self.assertRaises(NotEnoughProductLeft):
+            models.Stock.objects.record_sale(self.prod_version.id, 5)
+        self.assertTrue(
+            models.Stock.objects.record_sale(self.prod_version.id, 4)
+        )
+        self.assertEqual(models.StockMovement.objects.compact(), 2)
+        self.stock.refresh_from_db()
+        self.assertEqual((self.stock.amount, self.stock.reserved), (0, 0))
+
+    @override_settings(STOCK_LEDGER_DEFERRED=True)
+    def test_set_after_pending_sale_not_compacted_twice(self):
+        self.checkout(4)
+        self.stock.set(100)
+        models.StockMovement.objects.compact()
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.amount, 100)
+        self.assertEqual(self.stock.current_amount, 100)
+
+    @override_settings(STOCK_LEDGER_DEFERRED=True)
+    def test_deduct_checks_amount_with_pending_sale(self):
+        self.checkout(4)
+        with self.assertRaises(NotEnoughProductLeft):
+            self.stock.deduct(47)
+        self.stock.deduct(46)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.current_amount, 0)
+
+    @override_settings(STOCK_LEDGER_DEFERRED=True)
+    def test_bulk_set_after_pending_sale_not_compacted_twice(self):
+        self.checkout(4)
+        models.Stock.objects.bulk_adjust({self.prod_version.id: 100}, "set")
+        models.StockMovement.objects.compact()
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.amount, 100)
+
+
+class StockShardTestCase(DataFactoryMixin, TestCase):
+    def setUp(self):
+        self.customer = self.customers[0]
+        self.cart = models.Cart.objects.create(customer=self.customer)
+        self.prod_version = models.ProductVersion.objects.filter(
+            is_active=True, stock__isnull=False
+        ).first()
+        self.stock = self.prod_version.stock
+        self.stock.set(50)
+        self.stock.set_shard_count(4)
+        self.items_sold = self.stock.items_sold
+
+    def checkout(self, quantity):
+        models.CartItem.objects.create_from_product_version(
+            self.customer.id, self.prod_version.id, quantity=quantity
+        )
+        return models.Order.objects.create_from_cart(self.customer.id)
+
+    def test_checkout_writes_to_shard_not_stock_row(self):
+        self.checkout(4)
+        self.checkout(3).cancel("customer")
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.amount, 50)
+        self.assertEqual(self.stock.items_sold, self.items_sold)
+        self.assertEqual(self.stock.current_amount, 46)
+        self.assertEqual(self.stock.current_items_sold, self.items_sold + 4)
+        annotated = models.Stock.objects.with_pending().get(id=self.stock.id)
+        self.assertEqual(annotated.amount_with_pending, 46)
+        self.assertEqual(self.stock.shards.count(), 4)
+
+    def test_shards_reserve_only_allotted_units(self):
+        self.assertEqual(
+            sorted(self.stock.shards.values_list("allotment", flat=True)),
+            [12, 12, 13, 13],
+        )
+        for _ in range(8):
+            self.assertTrue(
+                models.Stock.objects.record_sale(self.prod_version.id, 5)
+            )
+        self.assertFalse(
+            self.stock.shards.filter(reserved__gt=F("allotment")).exists()
+        )
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.current_amount, 10)
+        with self.assertRaises(NotEnoughProductLeft):
+            models.Stock.objects.record_sale(self.prod_version.id, 11)
+        self.assertTrue(
+            models.Stock.objects.record_sale(self.prod_version.id, 10)
+        )
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.current_amount, 0)
+        self.assertEqual(self.stock.current_items_sold, self.items_sold + 50)
+
+    def test_set_folds_shard_reservations(self):
+        self.checkout(4)
+        self.stock.set(100)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.current_amount, 100)
+        self.assertEqual(
+            sum(self.stock.shards.values_list("allotment", flat=True)), 100
+        )
+        with self.assertRaises(NotEnoughProductLeft):
+            self.stock.deduct(101)
+
+    def test_unsharded_sale_updates_stock_without_reading_it(self):
+        other = models.Stock.objects.exclude(id=self.stock.id).first()
+        other.set(10)
+        with CaptureQueriesContext(connection) as ctx:
+            models.Stock.objects.record_sale(other.p_version_id, 1)
+        # the stock row is updated without reading it first
+        sql = [
+            query["sql"]
+            for query in ctx.captured_queries
+            if "SAVEPOINT" not in query["sql"]
+        ]
+        self.assertTrue(sql[0].startswith('UPDATE "dbexample_stock"'))
+        self.assertFalse(any('"shard_count" FROM' in query for query in sql))
+
+    @override_settings(STOCK_LEDGER_DEFERRED=True)
+    def test_deferred_sale_of_sharded_stock_not_written_to_stock_row(self):
+        self.stock.refresh_from_db()
+        updated_at = self.stock.updated_at
+        models.Stock.objects.record_sale(self.prod_version.id, 3)
+        self.assertEqual(
+            models.StockShard.objects.totals(self.stock.id), (3, 3)
+        )
+        self.assertFalse(
+            models.StockMovement.objects.filter(compacted=False).exists()
+        )
+        self.stock.refresh_from_db()
+        self.assertEqual(
+            (self.stock.amount, self.stock.reserved, self.stock.updated_at),
+            (50, 0, updated_at),
+        )
+        self.assertEqual(self.stock.current_amount, 47)
+
+    def test_checkout_beyond_sharded_stock_raises_error(self):
+        self.checkout(50)
+        models.CartItem.objects.create(
+            cart=self.cart,
+            p_version=self.prod_version,
+            quantity=1,
+            **self.prod_version.to_dict(),
+        )
+        with self.assertRaises(NotEnoughProductLeft):
+            models.Order.objects.create_from_cart(self.customer.id)
+
+    def test_merge_command_collapses_shards(self):
+        self.checkout(4)
+        out = StringIO()
+        call_command("merge_stock_shards", stdout=out)
+        self.assertIn("1", out.getvalue())
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.amount, 46)
+        self.assertEqual(self.stock.items_sold, self.items_sold + 4)
+        self.assertEqual(self.stock.current_amount, 46)
+        self.assertFalse(self.stock.shards.exclude(items_sold=0).exists())
+
+    def test_disabling_shards_keeps_counters(self):
+        self.checkout(4)
+        call_command(
+            "merge_stock_shards",
+            str(self.prod_version.id),
+            "--disable",
+            stdout=StringIO(),
+        )
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.shard_count, 0)
+        self.assertFalse(self.stock.shards.exists())
+        self.assertEqual(self.stock.amount, 46)
+        self.checkout(1)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.amount, 45)
+
+
+class OrderHistoryTestCase(DataFactoryMixin, TestCase):
+    def setUp(self):
+        self.customer = self.customers[0]
+        models.Cart.objects.create(customer=self.customer)
+        prod_version = models.ProductVersion.objects.filter(
+            is_active=True, stock__isnull=False
+        ).first()
+        prod_version.stock.set(50)
+        self.orders = []
+        for _ in range(5):
+            models.CartItem.objects.create_from_product_version(
+                self.customer.id, prod_version.id, quantity=1
+            )
+            self.orders.append(
+                models.Order.objects.create_from_cart(self.customer.id)
+            )
+
+    def test_first_page_with_items_takes_two_queries(self):
+        with self.assertNumQueries(2):
+            page, cursor = models.Order.objects.history(
+                self.customer.id, limit=2
+            )
+            items = [list(order.items.all()) for order in page]
+        self.assertEqual(len(page), 2)
+        self.assertTrue(all(items))
+        self.assertEqual(cursor, (page[-1].created_at, page[-1].id))
+
+    def test_keyset_pages_cover_all_orders_newest_first(self):
+        seen, cursor = [], None
+        while True:
+            page, cursor = models.Order.objects.history(
+                self.customer.id, after=cursor, limit=2
+            )
+            seen.extend(order.id for order in page)
+            if cursor is None:
+                break
+        expected = list(
+            models.Order.objects.filter(customer=self.customer)
+            .order_by("-created_at", "-id")
+            .values_list("id", flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+    def test_summary_page_takes_one_query(self):
+        with self.assertNumQueries(1):
+            page, _ = models.Order.objects.history(
+                self.customer.id, summary=True
+            )
+            [(order.status, order.discounted_sum) for order in page]
+        self.assertEqual(len(page), 5)
+
+
+class SalesRollupTestCase(DataFactoryMixin, TestCase):
+    def setUp(self):
+        self.customer = self.customers[0]
+        models.Cart.objects.create(customer=self.customer)
+        self.prod_version = models.ProductVersion.objects.filter(
+            is_active=True, stock__isnull=False
+        ).first()
+        self.prod_version.stock.set(50)
+        self.orders = [self.checkout(quantity) for quantity in (2, 3)]
+
+    def checkout(self, quantity):
+        models.CartItem.objects.create_from_product_version(
+            self.customer.id, self.prod_version.id, quantity=quantity
+        )
+        return models.Order.objects.create_from_cart(self.customer.id)
+
+    def sales(self):
+        return models.DailySales.objects.get(p_version=self.prod_version)
+
+    def test_roll_up_adds_new_orders_once(self):
+        self.assertEqual(models.DailySales.objects.roll_up(), (2, 0))
+        self.assertEqual(models.DailySales.objects.roll_up(), (0, 0))
+        sales = self.sales()
+        items = models.OrderItem.objects.filter(order__in=self.orders)
+        self.assertEqual(sales.quantity, 5)
+        self.assertEqual(
+            sales.discounted_sum, sum(item.discounted_sum for item in items)
+        )
+        self.assertEqual(sales.brand_id, self.prod_version.product.brand_id)
+        self.assertEqual(
+            models.DailyCategorySales.objects.filter(quantity=5).count(),
+            self.prod_version.product.categories.count(),
+        )
+
+    def test_cancellation_applies_negative_delta(self):
+        models.DailySales.objects.roll_up()
+        self.orders[0].cancel("customer")
+        self.checkout(4).cancel("seller")
+        self.assertEqual(models.DailySales.objects.roll_up(), (1, 2))
+        self.assertEqual(self.sales().quantity, 3)
+
+    def test_rebuild_matches_incremental_rollup(self):
+        models.DailySales.objects.roll_up()
+        self.orders[1].cancel("customer")
+        models.DailySales.objects.roll_up()
+        expected = list(
+            models.DailySales.objects.values_list("date", *models.SALES_TOTALS)
+        )
+        models.DailySales.objects.update(quantity=0)
+        today = timezone.localdate().isoformat()
+        out = StringIO()
+        call_command("rebuild_sales_rollups", today, today, stdout=out)
+        self.assertIn("Rebuilt 1 daily sales", out.getvalue())
+        self.assertEqual(
+            list(
+                models.DailySales.objects.values_list(
+                    "date", *models.SALES_TOTALS
+                )
+            ),
+            expected,
+        )
+
+
+class OrderExportTestCase(DataFactoryMixin, TestCase):
+    def setUp(self):
+        self.customer = self.customers[0]
+        models.Cart.objects.create(customer=self.customer)
+        versions = models.ProductVersion.objects.filter(
+            is_active=True, stock__isnull=False
+        )[:2]
+        for prod_version in versions:
+            prod_version.stock.set(50)
+            models.CartItem.objects.create_from_product_version(
+                self.customer.id, prod_version.id, quantity=2
+            )
+        self.order = models.Order.objects.create_from_cart(self.customer.id)
+        self.empty_order = models.Order.objects.create(
+            customer=self.customer, initial_sum=0, discounted_sum=0
+        )
+
+    def export(self, fmt):
+        out, err = StringIO(), StringIO()
+        call_command(
+            "export_orders",
+            "--format",
+            fmt,
+            "--chunk-size",
+            "1",
+            stdout=out,
+            stderr=err,
+        )
+        self.assertIn("lines/s", err.getvalue())
+        return out.getvalue()
+
+    def test_csv_export_has_row_per_order_item(self):
+        rows = list(csv.reader(StringIO(self.export("csv"))))
+        self.assertEqual(rows[0], list(exports.CSV_HEADER))
+        self.assertEqual(len(rows), 1 + 2 + 1)
+        item = self.order.items.order_by("id").first()
+        self.assertIn(str(item.discounted_sum), rows[1])
+        self.assertEqual(rows[-1][0], str(self.empty_order.id))
+
+    def test_jsonl_export_nests_items_and_keeps_decimals(self):
+        lines = [
+            json.loads(line) for line in self.export("jsonl").splitlines()
+        ]
+        self.assertEqual(len(lines), 2)
+        order = lines[0]
+        self.assertEqual(order["id"], self.order.id)
+        self.assertEqual(len(order["items"]), 2)
+        self.assertEqual(
+            Decimal(order["discounted_sum"]), self.order.discounted_sum
+        )
+        self.assertEqual(lines[1]["items"], [])
+
+
+class CatalogImportTestCase(TestCase):
+    feed = [
+        {
+            "vendor": "Lenovo Group",
+            "brand": "Lenovo",
+            "p_type": "laptop",
+            "web_id": "feed_1",
+            "product": "ThinkPad X1",
+            "version": "16GB",
+            "regular_price": "1299.99",
+            "attrs": {"ram": 16},
+            "is_active": True,
+            "amount": 5,
+        },
+        {
+            "vendor": "Lenovo Group",
+            "brand": "Lenovo",
+            "p_type": "laptop",
+            "web_id": "feed_1",
+            "product": "ThinkPad X1",
+            "version": "32GB",
+            "regular_price": "1599.99",
+            "attrs": {"ram": 32},
+            "is_active": True,
+            "amount": 2,
+        },
+        {
+            "vendor": "Apple",
+            "brand": "Apple",
+            "p_type": "tablet",
+            "web_id": "feed_2",
+            "product": "iPad",
+            "version": "64GB",
+            "regular_price": "not a price",
+        },
+    ]
+
+    def import_feed(self, rows, fmt="jsonl"):
+        feed = StringIO()
+        if fmt == "jsonl":
+            feed.writelines(json.dumps(row) + "\n" for row in rows)
+        else:
+            writer = csv.DictWriter(feed, fieldnames=rows[0].keys())
+            writer.writeheader()
+            writer.writerows(
+                {**row, "attrs": json.dumps(row["attrs"])} for row in rows
+            )
+        feed.seek(0)
+        return imports.import_catalog(
+            imports.read_feed(feed, fmt), batch_size=2
+        )
+
+    def test_import_creates_catalog_chain(self):
+        stats = self.import_feed(self.feed)
+        self.assertEqual(
+            stats,
+            {"inserted": 2, "updated": 0, "skipped": 1, "stock_rejected": 0},
+        )
+        product = models.Product.objects.get(web_id="feed_1")
+        self.assertEqual(product.brand.vendor.name, "Lenovo Group")
+        self.assertEqual(product.slug, "thinkpad-x1")
+        version = product.versions.get(name="ThinkPad X1 32GB")
+        self.assertEqual(version.regular_price, Decimal("1599.99"))
+        self.assertEqual(version.stock.amount, 2)
+        self.assertEqual(len(version.sku), 20)
+        self.assertFalse(models.Product.objects.filter(web_id="feed_2"))
+
+    def test_reimport_updates_by_natural_key(self):
+        self.import_feed(self.feed)
+        feed = [{**row, "amount": 7} for row in self.feed[:2]]
+        feed[0]["regular_price"] = "999.00"
+        stats = self.import_feed(feed, fmt="csv")
+        self.assertEqual(
+            stats,
+            {"inserted": 0, "updated": 2, "skipped": 0, "stock_rejected": 0},
+        )
+        self.assertEqual(models.ProductVersion.objects.count(), 2)
+        version = models.ProductVersion.objects.get(name="ThinkPad X1 16GB")
+        self.assertEqual(version.regular_price, Decimal("999.00"))
+        self.assertEqual(version.stock.amount, 7)
+        self.assertEqual(
+            list(
+                version.stock_movements.values_list("amount_delta", flat=True)
+            ),
+            [5, 2],
+        )
+
+    def test_oversized_stock_amount_reported_as_rejected(self):
+        self.import_feed(self.feed[:1])
+        feed = [{**self.feed[0], "amount": models.MAX_AMOUNT_ADDED + 1}]
+        stats = self.import_feed(feed)
+        self.assertEqual(stats["updated"], 1)
+        self.assertEqual(stats["stock_rejected"], 1)
+        self.assertEqual(models.Stock.objects.get().amount, 5)
+
+    def test_product_active_if_any_version_in_feed_is(self):
+        other = {**self.feed[0], "web_id": "feed_3", "product": "ThinkPad T14"}
+        inactive = {**self.feed[1], "is_active": False}
+        self.import_feed([self.feed[0], other, inactive])
+        self.assertTrue(models.Product.objects.get(web_id="feed_1").is_active)
+
+    def test_skus_assigned_to_imported_versions_only(self):
+        self.import_feed(self.feed[:1])
+        models.ProductVersion.objects.update(sku="")
+        self.import_feed(self.feed[1:2])
+        self.assertEqual(
+            list(
+                models.ProductVersion.objects.filter(sku="").values_list(
+                    "name", flat=True
+                )
+            ),
+            ["ThinkPad X1 16GB"],
+        )
+
+    def test_reimport_after_pending_sale_sets_amount(self):
+        self.import_feed(self.feed[:1])
+        version = models.ProductVersion.objects.get()
+        with override_settings(STOCK_LEDGER_DEFERRED=True):
+            models.Stock.objects.record_sale(version.id, 3)
+        self.import_feed([{**self.feed[0], "amount": 7}])
+        models.StockMovement.objects.compact()
+        version.stock.refresh_from_db()
+        self.assertEqual(version.stock.amount, 7)
+
+    def test_import_command_reports_counts(self):
+        path = Path(tempfile.mkdtemp()) / "feed.jsonl"
+        path.write_text("".join(json.dumps(row) + "\n" for row in self.feed))
+        out = StringIO()
+        call_command("import_catalog", str(path), stdout=out)
+        self.assertIn("Inserted 2, updated 0, skipped 1", out.getvalue())
+        self.assertIn("rejected 0 stock amounts", out.getvalue())
+
+
+class OrderArchiveTestCase(DataFactoryMixin, TestCase):
+    def setUp(self):
+        self.customer = self.customers[0]
+        models.Cart.objects.create(customer=self.customer)
+        self.prod_version = models.ProductVersion.objects.filter(
+            is_active=True, stock__isnull=False
+        ).first()
+        self.prod_version.stock.set(50)
+        self.finished = self.checkout(2)
+        self.finished.status = "finished"
+        self.finished.save()
+        self.canceled = self.checkout(3)
+        self.canceled.cancel("customer")
+        self.pending = self.checkout(1)
+
+    def checkout(self, quantity):
+        models.CartItem.objects.create_from_product_version(
+            self.customer.id, self.prod_version.id, quantity=quantity
+        )
+        return models.Order.objects.create_from_cart(self.customer.id)
+
+    def test_archive_moves_terminal_orders_with_items(self):
+        out = StringIO()
+        call_command("archive_orders", "--days", "-1", stdout=out)
+        self.assertIn("Archived 2 orders and 2 order items", out.getvalue())
+        self.assertEqual(
+            list(models.Order.objects.values_list("id", flat=True)),
+            [self.pending.id],
+        )
+        archived = models.ArchivedOrder.objects.get(id=self.canceled.id)
+        self.assertEqual(archived.status, "canceled_by_customer")
+        self.assertEqual(archived.created_at, self.canceled.created_at)
+        item = archived.items.get()
+        self.assertTrue(item.is_canceled)
+        self.assertEqual(item.quantity, 3)
+        self.assertEqual(
+            models.DailySales.objects.get(p_version=self.prod_version).quantity,
+            3,
+        )
+
+    def test_archive_skips_recent_and_not_rolled_up_orders(self):
+        cutoff = timezone.now() + dt.timedelta(days=1)
+        self.assertEqual(models.ArchivedOrder.objects.archive(cutoff), (0, 0))
+        models.DailySales.objects.roll_up()
+        self.assertEqual(
+            models.ArchivedOrder.objects.archive(
+                timezone.now() - dt.timedelta(days=1)
+            ),
+            (0, 0),
+        )
+        self.assertEqual(
+            models.ArchivedOrder.objects.archive(cutoff, chunk_size=1), (2, 2)
+        )
+
+    def test_lookup_falls_back_to_archive(self):
+        models.DailySales.objects.roll_up()
+        models.ArchivedOrder.objects.archive(timezone.now())
+        self.assertIsInstance(
+            models.Order.objects.lookup(self.pending.id), models.Order
+        )
+        self.assertIsInstance(
+            models.Order.objects.lookup(self.finished.id),
+            models.ArchivedOrder,
+        )
+        with self.assertRaises(models.Order.DoesNotExist):
+            models.Order.objects.lookup(self.pending.id + 100)
+
+    def test_rebuild_keeps_sales_of_archived_orders(self):
+        models.DailySales.objects.roll_up()
+        models.ArchivedOrder.objects.archive(timezone.now())
+        today = timezone.localdate().isoformat()
+        call_command(
+            "rebuild_sales_rollups", today, today, stdout=StringIO()
+        )
+        sales = models.DailySales.objects.get(p_version=self.prod_version)
+        self.assertEqual(sales.quantity, 3)
+
+    def test_history_includes_archived_orders_on_request(self):
+        models.DailySales.objects.roll_up()
+        models.ArchivedOrder.objects.archive(timezone.now())
+        page, _ = models.Order.objects.history(self.customer.id)
+        self.assertEqual([order.id for order in page], [self.pending.id])
+        seen, cursor = [], None
+        while True:
+            page, cursor = models.Order.objects.history(
+                self.customer.id, after=cursor, limit=2, include_archived=True
+            )
+            seen.extend(order.id for order in page)
+            if cursor is None:
+                break
+        self.assertEqual(
+            seen, [self.pending.id, self.canceled.id, self.finished.id]
+        )
+
+
+class CartSweepTestCase(DataFactoryMixin, TestCase):
+    def setUp(self):
+        versions = models.ProductVersion.objects.filter(
+            is_active=True, stock__isnull=False
+        )[:2]
+        for prod_version in versions:
+            prod_version.stock.set(50)
+        self.carts = []
+        for customer in self.customers[:3]:
+            cart = models.Cart.objects.create(customer=customer)
+            for prod_version in versions:
+                models.CartItem.objects.create_from_product_version(
+                    customer.id, prod_version.id, quantity=1
+                )
+            self.carts.append(cart)
+        stale_ids = [cart.id for cart in self.carts[:2]]
+        models.Cart.objects.filter(id__in=stale_ids).update(
+            updated_at=timezone.now() - dt.timedelta(days=40)
+        )
+
+    def test_sweep_clears_only_stale_carts(self):
+        out = StringIO()
+        call_command("sweep_carts", "--batch-size", "1", stdout=out)
+        self.assertIn("Cleared 2 carts and 4 cart items", out.getvalue())
+        for cart in self.carts[:2]:
+            cart.refresh_from_db()
+            self.assertEqual(cart.status, models.Cart.CartStatus.EMPTY)
+            self.assertTrue(cart.is_empty)
+        self.assertEqual(self.carts[2].items.count(), 2)
+
+    def test_sweep_clears_stale_items_of_carts_in_any_status(self):
+        models.Cart.objects.filter(id=self.carts[0].id).update(
+            status=models.Cart.CartStatus.EMPTY
+        )
+        cleared, deleted = models.Cart.sweep_abandoned(dt.timedelta(days=30))
+        self.assertEqual((cleared, deleted), (2, 4))
+        self.assertTrue(self.carts[0].is_empty)
+        self.assertEqual(
+            models.Cart.sweep_abandoned(dt.timedelta(days=30)), (0, 0)
+        )
+
+    def test_sweep_takes_fixed_queries_per_batch(self):
+        with CaptureQueriesContext(connection) as ctx:
+            models.Cart.sweep_abandoned(dt.timedelta(days=30), batch_size=5)
+        # select batch, delete items, update carts, empty select
+        queries = [
+            query
+            for query in ctx.captured_queries
+            if "SAVEPOINT" not in query["sql"]
+        ]
+        self.assertEqual(len(queries), 4)
+
+
+@override_settings(
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"]
+)
+class CustomerProvisioningTestCase(TestCase):
+    def accounts(self, number, start=0):
+        return [
+            {
+                "username": f"b2b_user{i}",
+                "email": f"b2b_user{i}@tenant.py",
+                "password": f"secret{i}",
+                "phone_number": f"+7900{i:07}",
+            }
+            for i in range(start, start + number)
+        ]
+
+    def test_accounts_created_with_customers_and_carts(self):
+        stats = provisioning.provision_customers(
+            self.accounts(5), workers=2, chunk_size=2, activate=True
+        )
+        self.assertEqual(stats, {"created": 5, "conflicts": 0, "skipped": 0})
+        customer = models.Customer.objects.get(user__username="b2b_user3")
+        self.assertTrue(customer.user.check_password("secret3"))
+        self.assertTrue(customer.is_active)
+        self.assertEqual(customer.phone_number, "+79000000003")
+        self.assertEqual(customer.status, "activated")
+        self.assertEqual(customer.cart.status, models.Cart.CartStatus.EMPTY)
+
+    def test_connections_closed_before_workers_forked(self):
+        with mock.patch.object(
+            provisioning.connections, "close_all"
+        ) as close_all:
+            stats = provisioning.provision_customers(
+                self.accounts(2), workers=2
+            )
+        close_all.assert_called_once_with()
+        self.assertEqual(stats["created"], 2)
+
+    def test_conflicts_and_invalid_rows_skipped(self):
+        taken = models.User.objects.create_user(
+            username="taken", email="taken@tenant.py"
+        )
+        accounts = self.accounts(3)
+        accounts[0]["email"] = taken.email.upper()
+        accounts[1]["username"] = taken.username
+        accounts.append({**accounts[2], "username": "other"})
+        accounts.append({"username": "no_password", "email": "a@b.py"})
+        stats = provisioning.provision_customers(accounts, workers=1)
+        self.assertEqual(stats, {"created": 1, "conflicts": 3, "skipped": 1})
+        self.assertFalse(
+            models.Customer.objects.get(user__username="b2b_user2").is_active
+        )
+
+    def test_provision_command_reads_csv(self):
+        path = Path(tempfile.mkdtemp()) / "accounts.csv"
+        with path.open("w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=self.accounts(1)[0].keys())
+            writer.writeheader()
+            writer.writerows(self.accounts(3))
+        out = StringIO()
+        call_command(
+            "provision_customers", str(path), "--workers", "1", stdout=out
+        )
+        self.assertIn("Created 3 accounts, 0 conflicts", out.getvalue())
+
+
+class ProfileUpdateTestCase(TestCase):
+    def setUp(self):
+        self.customers = []
+        for i in range(3):
+            user = models.User.objects.create_user(
+                username=f"profile{i}", email=f"profile{i}@hello.py"
+            )
+            self.customers.append(models.Customer.objects.create(user=user))
+        self.customer = models.Customer.objects.get(id=self.customers[0].id)
+
+    def test_update_profile_runs_one_update(self):
+        with self.assertNumQueries(1):
+            self.customer.update_profile(
+                email="new@hello.py", first_name="Sam", last_name="Smith"
+            )
+        user = models.User.objects.get(id=self.customer.user_id)
+        self.assertEqual(
+            (user.email, user.first_name, user.last_name),
+            ("new@hello.py", "Sam", "Smith"),
+        )
+
+    def test_batch_context_flushes_on_exit_only(self):
+        with self.assertNumQueries(1):
+            with self.customer.batch_profile_updates():
+                self.customer.first_name = "Sam"
+                self.customer.last_name = "Smith"
+        with self.assertRaises(RuntimeError):
+            with self.customer.batch_profile_updates():
+                self.customer.first_name = "Bob"
+                raise RuntimeError
+        user = models.User.objects.get(id=self.customer.user_id)
+        self.assertEqual(user.first_name, "Sam")
+        with self.assertNumQueries(1):
+            self.customer.first_name = "Ann"
+
+    def test_unknown_profile_field_raises_error(self):
+        with self.assertRaises(ValueError):
+            self.customer.update_profile(password="x")
+
+    def test_bulk_update_groups_by_field_set(self):
+        changes = {
+            self.customers[0].id: {"first_name": "A"},
+            self.customers[1].id: {"first_name": "B"},
+            self.customers[2].id: {"first_name": "C", "last_name": "D"},
+        }
+        # role ids lookup, savepoint, one update per field set, release
+        with self.assertNumQueries(1 + 1 + 2 + 1):
+            updated = models.Customer.objects.bulk_update_profiles(changes)
+        self.assertEqual(updated, 3)
+        self.assertEqual(
+            list(
+                models.User.objects.filter(
+                    customer__in=self.customers
+                ).order_by("id").values_list("first_name", "last_name")
+            ),
+            [("A", ""), ("B", ""), ("C", "D")],
+        )
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "roles-tests",
+        }
+    }
+)
+class RoleResolutionTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = models.User.objects.create_user(
+            username="staff_sam", email="staff_sam@hello.py"
+        )
+        self.customer = models.Customer.objects.create(user=self.user)
+        self.group = Group.objects.create(name="editors")
+        self.group.permissions.add(
+            Permission.objects.get(codename="change_product")
+        )
+        self.user.groups.add(self.group)
+        self.session = SessionStore()
+
+    def test_roles_bundle_is_cached(self):
+        with self.assertNumQueries(3):
+            roles = get_roles(self.user.id, self.session)
+        self.assertTrue(roles.is_customer)
+        self.assertFalse(roles.is_moderator)
+        self.assertEqual(roles.groups, {"editors"})
+        self.assertTrue(roles.has_perm("dbexample.change_product"))
+        self.assertFalse(roles.has_perm("dbexample.delete_product"))
+        with self.assertNumQueries(0):
+            get_roles(self.user.id, self.session)
+            get_roles(self.user.id)
+
+    def test_role_changes_invalidate_cache(self):
+        get_roles(self.user.id, self.session)
+        models.Moderator.objects.create(user=self.user)
+        self.assertTrue(get_roles(self.user.id, self.session).is_moderator)
+        self.user.groups.remove(self.group)
+        roles = get_roles(self.user.id, self.session)
+        self.assertFalse(roles.has_perm("dbexample.change_product"))
+        self.user.groups.add(self.group)
+        get_roles(self.user.id, self.session)
+        self.group.permissions.clear()
+        roles = get_roles(self.user.id, self.session)
+        self.assertEqual(roles.permissions, frozenset())
+
+    def test_session_bundle_expires(self):
+        get_roles(self.user.id, self.session)
+        self.session[ROLES_SESSION_KEY]["expires_at"] = 0
+        cache.clear()
+        with self.assertNumQueries(3):
+            get_roles(self.user.id, self.session)
+
+
+class EstimatedCountTestCase(DataFactoryMixin, TestCase):
+    def test_unfiltered_count_read_from_statistics(self):
+        call_command(
+            "analyze_tables", "dbexample.ProductVersion", stdout=StringIO()
+        )
+        with CaptureQueriesContext(connection) as ctx:
+            count = models.ProductVersion.objects.estimated_count()
+        self.assertEqual(count, models.ProductVersion.objects.count())
+        self.assertFalse(
+            any("COUNT(" in query["sql"] for query in ctx.captured_queries)
+        )
+
+    def test_count_exact_without_statistics(self):
+        self.assertIsNone(paginators.table_rows_estimate(models.CartItem))
+        self.assertEqual(
+            models.CartItem.objects.estimated_count(),
+            models.CartItem.objects.count(),
+        )
+
+    def test_small_filtered_set_counted_exactly(self):
+        call_command("analyze_tables", stdout=StringIO())
+        active = models.ProductVersion.objects.filter(is_active=True)
+        self.assertEqual(active.estimated_count(), active.count())
+
+    def test_large_filtered_set_estimated_from_sample(self):
+        call_command("analyze_tables", stdout=StringIO())
+        active = models.ProductVersion.objects.filter(is_active=True)
+        estimate = paginators.estimated_count(
+            active, exact_threshold=1, sample_size=10
+        )
+        self.assertGreater(estimate, 1)
+        self.assertLessEqual(estimate, models.ProductVersion.objects.count())
+
+    def test_sample_spread_over_table(self):
+        call_command("analyze_tables", stdout=StringIO())
+        ids = list(
+            models.ProductVersion.objects.order_by("id").values_list(
+                "id", flat=True
+            )
+        )
+        # a filter matching only rows inserted last
+        newer = models.ProductVersion.objects.filter(id__gt=ids[len(ids) // 2])
+        estimate = paginators.estimated_count(
+            newer, exact_threshold=1, sample_size=len(ids) // 2
+        )
+        self.assertAlmostEqual(
+            estimate, newer.count(), delta=newer.count() * 0.3
+        )
+
+
+class BulkFactoryTestCase(DataFactoryMixin, TestCase):
+    def test_bulk_products_linked_to_categories(self):
+        products = factories.BulkProductFactory.create_bulk(
+            20, batch_size=8, categories=self.categories
+        )
+        self.assertEqual(len(products), 20)
+        self.assertTrue(all(product.slug for product in products))
+        self.assertFalse(
+            models.Product.objects.filter(
+                id__in=[product.id for product in products],
+                categories__isnull=True,
+            ).exists()
+        )
+        for counter in models.ProductCategoryCounter.objects.all():
+            self.assertEqual(
+                counter.active_products,
+                models.Product.objects.filter(
+                    categories=counter.category_id, is_active=True
+                ).count(),
+            )
+
+    def test_reset_all_reloads_attribute_names(self):
+        p_type = models.ProductType.objects.filter(
+            attributes__isnull=False
+        ).first()
+        factories.attribute_names_pool(self.products[0].pk)
+        product = factories.ProductFactory(p_type=p_type)
+        factories.IdPool.reset_all()
+        self.assertEqual(
+            set(factories.attribute_names_pool(product.pk)),
+            set(p_type.attributes.values_list("name", flat=True)),
+        )
+
+    def test_bulk_versions_take_constant_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            factories.BulkProductVersionFactory.create_bulk(
+                10, favorited_by=self.customers
+            )
+        few = len(ctx)
+        # up to 400 favorites still fit one insert on sqlite
+        with CaptureQueriesContext(connection) as ctx:
+            versions = factories.BulkProductVersionFactory.create_bulk(
+                40, favorited_by=self.customers
+            )
+        self.assertEqual(len(ctx), few)
+        version = models.ProductVersion.objects.get(id=versions[0].id)
+        self.assertTrue(version.sku)
+        self.assertTrue(version.stock)
+        self.assertEqual(
+            set(version.attrs),
+            set(
+                version.product.p_type.attributes.values_list(
+                    "name", flat=True
+                )
+            ),
+        )
+        self.assertEqual(
+            version.favorites_count, version.favorited_by.count()
+        )
+
+
+class MetricsTestCase(DataFactoryMixin, TestCase):
+    def setUp(self):
+        self.stock = models.Stock.objects.order_by("id").first()
+        self.stock.set(10)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram(
+            "test_seconds", "Test.", ("operation",), buckets=(0.1, 1)
+        )
+        child = histogram.labels("op")
+        for value in (0.05, 0.5, 5):
+            child.observe(value)
+        self.assertEqual(
+            histogram.render().splitlines()[2:],
+            [
+                'test_seconds_bucket{operation="op",le="0.1"} 1',
+                'test_seconds_bucket{operation="op",le="1"} 2',
+                'test_seconds_bucket{operation="op",le="+Inf"} 3',
+                'test_seconds_sum{operation="op"} 5.55',
+                'test_seconds_count{operation="op"} 3',
+            ],
+        )
+
+    def test_operation_outcomes_and_queries_recorded(self):
+        success = metrics.OPERATION_CALLS.labels("stock.deduct", "success")
+        error = metrics.OPERATION_CALLS.labels(
+            "stock.deduct", "NotEnoughProductLeft"
+        )
+        queries = metrics.OPERATION_QUERIES.labels("stock.deduct")
+        successes, errors = success.value, error.value
+        counts_before, _ = queries.snapshot()
+        with CaptureQueriesContext(connection) as ctx:
+            self.stock.deduct(1)
+        with self.assertRaises(NotEnoughProductLeft):
+            self.stock.deduct(100)
+        self.assertEqual(success.value, successes + 1)
+        self.assertEqual(error.value, errors + 1)
+        counts, _ = queries.snapshot()
+        added = [
+            after - before for before, after in zip(counts_before, counts)
+        ]
+        self.assertEqual(sum(added), 2)
+        self.assertGreaterEqual(
+            added[bisect.bisect_left(metrics.QUERY_BUCKETS, len(ctx))], 1
+        )
+
+    def test_command_prints_registry(self):
+        self.stock.deduct(1)
+        out = StringIO()
+        call_command("show_metrics", stdout=out)
+        self.assertIn(
+            "# TYPE dbexample_operation_calls_total counter", out.getvalue()
+        )
+        self.assertIn(
+            "dbexample_operation_duration_seconds_count"
+            '{operation="stock.deduct"}',
+            out.getvalue(),
+        )
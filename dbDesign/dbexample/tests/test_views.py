@@ -1,10 +1,22 @@
+import pstats
+import re
+import tempfile
+import threading
 from http import HTTPStatus
+from pathlib import Path
+from unittest import mock
 
+from asgiref.sync import iscoroutinefunction
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.contrib.auth.models import AnonymousUser
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from .. import models
+from .. import exports, metrics, middleware, models, views
+from .test_models import DataFactoryMixin
 
 User = get_user_model()
 
@@ -40,3 +52,351 @@ class ViewTestCase(TestCase):
             (valid_data["email"], user.email),
         )
         self.assertTrue(user.check_password(valid_data["password1"]))
+
+    def test_orders_export_streams_for_staff_only(self):
+        path = reverse("dbexample:orders_export", args=("jsonl",))
+        response = self.unauthorized_client.get(path)
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        staff = User.objects.create_user(
+            username="staff",
+            email="staff@hello.py",
+            is_staff=True,
+            is_active=True,
+        )
+        client = Client()
+        client.force_login(staff)
+        response = client.get(path)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        response = client.get(
+            reverse("dbexample:orders_export", args=("xml",))
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    async def test_async_registration_creates_customer_and_cart(self):
+        data = {
+            "username": "async_sam",
+            "email": "async_sam@hello.py",
+            "password1": "hello",
+            "password2": "hello",
+        }
+        response = await self.async_client.post(
+            reverse("dbexample:customer_registration_async"), data=data
+        )
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        customer = await models.Customer.objects.select_related(
+            "user", "cart"
+        ).aget(user__username="async_sam")
+        self.assertTrue(customer.user.check_password("hello"))
+        self.assertEqual(customer.cart.status, models.Cart.CartStatus.EMPTY)
+
+    async def test_async_registration_invalid_data_rejected(self):
+        response = await self.async_client.post(
+            reverse("dbexample:customer_registration_async"),
+            data={"username": "sam", "password1": "a", "password2": "b"},
+        )
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertFalse(await User.objects.filter(username="sam").aexists())
+
+    async def test_async_registration_busy_executor_returns_503(self):
+        data = {
+            "username": "late_sam",
+            "email": "late_sam@hello.py",
+            "password1": "hello",
+            "password2": "hello",
+        }
+        with mock.patch.object(
+            views, "_hashing_slots", threading.BoundedSemaphore(1)
+        ) as slots:
+            slots.acquire()
+            response = await self.async_client.post(
+                reverse("dbexample:customer_registration_async"), data=data
+            )
+        self.assertEqual(
+            response.status_code, HTTPStatus.SERVICE_UNAVAILABLE
+        )
+        self.assertEqual(response["Retry-After"], "1")
+
+
+class AdminTestCase(DataFactoryMixin, TestCase):
+    def setUp(self):
+        admin_user = User.objects.create_superuser(
+            username="admin",
+            email="admin@hello.py",
+            password="admin",
+            is_active=True,
+        )
+        self.client.force_login(admin_user)
+
+    def test_changelists_open_without_full_table_count(self):
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        # empty tables have no statistics and are counted exactly
+        for model in ("productversion", "stock"):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(
+                    reverse(f"admin:dbexample_{model}_changelist")
+                )
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            counts = [
+                query["sql"]
+                for query in ctx.captured_queries
+                if "COUNT(*)" in query["sql"] and model in query["sql"]
+            ]
+            self.assertEqual(counts, [], model)
+
+    def test_order_change_views_open(self):
+        customer = self.customers[0]
+        models.Cart.objects.create(customer=customer)
+        prod_version = models.ProductVersion.objects.filter(
+            is_active=True, stock__isnull=False
+        ).first()
+        prod_version.stock.set(10)
+        models.CartItem.objects.create_from_product_version(
+            customer.id, prod_version.id, quantity=1
+        )
+        order = models.Order.objects.create_from_cart(customer.id)
+        models.CartItem.objects.create_from_product_version(
+            customer.id, prod_version.id, quantity=1
+        )
+        cart_item = models.CartItem.objects.get()
+        for model, obj in (
+            ("order", order),
+            ("orderitem", order.items.get()),
+            ("cartitem", cart_item),
+        ):
+            response = self.client.get(
+                reverse(f"admin:dbexample_{model}_change", args=[obj.id])
+            )
+            self.assertEqual(response.status_code, HTTPStatus.OK, model)
+            self.assertContains(response, prod_version.name)
+
+    def test_deactivate_action_updates_versions_and_counters(self):
+        versions = models.ProductVersion.objects.filter(is_active=True)[:3]
+        ids = [version.id for version in versions]
+        response = self.client.post(
+            reverse("admin:dbexample_productversion_changelist"),
+            {"action": "deactivate", "_selected_action": ids},
+        )
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        self.assertFalse(
+            models.ProductVersion.objects.filter(
+                id__in=ids, is_active=True
+            ).exists()
+        )
+        for counter in models.ProductCategoryCounter.objects.all():
+            self.assertEqual(
+                counter.active_versions,
+                models.ProductVersion.objects.filter(
+                    product__categories=counter.category_id,
+                    product__is_active=True,
+                    is_active=True,
+                ).count(),
+            )
+
+    def test_restock_action_adds_amount(self):
+        stocks = list(models.Stock.objects.order_by("id")[:2])
+        response = self.client.post(
+            reverse("admin:dbexample_stock_changelist"),
+            {
+                "action": "restock",
+                "amount": 5,
+                "_selected_action": [stock.id for stock in stocks],
+            },
+        )
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        for stock in stocks:
+            amount = stock.amount
+            stock.refresh_from_db()
+            self.assertEqual(stock.amount, amount + 5)
+
+
+class ProfilerMiddlewareTestCase(TestCase):
+    def setUp(self):
+        self.profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.profile_dir.cleanup)
+        self.staff = User.objects.create_user(
+            username="staff",
+            email="staff@hello.py",
+            password="staff",
+            is_staff=True,
+            is_active=True,
+        )
+        self.url = reverse("dbexample:orders_export", args=["csv"])
+
+    def profiles(self):
+        return sorted(Path(self.profile_dir.name).iterdir())
+
+    def test_middleware_not_used_when_disabled(self):
+        with override_settings(PROFILER_DIR=""):
+            with mock.patch("cProfile.Profile") as profile:
+                self.client.force_login(self.staff)
+                self.client.get(self.url, {"profile": 1})
+        profile.assert_not_called()
+
+    def test_staff_request_profiled_on_demand(self):
+        self.client.force_login(self.staff)
+        with override_settings(PROFILER_DIR=self.profile_dir.name):
+            b"".join(self.client.get(self.url).streaming_content)
+            self.assertEqual(self.profiles(), [])
+            response = self.client.get(self.url, HTTP_X_PROFILE="1")
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        # streaming content is profiled until it is consumed
+        self.assertEqual(self.profiles(), [])
+        b"".join(response.streaming_content)
+        (profile,) = self.profiles()
+        self.assertRegex(
+            profile.name, r"_GET_orders_export_csv_\d+q_\d+ms\.prof$"
+        )
+        self.assertTrue(pstats.Stats(str(profile)).total_calls)
+
+    def test_customer_request_not_profiled_on_demand(self):
+        customer = User.objects.create_user(
+            username="buyer", email="buyer@hello.py", is_active=True
+        )
+        self.client.force_login(customer)
+        with override_settings(PROFILER_DIR=self.profile_dir.name):
+            self.client.get(self.url, {"profile": 1})
+        self.assertEqual(self.profiles(), [])
+
+    def test_requests_sampled(self):
+        with override_settings(
+            PROFILER_DIR=self.profile_dir.name, PROFILER_SAMPLE_RATE=1
+        ):
+            self.client.get(reverse("dbexample:metrics"))
+        self.assertEqual(len(self.profiles()), 1)
+
+    def test_connection_opened_while_profiling_keeps_query_counter(self):
+        request = RequestFactory().get("/")
+        directory = Path(self.profile_dir.name)
+        test_connection = connections[DEFAULT_DB_ALIAS]
+        wrappers = []
+
+        def profile_new_connection():
+            # a new thread opens its own test database connection
+            # inside the block
+            connections[DEFAULT_DB_ALIAS] = test_connection.__class__(
+                test_connection.settings_dict.copy(), DEFAULT_DB_ALIAS
+            )
+            try:
+                with middleware._profiled(request, directory):
+                    connections[DEFAULT_DB_ALIAS].ensure_connection()
+                wrappers.extend(
+                    connections[DEFAULT_DB_ALIAS].execute_wrappers
+                )
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=profile_new_connection)
+        thread.start()
+        thread.join()
+        self.assertEqual(wrappers, [metrics._count_query])
+
+    def test_streamed_export_queries_counted(self):
+        self.client.force_login(self.staff)
+        with override_settings(PROFILER_DIR=self.profile_dir.name):
+            response = self.client.get(self.url, {"profile": 1})
+            content = b"".join(response.streaming_content)
+        self.assertTrue(content)
+        (profile,) = self.profiles()
+        queries = int(re.search(r"_(\d+)q_", profile.name).group(1))
+        with CaptureQueriesContext(connection) as ctx:
+            list(exports.export_orders("csv"))
+        # the export queries run while the content is streamed
+        self.assertGreaterEqual(queries, len(ctx))
+
+
+class CustomerMiddlewareTestCase(DataFactoryMixin, TestCase):
+    def test_customer_loaded_on_first_access(self):
+        customer = self.customers[0]
+        request = RequestFactory().get("/")
+        request.user = customer.user
+        request.session = {}
+        with CaptureQueriesContext(connection) as ctx:
+            middleware.customer_middleware(lambda request: HttpResponse())(
+                request
+            )
+        self.assertEqual(len(ctx), 0)
+        with self.assertNumQueries(1):
+            self.assertEqual(request.customer.id, customer.id)
+
+    def test_anonymous_request_has_no_customer(self):
+        request = RequestFactory().get("/")
+        request.user = AnonymousUser()
+        with self.assertNumQueries(0):
+            middleware.customer_middleware(lambda request: HttpResponse())(
+                request
+            )
+        self.assertIsNone(request.customer)
+        self.assertIsNone(request.roles)
+
+
+class AsyncMiddlewareTestCase(TestCase):
+    def setUp(self):
+        self.profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.profile_dir.cleanup)
+
+    def test_async_chain_not_adapted_to_sync(self):
+        async def get_response(request):
+            pass
+
+        with override_settings(PROFILER_DIR=self.profile_dir.name):
+            for factory in (
+                middleware.customer_middleware,
+                middleware.profiler_middleware,
+            ):
+                self.assertTrue(
+                    iscoroutinefunction(factory(get_response)),
+                    factory.__name__,
+                )
+
+    async def test_async_view_served_through_async_middleware(self):
+        data = {
+            "username": "async_sam",
+            "email": "async_sam@hello.py",
+            "password1": "hello",
+            "password2": "hello",
+        }
+        with override_settings(
+            PROFILER_DIR=self.profile_dir.name, PROFILER_SAMPLE_RATE=1
+        ):
+            response = await self.async_client.post(
+                reverse("dbexample:customer_registration_async"), data=data
+            )
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertEqual(len(list(Path(self.profile_dir.name).iterdir())), 1)
+
+
+class MetricsViewTestCase(TestCase):
+    def setUp(self):
+        self.url = reverse("dbexample:metrics")
+
+    def test_anonymous_request_forbidden(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, HTTPStatus.FORBIDDEN)
+
+    def test_staff_gets_prometheus_text(self):
+        staff = User.objects.create_user(
+            username="staff",
+            email="staff@hello.py",
+            is_staff=True,
+            is_active=True,
+        )
+        self.client.force_login(staff)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response["Content-Type"], metrics.CONTENT_TYPE)
+        self.assertIn(
+            b"# TYPE dbexample_operation_duration_seconds histogram",
+            response.content,
+        )
+
+    @override_settings(METRICS_TOKEN="scrape")
+    def test_scraper_authorized_by_token(self):
+        response = self.client.get(
+            self.url, HTTP_AUTHORIZATION="Bearer scrape"
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        response = self.client.get(self.url, HTTP_AUTHORIZATION="Bearer wrong")
+        self.assertEqual(response.status_code, HTTPStatus.FORBIDDEN)
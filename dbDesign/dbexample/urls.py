@@ -11,4 +11,15 @@ urlpatterns = [
         views.customer_registration_view,
         name="customer_registration",
     ),
+    path(
+        "signup/async/",
+        views.customer_registration_async_view,
+        name="customer_registration_async",
+    ),
+    path(
+        "orders/export/<str:fmt>/",
+        views.orders_export_view,
+        name="orders_export",
+    ),
+    path("metrics/", views.metrics_view, name="metrics"),
 ]
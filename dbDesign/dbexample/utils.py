@@ -1,5 +1,7 @@
 from decimal import Decimal
 from functools import wraps
+from itertools import islice
+from typing import Iterable, Iterator, List
 
 
 def decimalize(fmt: str = ".2f") -> Decimal:
@@ -14,3 +16,10 @@ def decimalize(fmt: str = ".2f") -> Decimal:
         return decorated
 
     return decorator
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[List]:
+    """Split iterable into lists of `size` items (the last may be shorter)."""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
@@ -1,9 +1,37 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.http import Http404, JsonResponse
 from django.http.request import HttpRequest
-from django.http.response import HttpResponse
+from django.http.response import (
+    HttpResponse,
+    HttpResponseNotAllowed,
+    StreamingHttpResponse,
+)
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
 
 from . import forms, models
+from .exports import EXPORT_FORMATS, export_orders
+from .metrics import CONTENT_TYPE, REGISTRY
+
+# Password hashing of async registrations runs in its own small pool.
+# Requests beyond the pool and its queue are refused with 503.
+_hashing_executor = ThreadPoolExecutor(
+    max_workers=settings.REGISTRATION_HASHING_WORKERS,
+    thread_name_prefix="registration-hashing",
+)
+_hashing_slots = threading.BoundedSemaphore(
+    settings.REGISTRATION_HASHING_WORKERS
+    + settings.REGISTRATION_HASHING_QUEUE
+)
 
 
 @login_required
@@ -20,15 +48,77 @@ def foo(request: HttpRequest):
     return HttpResponse(request)
 
 
+def _create_customer(user: models.User) -> models.Customer:
+    """Save a new user with a customer and an empty cart
+    in one transaction."""
+    with transaction.atomic():
+        user.save()  # somehow handle user.is_active
+        customer = models.Customer.objects.create(user=user)
+        models.Cart.objects.create(customer=customer)  # create an empty cart
+    return customer
+
+
 def customer_registration_view(request):
     form = forms.UserRegistrationForm(request.POST or None)
     if form.is_valid():
         user = form.save(commit=False)
         user.set_password(form.cleaned_data["password1"])
-        user.save()  # somehow handle user.is_active
-        customer = models.Customer.objects.create(user=user)
-        models.Cart.objects.create(customer=customer)  # create an empty cart
+        _create_customer(user)
         # return redirect
 
         return HttpResponse(request, status=201)
     return render(request, "some.html", {"form": form})
+
+
+async def customer_registration_async_view(request: HttpRequest):
+    """Register a customer without blocking the event loop.
+    Password is hashed in a bounded executor, the inserts run
+    in one transaction in a thread."""
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+    form = forms.UserRegistrationForm(request.POST)
+    if not await sync_to_async(form.is_valid)():
+        return JsonResponse({"errors": form.errors}, status=400)
+    if not _hashing_slots.acquire(blocking=False):
+        response = HttpResponse(
+            "Too many registrations, retry later", status=503
+        )
+        response["Retry-After"] = "1"
+        return response
+    try:
+        password = await asyncio.get_running_loop().run_in_executor(
+            _hashing_executor, make_password, form.cleaned_data["password1"]
+        )
+    finally:
+        _hashing_slots.release()
+    user = form.save(commit=False)
+    user.password = password
+    await sync_to_async(_create_customer)(user)
+    return HttpResponse(status=201)
+
+
+@staff_member_required
+def orders_export_view(request: HttpRequest, fmt: str):
+    if fmt not in EXPORT_FORMATS:
+        raise Http404(f"Unknown export format: {fmt}")
+    _, content_type = EXPORT_FORMATS[fmt]
+    response = StreamingHttpResponse(
+        export_orders(fmt), content_type=content_type
+    )
+    response["Content-Disposition"] = f'attachment; filename="orders.{fmt}"'
+    return response
+
+
+def metrics_view(request: HttpRequest):
+    """Metrics of this process in Prometheus text format
+    for staff or scrapers with the `METRICS_TOKEN` bearer token."""
+    token = settings.METRICS_TOKEN
+    if not (
+        request.user.is_staff
+        or token
+        and constant_time_compare(
+            request.headers.get("Authorization", ""), f"Bearer {token}"
+        )
+    ):
+        return HttpResponse(status=403)
+    return HttpResponse(REGISTRY.render(), content_type=CONTENT_TYPE)